@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# MMath の実装(numpy / scalar)ごとに calc_global_pos と calc_bf の処理時間を比較する
+# 使い方: python benchmark_math.py --bone-config config/あにまさ式ミク準標準ボーン.csv --frames 300
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MATH_MODES = ["numpy", "scalar"]
+BONE_NAMES = ["センター", "グルーブ", "下半身", "上半身", "上半身2", "首", "頭", "左足", "左ひざ", "左足首", "右足", "右ひざ", "右足首"]
+# キーを打つ間隔(間のフレームは補間で求める)
+KEY_INTERVAL = 5
+
+
+def measure(args):
+    # 環境変数で選択した実装を読み込んだ後で import する
+    import numpy as np
+    from mmd.module.MMath import MATH_MODE, MQuaternion, MVector3D
+    from mmd.mmd.VmdData import VmdMotion, VmdBoneFrame
+    from mmd.utils.MServiceUtils import calc_global_pos
+    from mmd.motion import read_bone_csv
+
+    model = read_bone_csv(args.bone_config)
+    links = model.create_link_2_top_one("左足首", is_defined=False)
+
+    motion = VmdMotion()
+    rng = np.random.default_rng(0)
+    for fno in range(0, args.frames + 1, KEY_INTERVAL):
+        for bone_name in BONE_NAMES:
+            pitch, yaw, roll = rng.normal(0, 20, 3).tolist()
+            bf = VmdBoneFrame(fno)
+            bf.set_name(bone_name)
+            bf.rotation = MQuaternion.fromEulerAngles(pitch, yaw, roll)
+            if bone_name in ["センター", "グルーブ"]:
+                bf.position = MVector3D(*rng.normal(0, 2, 3).tolist())
+            motion.regist_bf(bf, bone_name, fno)
+
+    fnos = list(range(args.frames))
+
+    start = time.perf_counter()
+    for fno in fnos:
+        for bone_name in BONE_NAMES:
+            motion.calc_bf(bone_name, fno)
+    calc_bf_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    positions = []
+    for fno in fnos:
+        global_3ds = calc_global_pos(model, links, motion, fno)
+        positions.append(global_3ds["左足首"].data().tolist())
+    calc_global_pos_time = time.perf_counter() - start
+
+    return {"mode": MATH_MODE, "calc_bf": calc_bf_time, "calc_global_pos": calc_global_pos_time, "positions": positions}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bone-config', type=str, dest='bone_config', default="config/あにまさ式ミク準標準ボーン.csv", help='MMD Model Bone csv')
+    parser.add_argument('--frames', type=int, dest='frames', default="300", help='Number of frames to calculate')
+    parser.add_argument('--child', type=int, dest='child', default="0", help='Measure in this process (internal use)')
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args)))
+        sys.exit(0)
+
+    # 実装は import 時に決まるので、実装ごとに別プロセスで計測する
+    results = {}
+    for mode in MATH_MODES:
+        env = dict(os.environ, EXPOSE_MMD_MATH=mode)
+        output = subprocess.run([sys.executable, __file__, "--bone-config", args.bone_config, "--frames", str(args.frames), "--child", "1"], \
+                                env=env, stdout=subprocess.PIPE, check=True).stdout
+        results[mode] = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+    for target in ["calc_bf", "calc_global_pos"]:
+        base_time = results[MATH_MODES[0]][target]
+        for mode in MATH_MODES:
+            print("{0:<16} {1:<8} {2:8.3f}秒 (x{3:.2f})".format(target, mode, results[mode][target], base_time / results[mode][target]))
+
+    max_diff = max(abs(v1 - v2) for p1, p2 in zip(results["numpy"]["positions"], results["scalar"]["positions"]) for v1, v2 in zip(p1, p2))
+    print("左足首グローバル位置の最大差: {0}".format(max_diff))
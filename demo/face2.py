@@ -13,6 +13,7 @@ import matplotlib.pyplot as plt
 
 from mmd.utils.MLogger import MLogger
 from mmd.utils.MServiceUtils import sort_by_numeric
+from mmd.utils.MJointUtils import JointStore
 from lighttrack.visualizer.detection_visualizer import draw_bbox
 
 from mmd.mmd.VmdWriter import VmdWriter
@@ -49,7 +50,9 @@ def execute(args):
         for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes):    
             logger.info("【No.%s】モーション生成開始", f"{oidx:03}", decoration=MLogger.DECORATION_BOX)
 
-            smooth_json_pathes = sorted(glob.glob(os.path.join(ordered_person_dir_path, "smooth_*.json")), key=sort_by_numeric)
+            # 人物別のスムージング済み関節情報(JSONを出力していない場合もストアから読み込む)
+            smooth_store = JointStore(ordered_person_dir_path, json_pattern="smooth_*.json")
+            smooth_json_pathes = smooth_store.glob("smooth_*.json")
 
             model = PmxModel()
             model.name = "Output Demo"
@@ -61,9 +64,7 @@ def execute(args):
                     # キーフレの場所を確定（間が空く場合もある）
                     fno = int(m.groups()[0])
 
-                    frame_joints = {}
-                    with open(smooth_json_path, 'r', encoding='utf-8') as f:
-                        frame_joints = json.load(f)
+                    frame_joints = smooth_store.get(smooth_json_path)
                     
                     # for k, v in frame_joints["left_hand_pose"].items():
                     #     qq = MQuaternion.fromAxes(MVector3D(float(v["xAxis"]["x"]), float(v["xAxis"]["y"]), float(v["xAxis"]["z"])), \
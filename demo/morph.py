@@ -18,6 +18,7 @@ from miu.mmd.VmdData import VmdBoneFrame, VmdMotion, VmdShowIkFrame, VmdInfoIk,
 from miu.mmd.PmxData import PmxModel, Bone, Vertex
 from miu.utils.MServiceUtils import get_file_encoding, calc_global_pos, separate_local_qq
 from miu.utils.MLogger import MLogger
+from mmd.utils.MJointUtils import JointStore
 
 logger = MLogger(__name__, level=MLogger.DEBUG)
 
@@ -26,13 +27,12 @@ def execute(cmd_args):
 
     motion = VmdMotion()
     
-    # 動画上の関節位置
-    for fno, joints_path in enumerate(glob.glob(osp.join(folder_path, 'faces_*.json'))):
+    # 動画上の関節位置(JSONを出力していない場合もストアから読み込む)
+    joint_store = JointStore(folder_path, json_pattern="faces_*.json")
+    for fno, joints_path in enumerate(joint_store.glob("faces_*.json")):
         logger.info(f"■ fno: {fno} -----")
 
-        frame_joints = {}
-        with open(joints_path, 'r') as f:
-            frame_joints = json.load(f)
+        frame_joints = joint_store.get(joints_path)
 
         # まばたき
         calc_left_blink(fno, motion, frame_joints)
@@ -27,9 +27,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--video-file', type=str, dest='video_file', default='', help='Video file path')
     parser.add_argument('--parent-dir', type=str, dest='parent_dir', default='', help='Process parent dir path')
+    parser.add_argument('--prepare-png', type=int, dest='prepare_png', default="1", help='Whether to export prepared frames as png')
+    parser.add_argument('--prepare-workers', type=int, dest='prepare_workers', default="4", help='Number of workers for resizing and png export')
     parser.add_argument('--process', type=str, dest='process', default='', help='Process to be executed')
     parser.add_argument('--img-dir', type=str, dest='img_dir', default='', help='Prepared image directory')
     parser.add_argument('--audio-file', type=str, dest='audio_file', default='', help='Audio file path')
+    parser.add_argument('--expose-device', type=str, dest='expose_device', default="cuda", help='Device for ExPose inference (cuda/cpu)')
+    parser.add_argument('--expose-threads', type=int, dest='expose_threads', default="0", help='Number of threads for ExPose inference on cpu (0: all cores)')
+    parser.add_argument('--expose-quantize', type=int, dest='expose_quantize', default="0", help='Whether to quantize ExPose linear layers to int8 on cpu')
+    parser.add_argument('--expose-batch', type=int, dest='expose_batch', default="1", help='Number of persons per ExPose batch')
+    parser.add_argument('--rcnn-batch', type=int, dest='rcnn_batch', default="1", help='Number of frames per Keypoint R-CNN batch')
     parser.add_argument('--tracking-config', type=str, dest='tracking_config', default="config/tracking-config.yaml", help='Learning model for person tracking')
     parser.add_argument('--tracking-model', type=str, dest='tracking_model', default="lighttrack/weights/mobile-deconv/snapshot_296.ckpt", help='Learning model for person tracking')
     parser.add_argument('--face-model', type=str, dest='face_model', default="data/shape_predictor_68_face_landmarks.dat", help='Learning model for person face')
@@ -40,13 +47,22 @@ if __name__ == "__main__":
     parser.add_argument('--hand-motion', type=int, dest='hand_motion', default="0", help='Whether to generate hand motion')
     parser.add_argument('--face-motion', type=int, dest='face_motion', default="0", help='Whether to generate face motion')
     parser.add_argument('--center-scale', type=float, dest='center_scale', default="4", help='center scale')
-    parser.add_argument('--remove-key', type=float, dest='remove_key', default="1", help='remove key')
+    parser.add_argument('--remove-key', type=float, dest='remove_key', default="1", help='Remove keys that interpolation curves can reproduce within --key-rot-tolerance/--key-mov-tolerance (at most --key-budget keys per bone/morph). Enabled by default (lossy). 0: keep a key on every frame')
     parser.add_argument('--smooth-key', type=float, dest='smooth_key', default="1", help='smooth key')
+    parser.add_argument('--key-rot-tolerance', type=float, dest='key_rot_tolerance', default="0.5", help='Allowed rotation error (degree) when removing bone keys')
+    parser.add_argument('--key-mov-tolerance', type=float, dest='key_mov_tolerance', default="0.05", help='Allowed position error when removing bone keys')
+    parser.add_argument('--key-budget', type=int, dest='key_budget', default="0", help='Maximum number of keys per bone/morph when removing keys (0: no limit)')
+    parser.add_argument('--jobs', type=int, dest='jobs', default="1", help='Number of processes for per-person stages (root/face/smooth/motion)')
+    parser.add_argument('--frame-jobs', type=int, dest='frame_jobs', default="1", help='Number of processes for per-frame FK calculation in motion')
+    parser.add_argument('--math-mode', type=str, dest='math_mode', default="numpy", help='Implementation of vector/quaternion/matrix types (numpy/scalar)')
+    parser.add_argument('--export-json', type=int, dest='export_json', default="0", help='Whether to export joint json files in addition to the joint store (needed by tools that read the json files directly)')
     parser.add_argument('--verbose', type=int, dest='verbose', default=20, help='Log level')
     parser.add_argument("--log-mode", type=int, dest='log_mode', default=0, help='Log output mode')
 
     args = parser.parse_args()
     MLogger.initialize(level=args.verbose, mode=args.log_mode)
+    # 各処理の import 前に演算の実装を選択する(子プロセスにも引き継ぐ)
+    os.environ["EXPOSE_MMD_MATH"] = args.math_mode
     result = True
 
     start = time.time()
@@ -15,7 +15,7 @@
 # Contact: ps-license@tuebingen.mpg.de
 
 
-from .image_folder import ImageFolder, ImageFolderWithBoxes
+from .image_folder import ImageFolder, ImageFolderWithBoxes, VideoFolder, crop_with_box
 from .ehf import EHF
 from .curated_fittings import CuratedFittings
 from .threedpw import ThreeDPW
@@ -69,16 +69,54 @@ class ImageFolder(dutils.Dataset):
         }
 
 
+class VideoFolder(dutils.Dataset):
+    ''' フレーム対応表(mmd.utils.MVideoUtils.FrameManifest)から30fpsのフレームを読み込む
+        重複フレームのPNGや動画から直接読み込むため、フレームごとのPNGを必要としない
+        unique=True の場合、同じ元フレームを参照する重複フレームは最初の1枚のみとする
+    '''
+    def __init__(self,
+                 frame_source,
+                 transforms=None,
+                 unique=False,
+                 **kwargs):
+        super(VideoFolder, self).__init__()
+
+        self.transforms = transforms
+        self.frame_source = frame_source
+        if unique:
+            self.paths = np.stack([frame_source.frame_path(fno) for fno in frame_source.unique_fnos()])
+        else:
+            self.paths = np.stack(frame_source.frame_pathes())
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        img, idx_dir = self.frame_source.read_img(self.paths[index])
+
+        if self.transforms is not None:
+            img = self.transforms(img)
+
+        return {
+            'images': img,
+            'paths': self.paths[index],
+            'idx_dir': idx_dir
+        }
+
+
 class ImageFolderWithBoxes(dutils.Dataset):
     def __init__(self,
                  img_paths,
                  bboxes,
                  transforms=None,
                  scale_factor=1.2,
+                 frame_source=None,
                  **kwargs):
         super(ImageFolderWithBoxes, self).__init__()
 
         self.transforms = transforms
+        # 指定がある場合、フレーム対応表から読み込む
+        self.frame_source = frame_source
 
         self.paths = np.stack(img_paths)
         self.bboxes = np.stack(bboxes)
@@ -88,25 +126,32 @@ class ImageFolderWithBoxes(dutils.Dataset):
         return len(self.paths)
 
     def __getitem__(self, index):
-        img, idx_dir = read_img(self.paths[index])
+        if self.frame_source is not None:
+            img, idx_dir = self.frame_source.read_img(self.paths[index])
+        else:
+            img, idx_dir = read_img(self.paths[index])
 
-        bbox = self.bboxes[index]
+        return crop_with_box(img, idx_dir, self.paths[index], self.bboxes[index], index, self.scale_factor, self.transforms)
 
-        target = BoundingBox(bbox, size=img.shape)
 
-        center, scale, bbox_size = bbox_to_center_scale(
-            bbox, dset_scale_factor=self.scale_factor)
-        target.add_field('bbox_size', bbox_size)
-        target.add_field('orig_bbox_size', bbox_size)
-        target.add_field('orig_center', center)
-        target.add_field('center', center)
-        target.add_field('scale', scale)
+def crop_with_box(img, idx_dir, img_path, bbox, index, scale_factor=1.2, transforms=None):
+    ''' 読み込み済みの画像とbboxから、ExPose用の切り出し画像とターゲットを生成する
+    '''
+    target = BoundingBox(bbox, size=img.shape)
 
-        _, fname = osp.split(self.paths[index])
-        target.add_field('fname', f'{fname}_{index:03d}')
-        target.add_field('idx_dir', idx_dir)
+    center, scale, bbox_size = bbox_to_center_scale(
+        bbox, dset_scale_factor=scale_factor)
+    target.add_field('bbox_size', bbox_size)
+    target.add_field('orig_bbox_size', bbox_size)
+    target.add_field('orig_center', center)
+    target.add_field('center', center)
+    target.add_field('scale', scale)
 
-        if self.transforms is not None:
-            full_img, cropped_image, target = self.transforms(img, target)
+    _, fname = osp.split(img_path)
+    target.add_field('fname', f'{fname}_{index:03d}')
+    target.add_field('idx_dir', idx_dir)
+
+    if transforms is not None:
+        full_img, cropped_image, target = transforms(img, target)
 
-        return full_img, cropped_image, target, index
+    return full_img, cropped_image, target, index
@@ -198,6 +198,31 @@ class Pose_Matcher(SGCN_Processor):
             return True, distance # Match
 
 
+    def extract_features(self, data_list):
+        # embed all poses in a single forward pass (one feature row per pose)
+        self.model.eval()
+
+        with torch.no_grad():
+            data = torch.from_numpy(np.stack(data_list, axis=0))
+            data = data.float().to(self.dev)
+
+            features = self.model.extract_feature(data)
+
+        return features
+
+
+    def inference_batch(self, features_1, features_2):
+        # pairwise euclidian distance between every row of features_1 and features_2
+        with torch.no_grad():
+            diff = features_1.unsqueeze(1) - features_2.unsqueeze(0)
+            dist_sq = torch.sum(pow(diff, 2), 2)
+            dist = torch.sqrt(dist_sq)
+
+        margin = 0.2
+        distance = dist.data.cpu().numpy()
+        return distance < margin, distance
+
+
 def visualize_graph_matching(candidate_A, graph_A, candidate_B, graph_B):
     img_path_root = "/export/guanghan/Data_2018/posetrack_data/"
     img_path_A = os.path.join(img_path_root, candidate_A["img_path"])
@@ -287,5 +312,13 @@ def graph_pair_to_data(sample_graph_pair):
     return data_numpy_pair[0], data_numpy_pair[1]
 
 
+def pose_to_data(pose):
+    # same layout as one side of graph_pair_to_data
+    data_numpy = np.zeros((2, 1, 15, 1))
+    data_numpy[0, 0, :, 0] = [x[0] for x in pose]
+    data_numpy[1, 0, :, 0] = [x[1] for x in pose]
+    return data_numpy
+
+
 if __name__ == "__main__":
     test_visualization("posetrack_18", "val")
@@ -13,6 +13,8 @@ from tqdm import tqdm
 
 from mmd.utils.MLogger import MLogger
 from mmd.utils.MServiceUtils import sort_by_numeric
+from mmd.utils.MVideoUtils import get_frame_pathes, read_frame
+from mmd.utils.MJointUtils import JointStore
 
 from mmd.tracking import xywh_to_x1y1x2y2_from_dict, enlarge_bbox, x1y1x2y2_to_xywh
 from monoloco.monoloco.network.process import factory_for_gt
@@ -35,14 +37,17 @@ def execute(args):
 
         logger.info("人物深度推定開始", decoration=MLogger.DECORATION_LINE)
 
-        process_img_pathes = sorted(glob.glob(os.path.join(args.img_dir, "frames", "**", "frame_*.png")), key=sort_by_numeric)
+        process_img_pathes = get_frame_pathes(args.img_dir)
 
         os.makedirs(os.path.join(args.img_dir, "depths"), exist_ok=True)
 
+        # 姿勢推定結果
+        joint_store = JointStore(os.path.join(args.img_dir, "frames"), json_pattern=os.path.join("*", "frame_*.json"), export_json=args.export_json)
+
         for iidx, process_img_path in enumerate(tqdm(process_img_pathes)):
             # 人数分読み込む
             bbox_frames = {}
-            joint_json_pathes = sorted(glob.glob(os.path.join(args.img_dir, "frames", f"{iidx:012}", "frame_*.json")), key=sort_by_numeric)
+            joint_json_pathes = joint_store.glob(os.path.join(f"{iidx:012}", "frame_*.json"))
 
             if len(joint_json_pathes) == 0:
                 # 人物が一件も見つからなかった場合
@@ -54,10 +59,9 @@ def execute(args):
             keypoints = []
             # 一人以上人物が見つかった場合
             for joint_json_path in joint_json_pathes:
-                with open(joint_json_path, 'r') as f:
-                    bbox_frames[joint_json_path] = json.load(f)
-                    width = bbox_frames[joint_json_path]['image']['width']
-                    height = bbox_frames[joint_json_path]['image']['height']
+                bbox_frames[joint_json_path] = joint_store.get(joint_json_path)
+                width = bbox_frames[joint_json_path]['image']['width']
+                height = bbox_frames[joint_json_path]['image']['height']
 
                 # enlarge bbox by 20% with same center position
                 bbox_x1y1x2y2 = xywh_to_x1y1x2y2_from_dict(bbox_frames[joint_json_path]['bbox'])
@@ -115,9 +119,10 @@ def execute(args):
                         bbox_frames[joint_json_path]["depth"]["y"] = dic_out["xyz_pred"][oidx][1]
                         bbox_frames[joint_json_path]["depth"]["z"] = dic_out["xyz_pred"][oidx][2]
 
-                        # JSON出力
-                        with open(joint_json_path, "w") as f:
-                            json.dump(bbox_frames[joint_json_path], f, indent=4)
+                        joint_store.set(joint_json_path, bbox_frames[joint_json_path])
+
+        # 全フレーム分をまとめて保存
+        joint_store.save()
 
         logger.info('人物深度処理終了: {0}', args.img_dir, decoration=MLogger.DECORATION_BOX)
 
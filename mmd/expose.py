@@ -9,6 +9,7 @@ import os
 import os.path as osp
 from typing import List, Optional
 import functools
+import copy
 import glob
 import datetime
 
@@ -28,7 +29,7 @@ import torch.utils.data as dutils
 from torchvision.models.detection import keypointrcnn_resnet50_fpn
 from torchvision.transforms import Compose, Normalize, ToTensor
 
-from expose.data.datasets import ImageFolder, ImageFolderWithBoxes
+from expose.data.datasets import ImageFolder, VideoFolder, crop_with_box
 
 from expose.data.targets.image_list import to_image_list
 from expose.utils.checkpointer import Checkpointer
@@ -50,6 +51,8 @@ import numpy as np
 from tqdm import tqdm
 
 from mmd.utils.MLogger import MLogger
+from mmd.utils.MVideoUtils import get_frame_source
+from mmd.utils.MJointUtils import JointStore
 
 # 指数表記なし、有効小数点桁数6、30を超えると省略あり、一行の文字数200
 np.set_printoptions(suppress=True, precision=6, threshold=30, linewidth=200)
@@ -84,8 +87,8 @@ def execute(args):
         save_params = argv.save_params
         save_mesh = argv.save_mesh
         degrees = argv.degrees
-        expose_batch = argv.expose_batch
-        rcnn_batch = argv.rcnn_batch
+        expose_batch = max(1, args.expose_batch)
+        rcnn_batch = max(1, args.rcnn_batch)
 
         cfg.merge_from_file(argv.exp_cfg)
         cfg.merge_from_list(argv.exp_opts)
@@ -99,8 +102,11 @@ def execute(args):
 
         output_folder = os.path.join(args.img_dir, "pose")
 
+        # CPUの場合、演算スレッド数(未指定の場合はCPU数)
+        threads = args.expose_threads if args.expose_threads > 0 else os.cpu_count()
+
         result = False
-        with threadpool_limits(limits=1):
+        with threadpool_limits(limits=1 if args.expose_device == 'cuda' else threads):
             result = main(
                 args, 
                 cfg,
@@ -113,6 +119,9 @@ def execute(args):
                 save_params=save_params,
                 degrees=degrees,
                 rcnn_batch=rcnn_batch,
+                device_name=args.expose_device,
+                threads=threads,
+                quantize=args.expose_quantize,
             )
 
         logger.info('人物姿勢推定終了: {0}', args.img_dir, decoration=MLogger.DECORATION_BOX)
@@ -137,17 +146,34 @@ def main(
     save_params: bool = False,
     save_mesh: bool = False,
     degrees: Optional[List[float]] = [],
+    device_name: str = 'cuda',
+    threads: int = 1,
+    quantize: bool = False,
 ) -> bool:
 
-    device = torch.device('cuda')
-    if not torch.cuda.is_available():
-        logger.error('CUDAが無効になっています')
-        return False
+    if device_name == 'cuda':
+        device = torch.device('cuda')
+        if not torch.cuda.is_available():
+            logger.error('CUDAが無効になっています')
+            return False
+    else:
+        device = torch.device('cpu')
+        # 演算スレッド数を指定して並列化
+        torch.set_num_threads(threads)
+        logger.info("CPUで姿勢推定を行います（スレッド数: {0}, 量子化: {1}）", threads, bool(quantize), decoration=MLogger.DECORATION_LINE)
 
     process_img_pathes = os.path.join(args.img_dir, "frames", "**", "frame_*.png")
+
+    # フレームごとのPNGがない場合、フレーム対応表から読み込む
+    frame_source = None
+    if len(glob.glob(process_img_pathes)) == 0:
+        frame_source = get_frame_source(args.img_dir)
+        if not frame_source:
+            logger.error("処理対象のフレーム画像もフレーム対応表も見つかりません。: {0}", args.img_dir, decoration=MLogger.DECORATION_BOX)
+            return False
     
-    # 準備
-    expose_dloader = preprocess_images(process_img_pathes, exp_cfg, batch_size=rcnn_batch, device=device)
+    # 人物検出・切り出し(姿勢推定と並行してバッチ単位で行う)
+    expose_batches = preprocess_images(process_img_pathes, exp_cfg, batch_size=rcnn_batch, device=device, frame_source=frame_source)
 
     model = None
     try:
@@ -169,6 +195,14 @@ def main(
 
     model = model.eval()
 
+    if device.type == 'cpu':
+        # CPUではchannels_lastの方が畳み込みが速い
+        model = model.to(memory_format=torch.channels_last)
+
+        if quantize:
+            # 全結合層(回帰ヘッド等)を動的int8量子化
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
     means = np.array(exp_cfg.datasets.body.transforms.mean)
     std = np.array(exp_cfg.datasets.body.transforms.std)
 
@@ -177,10 +211,13 @@ def main(
     if render:
         hd_renderer = HDRenderer(img_size=body_crop_size)
 
-    logger.info("姿勢推定開始（人物×フレーム数分）", decoration=MLogger.DECORATION_LINE)
+    # 推定結果の出力先
+    joint_store = JointStore(osp.join(args.img_dir, "frames"), export_json=args.export_json, overwrite=True)
+
+    logger.info("人物検出・姿勢推定開始（フレーム数分）", decoration=MLogger.DECORATION_LINE)
 
     cnt = 0
-    for bidx, batch in enumerate(tqdm(expose_dloader, dynamic_ncols=True)):
+    for bidx, batch in enumerate(expose_batches):
 
         full_imgs_list, body_imgs, body_targets = batch
         if full_imgs_list is None:
@@ -188,6 +225,8 @@ def main(
 
         full_imgs = to_image_list(full_imgs_list)
         body_imgs = body_imgs.to(device=device)
+        if device.type == 'cpu':
+            body_imgs = body_imgs.contiguous(memory_format=torch.channels_last)
         body_targets = [target.to(device) for target in body_targets]
         full_imgs = full_imgs.to(device=device)
         camera_parameters = None
@@ -297,30 +336,42 @@ def main(
         camera_scale_np = camera_scale.cpu().numpy()
         camera_tansl_np = camera_transl.cpu().numpy()
 
-        # bbox保持
-        cbbox = body_targets[0].bbox.detach().cpu().numpy()
-        bbox_size = np.array(body_targets[0].size)
-        dset_center = np.array(body_targets[0].extra_fields['center'])
-        dset_size = np.array(body_targets[0].extra_fields['bbox_size'])
-        # 画面サイズに合わせる(描画のため、int)
-        bbox = np.tile(dset_center, 2) + ((cbbox / np.tile(bbox_size, 2) - np.tile(0.5, 4)) * np.tile(dset_size, 4))
-        img_bbox = bbox.astype(np.int)
-
-        hd_params['img_bbox'] = bbox
-        
-        proj_joints = stage_n_out['proj_joints'][0].detach().cpu().numpy()
+        # bbox保持(人物ごと)
+        cbboxes = np.stack([target.bbox.detach().cpu().numpy() for target in body_targets])
+        bbox_sizes = np.stack([np.tile(np.array(target.size), 2) for target in body_targets])
+        dset_centers = np.stack([np.array(target.extra_fields['center']) for target in body_targets])
+        dset_sizes = np.array([target.extra_fields['bbox_size'] for target in body_targets]).reshape(-1, 1)
+        # 画面サイズに合わせる
+        bboxes = np.tile(dset_centers, 2) + ((cbboxes / bbox_sizes - 0.5) * dset_sizes)
+
+        hd_params['img_bbox'] = bboxes
+
+        # 推定結果はバッチ分まとめてnumpyに変換する
+        stage_n_out_np = {}
+        for key, val in stage_n_out.items():
+            if torch.is_tensor(val):
+                val = val.detach().cpu().numpy()
+            stage_n_out_np[key] = val
+
+        # 投影関節をbboxのサイズに合わせて画面上の位置に変換(人物ごと)
+        proj_joints = stage_n_out_np['proj_joints']
         hd_params['proj_joints'] = proj_joints
+        diff_joints = np.max(proj_joints, axis=1) - np.min(proj_joints, axis=1)
+        diff_bboxes = bboxes[:, 2:] - bboxes[:, :2]
+        jscales = np.mean(diff_joints / diff_bboxes, axis=1)
+        img_proj_joints = hd_params['center'][:, np.newaxis, :] + (proj_joints / jscales[:, np.newaxis, np.newaxis])
 
         for idx in range(len(body_targets)):
             fname = body_targets[idx].get_field('fname')
             idx_dir = body_targets[idx].get_field('idx_dir')
 
-            params_json_path = osp.join(args.img_dir, "frames", idx_dir, f'{fname}_joints.json')
+            params_json_path = osp.join(idx_dir, f'{fname}_joints.json')
 
             out_params = dict(fname=fname)
-            for key, val in stage_n_out.items():
-                if torch.is_tensor(val):
-                    val = val.detach().cpu().numpy()[idx]
+            for key, val in stage_n_out_np.items():
+                if isinstance(val, np.ndarray) and val.ndim > 0 and val.shape[0] == len(body_targets):
+                    # 人物ごとの値のみ該当INDEXを取り出す(facesなどバッチ共通の値はそのまま)
+                    val = val[idx]
                 out_params[key] = val
 
             if save_vis:
@@ -329,29 +380,21 @@ def main(
                         osp.join(args.img_dir, "frames", idx_dir, f'{name}.png'))
 
             # json出力
+            bbox = hd_params["img_bbox"][idx]
             joint_dict = {}
             joint_dict["image"] = {"width": W, "height": H}
-            joint_dict["depth"] = {"depth": float(hd_params["depth"][0][0])}
-            joint_dict["camera"] = {"scale": float(camera_scale_np[0][0]), "transl": {"x": float(camera_tansl_np[0, 0]), "y": float(camera_tansl_np[0, 1])}}
-            joint_dict["bbox"] = {"x": float(hd_params["img_bbox"][0]), "y": float(hd_params["img_bbox"][1]), \
-                                  "width": float(hd_params["img_bbox"][2]) - float(hd_params["img_bbox"][0]), "height": float(hd_params["img_bbox"][3]) - float(hd_params["img_bbox"][1])}
-            joint_dict["others"] = {'shift_x': float(hd_params["shift_x"][0]), 'shift_y': float(hd_params["shift_y"][0]), \
-                                    'focal_length_in_mm': float(hd_params["focal_length_in_mm"][0]), 'focal_length_in_px': float(hd_params["focal_length_in_px"][0]), \
-                                    'sensor_width': float(hd_params["sensor_width"][0]), 'center': {"x": float(hd_params['center'][0, 0]), "y": float(hd_params['center'][0, 1])}}
+            joint_dict["depth"] = {"depth": float(hd_params["depth"][idx][0])}
+            joint_dict["camera"] = {"scale": float(camera_scale_np[idx][0]), "transl": {"x": float(camera_tansl_np[idx, 0]), "y": float(camera_tansl_np[idx, 1])}}
+            joint_dict["bbox"] = {"x": float(bbox[0]), "y": float(bbox[1]), "width": float(bbox[2]) - float(bbox[0]), "height": float(bbox[3]) - float(bbox[1])}
+            joint_dict["others"] = {'shift_x': float(hd_params["shift_x"][idx]), 'shift_y': float(hd_params["shift_y"][idx]), \
+                                    'focal_length_in_mm': float(hd_params["focal_length_in_mm"][idx]), 'focal_length_in_px': float(hd_params["focal_length_in_px"][idx]), \
+                                    'sensor_width': float(hd_params["sensor_width"][idx]), 'center': {"x": float(hd_params['center'][idx, 0]), "y": float(hd_params['center'][idx, 1])}}
             joint_dict["joints"] = {}
             joint_dict["proj_joints"] = {}
 
-            proj_joints = hd_params["proj_joints"]
             joints = out_params["joints"]
-            min_joints = np.min(proj_joints, axis=0)
-            max_joints = np.max(proj_joints, axis=0)
-            diff_joints = max_joints - min_joints
-            diff_bbox = np.array([hd_params['img_bbox'][2] - hd_params['img_bbox'][0], hd_params['img_bbox'][3] - hd_params['img_bbox'][1]])
-            jscale = diff_joints / diff_bbox
-            jscale = np.mean([jscale[0], jscale[1]])
             for jidx, jname in enumerate(KEYPOINT_NAMES):
-                j2d = proj_joints[jidx] / jscale
-                joint_dict["proj_joints"][jname] = {'x': float(hd_params['center'][0, 0] + j2d[0]), 'y': float(hd_params['center'][0, 1] + j2d[1])}
+                joint_dict["proj_joints"][jname] = {'x': float(img_proj_joints[idx, jidx, 0]), 'y': float(img_proj_joints[idx, jidx, 1])}
                 joint_dict["joints"][jname] = {'x': float(joints[jidx][0]), 'y': float(-joints[jidx][1]), 'z': float(joints[jidx][2])}
 
             # for pose_name in ["global_orient", "body_pose", "left_hand_pose", "right_hand_pose", "jaw_pose"]:
@@ -363,8 +406,20 @@ def main(
             #             'zAxis': {'x': float(pvalues[2,0]), 'y': float(pvalues[2,1]), 'z': float(pvalues[2,2])}
             #         }
 
-            with open(params_json_path, 'w') as f:
-                json.dump(joint_dict, f, indent=4)
+            joint_store.set(params_json_path, joint_dict)
+
+            if frame_source is not None:
+                # 同じ元フレームを参照する重複フレームには、推定結果をそのまま出力する
+                for same_fno in frame_source.same_source_fnos(int(idx_dir)):
+                    if same_fno == int(idx_dir):
+                        continue
+
+                    same_idx_dir = f"{same_fno:012}"
+                    same_params_json_path = osp.join(same_idx_dir, f'{fname.replace(idx_dir, same_idx_dir)}_joints.json')
+                    joint_store.set(same_params_json_path, copy.deepcopy(joint_dict))
+
+    # 全人物分をまとめて保存
+    joint_store.save()
 
     return True
 
@@ -386,8 +441,12 @@ def preprocess_images(
     num_workers: int = 8, batch_size: int = 1,
     min_score: float = 0.5,
     scale_factor: float = 1.2,
-    device: Optional[torch.device] = None
-) -> dutils.DataLoader:
+    device: Optional[torch.device] = None,
+    frame_source=None
+):
+    ''' 人物検出(Keypoint R-CNN)と切り出しを1パスで行い、ExPose用のバッチを順次返す
+        検出に使った画像をそのまま切り出すので、画像の読み直しは行わない
+    '''
 
     if device is None:
         device = torch.device('cuda')
@@ -404,62 +463,48 @@ def preprocess_images(
     )
 
     # Load the images
-    dataset = ImageFolder(image_folder, transforms=transform)
+    if frame_source is not None:
+        # フレーム対応表から読み込む(同じ元フレームの重複分は推定しない)
+        dataset = VideoFolder(frame_source, transforms=transform, unique=True)
+    else:
+        dataset = ImageFolder(image_folder, transforms=transform)
     rcnn_dloader = dutils.DataLoader(
         dataset, batch_size=batch_size, num_workers=num_workers,
         collate_fn=collate_fn
     )
 
-    logger.info("姿勢推定準備", decoration=MLogger.DECORATION_LINE)
+    dataset_cfg = exp_cfg.get('datasets', {})
+    body_dsets_cfg = dataset_cfg.get('body', {})
 
-    img_paths = []
-    bboxes = []
-    for bidx, batch in enumerate(tqdm(rcnn_dloader)):
+    body_transfs_cfg = body_dsets_cfg.get('transforms', {})
+    transforms = build_transforms(body_transfs_cfg, is_train=False)
+    expose_batch_size = body_dsets_cfg.get('batch_size', 64)
+
+    # ExPose用に切り出した人物(expose_batch_size人分溜まったら返す)
+    expose_items = []
+    # 検出人物の通し番号
+    detect_idx = 0
+    for bidx, batch in enumerate(tqdm(rcnn_dloader, dynamic_ncols=True)):
+        # 切り出し用に読み込み済みの画像(HWC)を保持する
+        imgs = [np.transpose(x.numpy(), [1, 2, 0]) for x in batch['images']]
         batch['images'] = [x.to(device=device) for x in batch['images']]
 
         output = rcnn_model(batch['images'])
         for ii, x in enumerate(output):
-            img = np.transpose(batch['images'][ii].detach().cpu().numpy(), [1, 2, 0])
-            img = (img * 255).astype(np.uint8)
-
             img_path = batch['paths'][ii]
-            _, fname = osp.split(img_path)
-            fname, _ = osp.splitext(fname)
+            idx_dir = batch['idx_dir'][ii]
 
-            #  out_path = osp.join(out_dir, f'{fname}_{ii:03d}.jpg')
-            for n, bbox in enumerate(output[ii]['boxes']):
-                bbox = bbox.detach().cpu().numpy()
-                if output[ii]['scores'][n].item() < min_score:
-                    continue
-                img_paths.append(img_path)
-                bboxes.append(bbox)
+            bboxes = x['boxes'][x['scores'] >= min_score].detach().cpu().numpy()
+            for bbox in bboxes:
+                expose_items.append(crop_with_box(imgs[ii], idx_dir, img_path, bbox, detect_idx, scale_factor, transforms))
+                detect_idx += 1
 
-                #  cv2.rectangle(img, tuple(bbox[:2]), tuple(bbox[2:]),
-                #  (255, 0, 0))
-            #  cv2.imwrite(out_path, img[:, :, ::-1])
+                if len(expose_items) >= expose_batch_size:
+                    yield collate_batch(expose_items, return_full_imgs=True, pin_memory=False)
+                    expose_items = []
 
-    dataset_cfg = exp_cfg.get('datasets', {})
-    body_dsets_cfg = dataset_cfg.get('body', {})
-
-    body_transfs_cfg = body_dsets_cfg.get('transforms', {})
-    transforms = build_transforms(body_transfs_cfg, is_train=False)
-    batch_size = body_dsets_cfg.get('batch_size', 64)
-
-    expose_dset = ImageFolderWithBoxes(
-        img_paths, bboxes, scale_factor=scale_factor, transforms=transforms)
-
-    expose_collate = functools.partial(
-        collate_batch, use_shared_memory=num_workers > 0,
-        return_full_imgs=True)
-    expose_dloader = dutils.DataLoader(
-        expose_dset,
-        batch_size=batch_size,
-        num_workers=num_workers,
-        collate_fn=expose_collate,
-        drop_last=False,
-        pin_memory=True,
-    )
-    return expose_dloader
+    if len(expose_items) > 0:
+        yield collate_batch(expose_items, return_full_imgs=True, pin_memory=False)
 
 
 def weak_persp_to_blender(
@@ -521,8 +566,6 @@ def get_parser():
     parser.add_argument('--exp-opts', default=[], dest='exp_opts', nargs='*', help='Extra command line arguments')
     parser.add_argument('--datasets', nargs='+', default=['openpose'], type=str, help='Datasets to process')
     parser.add_argument('--show', default=False, type=lambda arg: arg.lower() in ['true'], help='Display the results')
-    parser.add_argument('--expose-batch', dest='expose_batch', default=1, type=int, help='ExPose batch size')
-    parser.add_argument('--rcnn-batch', dest='rcnn_batch', default=1, type=int, help='R-CNN batch size')
     parser.add_argument('--pause', default=-1, type=float, help='How much to pause the display')
     parser.add_argument('--focal-length', dest='focal_length', type=float, default=5000, help='Focal length')
     parser.add_argument('--degrees', type=float, nargs='*', default=[], help='Degrees of rotation around the vertical axis')
@@ -11,7 +11,9 @@ import numpy as np
 from imutils import face_utils
 
 from mmd.utils.MLogger import MLogger
-from mmd.utils.MServiceUtils import sort_by_numeric
+from mmd.utils.MServiceUtils import sort_by_numeric, execute_by_person
+from mmd.utils.MVideoUtils import exists_frame, read_frame
+from mmd.utils.MJointUtils import JointStore
 
 logger = MLogger(__name__)
 
@@ -31,72 +33,8 @@ def execute(args):
         # 全人物分の順番別フォルダ
         ordered_person_dir_pathes = sorted(glob.glob(os.path.join(args.img_dir, "ordered", "*")), key=sort_by_numeric)
 
-        frame_pattern = re.compile(r'^(frame_(\d+)\.png)')
-
-        # 表情推定detector
-        detector = dlib.get_frontal_face_detector()
-
-        for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes):    
-            logger.info("【No.{0}】表情推定開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-
-            frame_json_pathes = sorted(glob.glob(os.path.join(ordered_person_dir_path, "frame_*.json")), key=sort_by_numeric)
-
-            for frame_json_path in tqdm(frame_json_pathes, desc=f"No.{oidx:03} ... "):                
-                m = frame_pattern.match(os.path.basename(frame_json_path))
-                if m:
-                    frame_image_name = str(m.groups()[0])
-                    fno_name = str(m.groups()[1])
-                    
-                    # 該当フレームの画像パス
-                    frame_image_path = os.path.join(args.img_dir, "frames", fno_name, frame_image_name)
-
-                    if os.path.exists(frame_image_path):
-
-                        frame_joints = {}
-                        with open(frame_json_path, 'r') as f:
-                            frame_joints = json.load(f)
-                        
-                        bbox_x = int(frame_joints["bbox"]["x"])
-                        bbox_y = int(frame_joints["bbox"]["y"])
-                        bbox_w = int(frame_joints["bbox"]["width"])
-                        bbox_h = int(frame_joints["bbox"]["height"])
-
-                        image = cv2.imread(frame_image_path)
-                        # bboxの範囲でトリミング
-                        image_trim = image[bbox_y:bbox_y+bbox_h, bbox_x:bbox_x+bbox_w]
-
-                        # 顔抽出
-                        faces, _, _ = detector.run(image=image_trim, upsample_num_times=0, adjust_threshold=0.0)
-
-                        if len(faces) > 0:
-                            face = faces[0]
-
-                            predictor = dlib.shape_predictor(args.face_model)
-
-                            frame_joints["faces"] = {}
-
-                            try:                                
-                                landmarks = predictor(image_trim, face)
-                                shape = face_utils.shape_to_np(landmarks)
-                                j = 0    
-                                for (x, y) in shape:
-                                    j += 1
-                                    frame_joints["faces"][j] = {"x": float(bbox_x+x), "y": float(bbox_y+y)}
-
-                                # 目の重心を求める
-                                left_cx, left_cy, left_eye_image = get_eye_point(image_trim, shape, True)
-                                right_cx, right_cy, right_eye_image = get_eye_point(image_trim, shape, False)
-                                frame_joints["eyes"] = {
-                                    "left": {"x": bbox_x+left_cx, "y": bbox_y+left_cy}, 
-                                    "right": {"x": bbox_x+right_cx, "y": bbox_y+right_cy}
-                                }
-                            except Exception as e:
-                                logger.debug("表情推定失敗: fno: {0}\n\n{1}", fno_name, traceback.extract_stack(), decoration=MLogger.DECORATION_BOX)
-                                
-                            # cv2.imwrite(os.path.join(args.img_dir, "frames", fno_name, "pupil.png"), right_eye_image)
-
-                            with open(frame_json_path, 'w') as f:
-                                json.dump(frame_joints, f, indent=4)
+        # 人物ごとに(並列で)表情推定
+        execute_by_person(args.jobs, estimate_face_person, [(args, oidx, ordered_person_dir_path) for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes)])
 
         logger.info('表情推定処理終了: {0}', os.path.join(args.img_dir, "ordered"), decoration=MLogger.DECORATION_BOX)
 
@@ -105,6 +43,78 @@ def execute(args):
         logger.critical("表情推定で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
         return False
 
+# 人物ごとの表情推定
+def estimate_face_person(args, oidx: int, ordered_person_dir_path: str):
+    frame_pattern = re.compile(r'^(frame_(\d+)\.png)')
+
+    # 表情推定detector(プロセスをまたいで渡せないので人物ごとに生成)
+    detector = dlib.get_frontal_face_detector()
+
+    logger.info("【No.{0}】表情推定開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+    # 人物別の関節情報
+    joint_store = JointStore(ordered_person_dir_path, json_pattern="frame_*.json", export_json=args.export_json)
+    frame_json_pathes = joint_store.glob("frame_*.json")
+
+    for frame_json_path in tqdm(frame_json_pathes, desc=f"No.{oidx:03} ... "):                
+        m = frame_pattern.match(os.path.basename(frame_json_path))
+        if m:
+            frame_image_name = str(m.groups()[0])
+            fno_name = str(m.groups()[1])
+
+            # 該当フレームの画像パス
+            frame_image_path = os.path.join(args.img_dir, "frames", fno_name, frame_image_name)
+
+            if exists_frame(frame_image_path):
+
+                frame_joints = joint_store.get(frame_json_path)
+
+                bbox_x = int(frame_joints["bbox"]["x"])
+                bbox_y = int(frame_joints["bbox"]["y"])
+                bbox_w = int(frame_joints["bbox"]["width"])
+                bbox_h = int(frame_joints["bbox"]["height"])
+
+                image = read_frame(frame_image_path)
+                # bboxの範囲でトリミング
+                image_trim = image[bbox_y:bbox_y+bbox_h, bbox_x:bbox_x+bbox_w]
+
+                # 顔抽出
+                faces, _, _ = detector.run(image=image_trim, upsample_num_times=0, adjust_threshold=0.0)
+
+                if len(faces) > 0:
+                    face = faces[0]
+
+                    predictor = dlib.shape_predictor(args.face_model)
+
+                    frame_joints["faces"] = {}
+
+                    try:                                
+                        landmarks = predictor(image_trim, face)
+                        shape = face_utils.shape_to_np(landmarks)
+                        j = 0    
+                        for (x, y) in shape:
+                            j += 1
+                            frame_joints["faces"][j] = {"x": float(bbox_x+x), "y": float(bbox_y+y)}
+
+                        # 目の重心を求める
+                        left_cx, left_cy, left_eye_image = get_eye_point(image_trim, shape, True)
+                        right_cx, right_cy, right_eye_image = get_eye_point(image_trim, shape, False)
+                        frame_joints["eyes"] = {
+                            "left": {"x": bbox_x+left_cx, "y": bbox_y+left_cy}, 
+                            "right": {"x": bbox_x+right_cx, "y": bbox_y+right_cy}
+                        }
+                    except Exception as e:
+                        logger.debug("表情推定失敗: fno: {0}\n\n{1}", fno_name, traceback.extract_stack(), decoration=MLogger.DECORATION_BOX)
+
+                    # cv2.imwrite(os.path.join(args.img_dir, "frames", fno_name, "pupil.png"), right_eye_image)
+
+                    joint_store.set(frame_json_path, frame_joints)
+
+    # 人物別にまとめて保存
+    joint_store.save()
+
+    return True
+
 # 瞳の重心を求める
 # https://cppx.hatenablog.com/entry/2017/12/25/231121#%E7%9E%B3%E5%BA%A7%E6%A8%99%E3%82%92%E5%8F%96%E5%BE%97
 def get_eye_point(img, parts, left=True):
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 #
 import math
+import bisect
+import operator
 import numpy as np
 import struct
 import _pickle as cPickle
@@ -12,6 +14,11 @@ from mmd.module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion
 
 logger = MLogger(__name__, level=1)
 
+# VMDのボーンキーフレ1件分のレコード(111byte)
+VMD_BONE_FRAME_DTYPE = np.dtype([('name', 'S15'), ('fno', '<u4'), ('position', '<f4', (3,)), ('rotation', '<f4', (4,)), ('interpolation', 'u1', (64,))])
+# VMDのモーフキーフレ1件分のレコード(23byte)
+VMD_MORPH_FRAME_DTYPE = np.dtype([('name', 'S15'), ('fno', '<u4'), ('ratio', '<f4')])
+
 # OneEuroFilter
 # オリジナル：https://www.cristal.univ-lille.fr/~casiez/1euro/
 # ----------------------------------------------------------------------------
@@ -102,6 +109,84 @@ class OneEuroFilter:
         self.__x.skip(x)
 
 
+# (フレーム数, チャンネル数) の配列をまとめてフィルタにかける
+# チャンネルごとに OneEuroFilter を作って1件ずつ呼び出した場合と同じ結果を返す
+# values: nan の要素はそのチャンネルでは呼び出さない(状態も変えない)
+# timestamps: 各フレームのタイムスタンプ(フレーム番号)
+# skips: True の要素は OneEuroFilter.skip と同じく状態だけ更新する(値はそのまま返す)
+def one_euro_filter(values: np.ndarray, timestamps, freq, mincutoff=1.0, beta=0.0, dcutoff=1.0, skips=None):
+    if freq <= 0:
+        raise ValueError("freq should be >0")
+    if mincutoff <= 0:
+        raise ValueError("mincutoff should be >0")
+    if dcutoff <= 0:
+        raise ValueError("dcutoff should be >0")
+
+    values = np.asarray(values, dtype=np.float64)
+    is_vector = values.ndim == 1
+    if is_vector:
+        values = values.reshape(-1, 1)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+
+    fcnt, ccnt = values.shape
+    results = np.full((fcnt, ccnt), np.nan, dtype=np.float64)
+    if fcnt == 0:
+        return results.reshape(-1) if is_vector else results
+
+    if skips is None:
+        skips = np.zeros((fcnt, ccnt), dtype=np.bool_)
+    else:
+        skips = np.broadcast_to(np.asarray(skips, dtype=np.bool_).reshape(fcnt, -1), (fcnt, ccnt))
+
+    # チャンネルごとの状態 (LowPassFilter の y, s と、サンプリング周波数・前回のタイムスタンプ)
+    freqs = np.full(ccnt, float(freq), dtype=np.float64)
+    lasttimes = np.full(ccnt, -1.0, dtype=np.float64)
+    x_ys = np.full(ccnt, -1.0, dtype=np.float64)
+    x_ss = np.full(ccnt, -1.0, dtype=np.float64)
+    dx_ys = np.full(ccnt, -1.0, dtype=np.float64)
+    dx_ss = np.full(ccnt, -1.0, dtype=np.float64)
+
+    def calc_alphas(cutoffs, freqs):
+        te = 1.0 / freqs
+        tau = 1.0 / (2 * math.pi * cutoffs)
+        return np.maximum(0.000001, np.minimum(1, 1.0 / (1.0 + tau / te)))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for fidx in range(fcnt):
+            xs = values[fidx]
+            timestamp = timestamps[fidx]
+            valids = ~np.isnan(xs)
+            skip_idxs = valids & skips[fidx]
+            call_idxs = valids & ~skips[fidx]
+
+            # ---- update the sampling frequency based on timestamps
+            is_freq = (lasttimes != 0) & (timestamp != 0)
+            freqs = np.where((call_idxs & is_freq) | (skip_idxs & is_freq & (lasttimes != timestamp)), 1.0 / (timestamp - lasttimes), freqs)
+            lasttimes = np.where(valids, timestamp, lasttimes)
+
+            # ---- estimate the current variation per second
+            prev_xs = x_ys
+            dxs = np.where(prev_xs < 0, 0.0, (xs - prev_xs) * freqs)
+            d_alphas = calc_alphas(dcutoff, freqs)
+            edxs = np.where(dx_ys < 0, dxs, d_alphas * dxs + (1.0 - d_alphas) * dx_ss)
+
+            # ---- use it to update the cutoff frequency
+            x_alphas = calc_alphas(mincutoff + beta * np.abs(edxs), freqs)
+            # まったく同じ値の場合、スキップ
+            ss = np.where((prev_xs == xs) | (x_ys < 0), xs, x_alphas * xs + (1.0 - x_alphas) * x_ss)
+
+            # スキップの場合、微分側には直前の値がそのまま入る
+            dx_ys = np.where(call_idxs, dxs, np.where(skip_idxs, prev_xs, dx_ys))
+            dx_ss = np.where(call_idxs, edxs, np.where(skip_idxs, prev_xs, dx_ss))
+            ss = np.where(skip_idxs, xs, ss)
+            x_ys = np.where(valids, xs, x_ys)
+            x_ss = np.where(valids, ss, x_ss)
+
+            results[fidx] = np.where(valids, ss, np.nan)
+
+    return results.reshape(-1) if is_vector else results
+
+
 class VmdBoneFrame:
 
     def __init__(self, fno=0):
@@ -113,12 +198,43 @@ class VmdBoneFrame:
         self.org_rotation = MQuaternion()
         self.interpolation = [20, 20, 0, 0, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107, 20, 20, 20, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107, 0, 20, 20, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107, 0, 0, 20, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107, 0, 0, 0] # noqa
         self.org_interpolation = [20, 20, 0, 0, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107, 20, 20, 20, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107, 0, 20, 20, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107, 0, 0, 20, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107, 0, 0, 0] # noqa
-        # 登録対象であるか否か
-        self.key = False
-        # VMD読み込み処理で読み込んだキーか
-        self.read = False
+        # 登録先のキーフレ辞書とフレーム番号(フラグ変更時にキーフレ索引を更新する)
+        self.__frames = None
+        self.__key = False
+        self.__read = False
         # 接触回避の方向
         self.avoidance = ""
+
+    # 登録対象であるか否か
+    @property
+    def key(self):
+        return self.__key
+
+    @key.setter
+    def key(self, key):
+        if self.__frames is not None and self.__key != key:
+            self.__frames[0].update_index(self.__frames[1], self, key=key)
+        self.__key = key
+
+    # VMD読み込み処理で読み込んだキーか
+    @property
+    def read(self):
+        return self.__read
+
+    @read.setter
+    def read(self, read):
+        if self.__frames is not None and self.__read != read:
+            self.__frames[0].update_index(self.__frames[1], self, read=read)
+        self.__read = read
+
+    def attach(self, frames, fno: int):
+        self.__frames = None if frames is None else (frames, fno)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # 登録先は持ち越さない(登録先側で付け直す)
+        state["_VmdBoneFrame__frames"] = None
+        return state
     
     def set_name(self, name):
         self.name = name
@@ -157,6 +273,391 @@ class VmdBoneFrame:
         fout.write(bytearray([int(min(127, max(0, x))) for x in self.interpolation]))
 
 
+# 1ボーン分のキーフレ辞書(key: フレーム番号)
+# フレーム番号の昇順索引(全キー/登録対象キー/読み込みキー)を保持し、前後のキーを二分探索で求める
+class VmdBoneFrames(dict):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        # 全キーのフレーム番号(昇順)
+        self.fnos = []
+        # 登録対象キーのフレーム番号(昇順)
+        self.key_fnos = []
+        # 読み込みキーのフレーム番号(昇順)
+        self.read_fnos = []
+        self.update(*args, **kwargs)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self.items()),))
+
+    def __setitem__(self, fno: int, bf: VmdBoneFrame):
+        if fno in self:
+            self.__remove_index(fno, dict.__getitem__(self, fno))
+        else:
+            bisect.insort(self.fnos, fno)
+
+        super().__setitem__(fno, bf)
+        bf.attach(self, fno)
+        if bf.key:
+            bisect.insort(self.key_fnos, fno)
+        if bf.read:
+            bisect.insort(self.read_fnos, fno)
+
+    def __delitem__(self, fno: int):
+        bf = dict.__getitem__(self, fno)
+        super().__delitem__(fno)
+        self.__remove_index(fno, bf)
+        remove_sorted(self.fnos, fno)
+
+    def pop(self, fno: int, *args):
+        if fno not in self:
+            return super().pop(fno, *args)
+        bf = dict.__getitem__(self, fno)
+        del self[fno]
+        return bf
+
+    def popitem(self):
+        fno = self.fnos[-1]
+        return fno, self.pop(fno)
+
+    def setdefault(self, fno: int, bf=None):
+        if fno not in self:
+            self[fno] = bf
+        return dict.__getitem__(self, fno)
+
+    def clear(self):
+        for bf in self.values():
+            bf.attach(None, -1)
+        super().clear()
+        self.fnos = []
+        self.key_fnos = []
+        self.read_fnos = []
+
+    def update(self, *args, **kwargs):
+        for fno, bf in dict(*args, **kwargs).items():
+            self[fno] = bf
+
+    def __remove_index(self, fno: int, bf: VmdBoneFrame):
+        bf.attach(None, -1)
+        if bf.key:
+            remove_sorted(self.key_fnos, fno)
+        if bf.read:
+            remove_sorted(self.read_fnos, fno)
+
+    # 登録済みキーフレのフラグ変更を索引に反映する
+    def update_index(self, fno: int, bf: VmdBoneFrame, key=None, read=None):
+        if dict.get(self, fno) is not bf:
+            return
+        if key is not None:
+            bisect.insort(self.key_fnos, fno) if key else remove_sorted(self.key_fnos, fno)
+        if read is not None:
+            bisect.insort(self.read_fnos, fno) if read else remove_sorted(self.read_fnos, fno)
+
+    # 条件に合致するフレーム番号の昇順リスト(参照用なので変更しないこと)
+    def get_fnos(self, is_key=False, is_read=False):
+        if is_key and is_read:
+            return [fno for fno in self.key_fnos if dict.__getitem__(self, fno).read]
+        if is_key:
+            return self.key_fnos
+        if is_read:
+            return self.read_fnos
+        return self.fnos
+
+    # 指定範囲内のフレーム番号の昇順リスト
+    def get_range_fnos(self, start_fno: int, end_fno: int, is_key=False, is_read=False):
+        fnos = self.get_fnos(is_key, is_read)
+        return fnos[bisect.bisect_left(fnos, start_fno):bisect.bisect_right(fnos, end_fno)]
+
+    # 指定フレーム番号より前のキーのフレーム番号(ない場合はNone)
+    def get_prev_fno(self, fno: int, is_key=False, is_read=False):
+        fnos = self.get_fnos(is_key, is_read)
+        idx = bisect.bisect_left(fnos, fno)
+        return fnos[idx - 1] if idx > 0 else None
+
+    # 指定フレーム番号より後のキーのフレーム番号(ない場合はNone)
+    def get_next_fno(self, fno: int, is_key=False, is_read=False):
+        fnos = self.get_fnos(is_key, is_read)
+        idx = bisect.bisect_right(fnos, fno)
+        return fnos[idx] if idx < len(fnos) else None
+
+
+# ボーン名: キーフレ辞書
+# VMD読み込み直後のボーンは列指向のトラックのまま保持し、参照された時にキーフレ辞書に展開する
+class VmdBoneTracks(dict):
+
+    def __reduce__(self):
+        return (self.__class__, (list(dict.items(self)),))
+
+    def __getitem__(self, bone_name: str):
+        frames = super().__getitem__(bone_name)
+        if isinstance(frames, VmdBoneTrack):
+            frames = frames.to_frames()
+            super().__setitem__(bone_name, frames)
+        return frames
+
+    def get(self, bone_name: str, default=None):
+        return self[bone_name] if bone_name in self else default
+
+    def values(self):
+        return [self[bone_name] for bone_name in list(self.keys())]
+
+    def items(self):
+        return [(bone_name, self[bone_name]) for bone_name in list(self.keys())]
+
+    def pop(self, bone_name: str, *args):
+        if bone_name not in self:
+            return super().pop(bone_name, *args)
+        frames = self[bone_name]
+        super().__delitem__(bone_name)
+        return frames
+
+    def copy(self):
+        return self.__class__(dict.items(self))
+
+    # 展開前のトラック(展開済みの場合はNone)
+    def get_track(self, bone_name: str):
+        frames = super().get(bone_name)
+        return frames if isinstance(frames, VmdBoneTrack) else None
+
+
+# 昇順リストから値を削除する
+def remove_sorted(fnos: list, fno: int):
+    idx = bisect.bisect_left(fnos, fno)
+    if idx < len(fnos) and fnos[idx] == fno:
+        del fnos[idx]
+
+
+# 1ボーン分のキーフレを列指向の配列で保持するトラック
+# VmdBoneFrames と同じ calc_bf/regist_bf/get_bone_fnos を持ち、トラック全体をまとめて数値計算する場合に使う
+class VmdBoneTrack:
+
+    def __init__(self, name='', size=0):
+        self.name = name
+        # VMD出力用の名前(15byte)
+        self.bname = b''
+        # フレーム番号(昇順)
+        self.fnos = np.zeros(size, dtype=np.int32)
+        # 位置(x, y, z)
+        self.positions = np.zeros((size, 3), dtype=np.float64)
+        # 回転(w, x, y, z)
+        self.rotations = np.tile(np.array([1, 0, 0, 0], dtype=np.float64), (size, 1))
+        self.org_rotations = self.rotations.copy()
+        # 補間曲線
+        self.interpolations = np.tile(np.array(VmdBoneFrame().interpolation, dtype=np.uint8), (size, 1))
+        # 登録対象キーか
+        self.keys = np.zeros(size, dtype=np.bool_)
+        # 読み込みキーか
+        self.reads = np.zeros(size, dtype=np.bool_)
+
+    def __len__(self):
+        return len(self.fnos)
+
+    # 保持している配列のバイト数
+    @property
+    def nbytes(self):
+        return self.fnos.nbytes + self.positions.nbytes + self.rotations.nbytes + self.org_rotations.nbytes \
+            + self.interpolations.nbytes + self.keys.nbytes + self.reads.nbytes
+
+    # キーフレ辞書からトラックを生成する
+    @classmethod
+    def from_frames(cls, name: str, frames: dict):
+        bfs = [frames[fno] for fno in sorted(frames.keys())]
+        track = cls(name, len(bfs))
+        if len(bfs) == 0:
+            return track
+
+        track.fnos[:] = [bf.fno for bf in bfs]
+        track.positions[:] = [bf.position.data() for bf in bfs]
+        track.rotations[:] = [bf.rotation.data().components for bf in bfs]
+        track.org_rotations[:] = [bf.org_rotation.data().components for bf in bfs]
+        track.interpolations[:] = np.clip([bf.interpolation for bf in bfs], 0, 255)
+        track.keys[:] = [bf.key for bf in bfs]
+        track.reads[:] = [bf.read for bf in bfs]
+
+        return track
+
+    # マスクのキーを削除する
+    def remove(self, mask: np.ndarray):
+        keeps = ~mask
+        self.fnos = self.fnos[keeps]
+        self.positions = self.positions[keeps]
+        self.rotations = self.rotations[keeps]
+        self.org_rotations = self.org_rotations[keeps]
+        self.interpolations = self.interpolations[keeps]
+        self.keys = self.keys[keeps]
+        self.reads = self.reads[keeps]
+
+    # トラックをキーフレ辞書に戻す
+    def to_frames(self):
+        if not self.bname and self.name:
+            # 名前の変換は一度だけ
+            self.bname = self.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:15].ljust(15, b'\x00')
+
+        frames = VmdBoneFrames()
+        for idx in range(len(self)):
+            frames[int(self.fnos[idx])] = self.get_bf(idx)
+        return frames
+
+    # INDEXのキーフレを生成する
+    def get_bf(self, idx: int):
+        bf = VmdBoneFrame(int(self.fnos[idx]))
+        if self.bname:
+            bf.name = self.name
+            bf.bname = self.bname
+        else:
+            bf.set_name(self.name)
+        bf.position = MVector3D(self.positions[idx])
+        bf.rotation = MQuaternion(self.rotations[idx])
+        bf.org_rotation = MQuaternion(self.org_rotations[idx])
+        bf.interpolation = self.interpolations[idx].tolist()
+        bf.key = bool(self.keys[idx])
+        bf.read = bool(self.reads[idx])
+        return bf
+
+    # 条件に合致するキーのマスク
+    def __get_mask(self, is_key=False, is_read=False):
+        mask = np.ones(len(self), dtype=np.bool_)
+        if is_key:
+            mask &= self.keys
+        if is_read:
+            mask &= self.reads
+        return mask
+
+    # フレーム番号リスト
+    def get_bone_fnos(self, is_key=False, is_read=False, start_fno=0, end_fno=9999999999):
+        mask = self.__get_mask(is_key, is_read) & (self.fnos >= start_fno) & (self.fnos <= end_fno)
+        return self.fnos[mask].tolist()
+
+    # 指定されたfnoの前後のキーを取得する(取れない場合はNone)
+    def get_prev_next_fno(self, fno: int, is_key=False, is_read=False):
+        fnos = self.fnos[self.__get_mask(is_key, is_read)]
+        idx = int(np.searchsorted(fnos, fno, side='left'))
+        prev_fno = int(fnos[idx - 1]) if idx > 0 else None
+        idx = int(np.searchsorted(fnos, fno, side='right'))
+        next_fno = int(fnos[idx]) if idx < len(fnos) else None
+        return prev_fno, next_fno
+
+    # 指定フレーム番号の値(補間曲線の分割は行わない)
+    def calc_bf(self, fno: int, is_key=False, is_read=False):
+        idx = int(np.searchsorted(self.fnos, fno))
+        if idx < len(self) and self.fnos[idx] == fno and (not is_key or self.keys[idx]) and (not is_read or self.reads[idx]):
+            # 合致するキーが見つかった場合、それを返す
+            return self.get_bf(idx)
+
+        if is_key or is_read:
+            # 既存キーのみ探している場合はNone
+            return None
+
+        fill_bf = VmdBoneFrame(fno)
+        fill_bf.set_name(self.name)
+
+        # 番号より前後のキーのINDEX
+        prev_idx = int(np.searchsorted(self.fnos, fno, side='left')) - 1
+        next_idx = int(np.searchsorted(self.fnos, fno, side='right'))
+
+        if prev_idx < 0 and next_idx >= len(self):
+            return fill_bf
+
+        if prev_idx < 0 or next_idx >= len(self):
+            # 前後どちらかしかない場合、ある方をコピーして返す
+            fill_bf = self.get_bf(prev_idx if prev_idx >= 0 else next_idx)
+            fill_bf.fno = fno
+            fill_bf.key = False
+            fill_bf.read = False
+            return fill_bf
+
+        prev_bf = self.get_bf(prev_idx)
+        next_bf = self.get_bf(next_idx)
+
+        # 補間曲線を元に間を埋める
+        fill_bf.rotation = calc_bf_rot(prev_bf, fill_bf, next_bf)
+        fill_bf.position = calc_bf_pos(prev_bf, fill_bf, next_bf)
+
+        return fill_bf
+
+    # 複数フレームの位置をまとめて補間する (フレーム数, 3)
+    def calc_positions(self, fnos):
+        fnos = np.asarray(fnos, dtype=np.int64)
+        positions = np.zeros((len(fnos), 3), dtype=np.float64)
+        if len(self) == 0:
+            return positions
+
+        # 前後のキーのINDEX(キーと同じフレームは前後とも自身)
+        prev_idxs = np.clip(np.searchsorted(self.fnos, fnos, side='right') - 1, 0, len(self) - 1)
+        next_idxs = np.clip(np.searchsorted(self.fnos, fnos, side='left'), 0, len(self) - 1)
+        # 前だけ・後だけの場合はある方をコピー
+        prev_idxs = np.where(self.fnos[prev_idxs] > fnos, next_idxs, prev_idxs)
+        next_idxs = np.where(self.fnos[next_idxs] < fnos, prev_idxs, next_idxs)
+
+        prev_positions = self.positions[prev_idxs]
+        next_positions = self.positions[next_idxs]
+        next_interpolations = self.interpolations[next_idxs].astype(np.float64)
+        prev_fnos = self.fnos[prev_idxs]
+        next_fnos = self.fnos[next_idxs]
+
+        # 位置が変わらない場合は前のまま
+        positions[:] = prev_positions
+        is_diff = np.any(prev_positions != next_positions, axis=1)
+
+        for axis, (x1_idxs, y1_idxs, x2_idxs, y2_idxs) in enumerate([(MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs), \
+                                                                     (MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs), \
+                                                                     (MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs)]):
+            _, ys, _ = MBezierUtils.evaluate_array(next_interpolations[:, x1_idxs[3]], next_interpolations[:, y1_idxs[3]], \
+                                                   next_interpolations[:, x2_idxs[3]], next_interpolations[:, y2_idxs[3]], prev_fnos, fnos, next_fnos)
+            positions[is_diff, axis] = (prev_positions[:, axis] + (next_positions[:, axis] - prev_positions[:, axis]) * ys)[is_diff]
+
+        return positions
+
+    # 複数フレームの回転(w, x, y, z)をまとめて補間する (フレーム数, 4)
+    def calc_rotations(self, fnos):
+        fnos = np.asarray(fnos, dtype=np.int64)
+        rotations = np.tile(np.array([1, 0, 0, 0], dtype=np.float64), (len(fnos), 1))
+        if len(self) == 0:
+            return rotations
+
+        # 前後のキーのINDEX(キーと同じフレームは前後とも自身)
+        prev_idxs = np.clip(np.searchsorted(self.fnos, fnos, side='right') - 1, 0, len(self) - 1)
+        next_idxs = np.clip(np.searchsorted(self.fnos, fnos, side='left'), 0, len(self) - 1)
+        # 前だけ・後だけの場合はある方をコピー
+        prev_idxs = np.where(self.fnos[prev_idxs] > fnos, next_idxs, prev_idxs)
+        next_idxs = np.where(self.fnos[next_idxs] < fnos, prev_idxs, next_idxs)
+
+        prev_rotations = self.rotations[prev_idxs]
+        next_rotations = self.rotations[next_idxs]
+        next_interpolations = self.interpolations[next_idxs].astype(np.float64)
+
+        # 回転が変わらない場合は前のまま
+        rotations[:] = prev_rotations
+        is_diff = np.any(prev_rotations != next_rotations, axis=1)
+
+        _, ys, _ = MBezierUtils.evaluate_array(next_interpolations[:, MBezierUtils.R_x1_idxs[3]], next_interpolations[:, MBezierUtils.R_y1_idxs[3]], \
+                                               next_interpolations[:, MBezierUtils.R_x2_idxs[3]], next_interpolations[:, MBezierUtils.R_y2_idxs[3]], \
+                                               self.fnos[prev_idxs], fnos, self.fnos[next_idxs])
+        rotations[is_diff] = slerp_array(prev_rotations, next_rotations, ys)[is_diff]
+
+        return rotations
+
+    # キーフレを登録(同じフレーム番号がある場合は上書き、補間曲線の分割は行わない)
+    def regist_bf(self, bf: VmdBoneFrame, fno: int, copy_interpolation=False, is_key=True):
+        idx = int(np.searchsorted(self.fnos, fno))
+        if idx >= len(self) or self.fnos[idx] != fno:
+            # 新規の場合、前後の補間曲線のまま挿入する
+            self.fnos = np.insert(self.fnos, idx, fno)
+            self.positions = np.insert(self.positions, idx, 0, axis=0)
+            self.rotations = np.insert(self.rotations, idx, [1, 0, 0, 0], axis=0)
+            self.org_rotations = np.insert(self.org_rotations, idx, [1, 0, 0, 0], axis=0)
+            self.interpolations = np.insert(self.interpolations, idx, VmdBoneFrame().interpolation, axis=0)
+            self.keys = np.insert(self.keys, idx, False)
+            self.reads = np.insert(self.reads, idx, False)
+
+        self.positions[idx] = bf.position.data()
+        self.rotations[idx] = bf.rotation.data().components
+        self.org_rotations[idx] = bf.org_rotation.data().components
+        if copy_interpolation:
+            self.interpolations[idx] = np.clip(bf.interpolation, 0, 255)
+        self.keys[idx] = is_key
+
+
 class VmdMorphFrame:
     def __init__(self, fno=0):
         self.name = ''
@@ -285,7 +786,7 @@ class VmdMotion:
         self.last_motion_frame = 0
         self.motion_cnt = 0
         # ボーン名：VmdBoneFrameの辞書(key:ボーン名)
-        self.bones = {}
+        self.bones = VmdBoneTracks()
         self.morph_cnt = 0
         # モーフ名：VmdMorphFrameの辞書(key:モーフ名)
         self.morphs = {}
@@ -303,7 +804,62 @@ class VmdMotion:
         self.showiks = []
         # ハッシュ値
         self.digest = None
-    
+        # グローバル位置のキャッシュ (fno, ボーン名): (親からのリンク, グローバル位置, 行列) (Noneの場合はキャッシュしない)
+        self.pose_cache = None
+        # キャッシュが依存しているボーン ボーン名: {fno: キャッシュのキーのset}
+        self.pose_cache_deps = {}
+
+    # グローバル位置のキャッシュを有効にする
+    # キャッシュ中は、登録済みのキーフレを直接書き換えず、regist_bf などで登録し直すこと
+    def enable_pose_cache(self):
+        self.pose_cache = {}
+        self.pose_cache_deps = {}
+
+    # キャッシュ済みのグローバル位置と行列(ない場合はNone)
+    # link_names: 一番親から対象ボーンまでのリンクのボーン名(リンクが異なる場合は使わない)
+    def get_pose_cache(self, fno: int, link_names: tuple):
+        cache = self.pose_cache.get((fno, link_names[-1]))
+        if cache is None or cache[0] != link_names:
+            return None
+        return cache[1], cache[2]
+
+    # グローバル位置をキャッシュに登録する
+    # dep_bone_names: 値が依存しているボーン(親ボーンや付与親)
+    def set_pose_cache(self, fno: int, link_names: tuple, dep_bone_names: list, global_3d: np.ndarray, total_mat: np.ndarray):
+        key = (fno, link_names[-1])
+        self.pose_cache[key] = (link_names, global_3d, total_mat)
+        for dep_bone_name in dep_bone_names:
+            self.pose_cache_deps.setdefault(dep_bone_name, {}).setdefault(fno, set()).add(key)
+
+    # 指定ボーンに依存するキャッシュのうち、範囲内(start_fno < fno < end_fno)のものを破棄する
+    def clear_pose_cache(self, bone_name: str, start_fno=-1, end_fno=None):
+        if self.pose_cache is None or bone_name not in self.pose_cache_deps:
+            return
+
+        fno_keys = self.pose_cache_deps[bone_name]
+        if end_fno is None or end_fno - start_fno > len(fno_keys):
+            target_fnos = [fno for fno in fno_keys.keys() if start_fno < fno and (end_fno is None or fno < end_fno)]
+        else:
+            target_fnos = [fno for fno in range(start_fno + 1, end_fno) if fno in fno_keys]
+
+        for fno in target_fnos:
+            for key in fno_keys.pop(fno):
+                self.pose_cache.pop(key, None)
+
+    # 指定範囲のキーを登録した場合に値が変わりうる範囲のキャッシュを破棄する
+    # 補間曲線の分割も含めて、前後の登録対象キーの間だけが変わる
+    def clear_pose_cache_by_regist(self, bone_name: str, start_fno: int, end_fno: int):
+        if self.pose_cache is None:
+            return
+
+        if bone_name not in self.bones:
+            self.clear_pose_cache(bone_name)
+            return
+
+        prev_fno = self.bones[bone_name].get_prev_fno(start_fno, is_key=True)
+        next_fno = self.bones[bone_name].get_next_fno(end_fno, is_key=True)
+        self.clear_pose_cache(bone_name, -1 if prev_fno is None else prev_fno, next_fno)
+
     def regist_full_bf(self, data_set_no: int, bone_name_list: list, offset=1, is_key=True):
         # 指定された全部のボーンのキーフレ取得
         fnos = self.get_bone_fnos(*bone_name_list)
@@ -442,18 +998,10 @@ class VmdMotion:
                          config={"freq": 30, "mincutoff": 0.3, "beta": 0.01, "dcutoff": 0.25}, start_fno=-1, end_fno=-1, is_show_log=True):
         prev_sep_fno = 0
 
-        for n in range(loop):
-            # 移動用フィルタ
-            pxfilter = OneEuroFilter(**config)
-            pyfilter = OneEuroFilter(**config)
-            pzfilter = OneEuroFilter(**config)
-
-            # 回転用フィルタ
-            rxfilter = OneEuroFilter(**config)
-            ryfilter = OneEuroFilter(**config)
-            rzfilter = OneEuroFilter(**config)
+        # 登録済みのキーフレを直接書き換えるので、キャッシュは破棄しておく
+        self.clear_pose_cache(bone_name)
 
-            fnos = self.get_bone_fnos(bone_name)
+        for n in range(loop):
             prev_sep_fno = 0
 
             # キーフレを取得する
@@ -464,27 +1012,26 @@ class VmdMotion:
                 # 範囲指定がある場合はその範囲内だけ
                 fnos = self.get_bone_fnos(bone_name, start_fno=start_fno, end_fno=end_fno)
 
-            # 全区間をフィルタにかける
-            for fno in fnos:
-                now_bf = self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
+            if len(fnos) == 0:
+                continue
 
+            now_bfs = [self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False) for fno in fnos]
+
+            # 全区間をXYZまとめてフィルタにかける
+            if is_mov:
+                positions = one_euro_filter([bf.position.data() for bf in now_bfs], fnos, **config).tolist()
+
+            if is_rot:
+                # 回転はオイラー角でフィルタにかける
+                eulers = one_euro_filter([bf.rotation.toEulerAngles().data() for bf in now_bfs], fnos, **config).tolist()
+
+            for fidx, (fno, now_bf) in enumerate(zip(fnos, now_bfs)):
                 if is_mov:
-                    # 移動XYZそれぞれにフィルターをかける
-                    px = pxfilter(now_bf.position.x(), fno)
-                    py = pyfilter(now_bf.position.y(), fno)
-                    pz = pzfilter(now_bf.position.z(), fno)
-                    now_bf.position = MVector3D(px, py, pz)
+                    now_bf.position = MVector3D(*positions[fidx])
                 
                 if is_rot:
-                    # 回転XYZそれぞれにフィルターをかける(オイラー角)
-                    r = now_bf.rotation.toEulerAngles()
-                    rx = rxfilter(r.x(), fno)
-                    ry = ryfilter(r.y(), fno)
-                    rz = rzfilter(r.z(), fno)
-
                     # クォータニオンに戻して保持
-                    new_qq = MQuaternion.fromEulerAngles(rx, ry, rz)
-                    now_bf.rotation = new_qq
+                    now_bf.rotation = MQuaternion.fromEulerAngles(*eulers[fidx])
 
                 if is_show_log and data_set_no > 0 and fno // 2000 > prev_sep_fno and fnos[-1] > 0:
                     logger.info("-- %sフレーム目:終了(%s％)【No.%s - フィルタリング - %s(%s)】", fno, round((fno / fnos[-1]) * 100, 3), data_set_no, bone_name, (n + 1))
@@ -492,6 +1039,8 @@ class VmdMotion:
 
     # 無効なキーを物理削除する
     def remove_unkey_bf(self, data_set_no: int, bone_name: str):
+        self.clear_pose_cache(bone_name)
+
         for fno in self.get_bone_fnos(bone_name):
             bf = self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
 
@@ -499,8 +1048,7 @@ class VmdMotion:
                 del self.bones[bone_name][fno]
 
     # 指定ボーンの不要キーを削除する
-    # 変曲点を求める
-    # https://teratail.com/questions/162391
+    # 範囲内を毎フレームの値に展開し、始点からなるべく先のキーまでを1つの補間曲線で表せる区間ごとに、終点のキーだけを残す
     def remove_unnecessary_bf(self, data_set_no: int, bone_name: str, is_rot: bool, is_mov: bool, \
                               offset=0, rot_diff_limit=0.1, mov_diff_limit=0.1, r_start_fno=-1, r_end_fno=-1, is_show_log=True, is_force=False):
         prev_sep_fno = 0
@@ -513,175 +1061,106 @@ class VmdMotion:
             # 範囲指定がある場合はその範囲内だけ
             fnos = self.get_bone_fnos(bone_name, start_fno=r_start_fno, end_fno=r_end_fno)
         logger.debug("remove_unnecessary_bf fnos: %s, %s", bone_name, fnos)
-        
+
         if len(fnos) <= 1:
             return
-        
-        bf = None
-        prev_bf = None
-
-        fno = fnos[0] + 1
-        start_fno = fnos[0]
-        last_fno = fnos[0]
-        rot_values = [0]
-        mx_values = [0]
-        my_values = [0]
-        mz_values = [0]
-        next_bf = None
-        is_inflection = False
-
-        # 不要キー削除処理
-        while fno < fnos[-1]:
-            is_inflection = False
-            inflection_fno = start_fno
-
-            bf = self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
-            logger.debug("*%s: f: %s, bf(%s):rot:%s", bone_name, fno, bf.fno, bf.rotation.toEulerAngles4MMD().to_log())
-
-            prev_bf = self.calc_bf(bone_name, start_fno, is_key=False, is_read=False, is_reset_interpolation=False)
-            logger.debug("*%s: f: %s, prev_bf(%s):rot:%s", bone_name, fno, prev_bf.fno, prev_bf.rotation.toEulerAngles4MMD().to_log())
-
-            next_bf = None
-
-            # 変化量を保持
-            rot_values.append(bf.rotation.calcTheata(prev_bf.rotation))
-            mx_values.append(bf.position.x() - prev_bf.position.x())
-            my_values.append(bf.position.y() - prev_bf.position.y())
-            mz_values.append(bf.position.z() - prev_bf.position.z())
-
-            if 2 >= len(rot_values):
-                # 必要な個数が溜まるまでスルー
-                fno += 1
-                continue
-            
-            if bf.key:
-                # 単調増加としてキーを結合してみる
-                (joined_rot_bzs, rot_inflection) = MBezierUtils.join_value_2_bezier(fno, bone_name, rot_values, \
-                                                                                    offset=offset, diff_limit=rot_diff_limit) if is_rot else (True, [])
-                (joined_mx_bzs, mx_inflection) = MBezierUtils.join_value_2_bezier(fno, bone_name, mx_values, \
-                                                                                  offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
-                (joined_my_bzs, my_inflection) = MBezierUtils.join_value_2_bezier(fno, bone_name, my_values, \
-                                                                                  offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
-                (joined_mz_bzs, mz_inflection) = MBezierUtils.join_value_2_bezier(fno, bone_name, mz_values, \
-                                                                                  offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
-
-                if joined_rot_bzs and joined_mx_bzs and joined_my_bzs and joined_mz_bzs and bf.rotation.toEulerAngles().distanceToPoint(prev_bf.rotation.toEulerAngles()) < 90:
-                    next_bf = self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
-
-                    # 結合できた場合、補間曲線をnextに設定
-                    if is_rot and len(joined_rot_bzs) > 0:
-                        logger.debug("☆%s: f: %s(%s), キー:回転補間曲線成功: 1: %s, 2: %s", bone_name, fno, start_fno, joined_rot_bzs[1].to_log(), joined_rot_bzs[2].to_log())
-                        self.reset_interpolation_parts(bone_name, next_bf, joined_rot_bzs, MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs)
-                    
-                    if is_mov and len(joined_mx_bzs) > 0 and len(joined_my_bzs) > 0 and len(joined_mz_bzs) > 0:
-                        logger.debug("☆%s: f: %s(%s), キー:移動X補間曲線成功: 1: %s, 2: %s", bone_name, fno, start_fno, joined_mx_bzs[1].to_log(), joined_mx_bzs[2].to_log())
-                        logger.debug("☆%s: f: %s(%s), キー:移動Y補間曲線成功: 1: %s, 2: %s", bone_name, fno, start_fno, joined_my_bzs[1].to_log(), joined_my_bzs[2].to_log())
-                        logger.debug("☆%s: f: %s(%s), キー:移動Z補間曲線成功: 1: %s, 2: %s", bone_name, fno, start_fno, joined_mz_bzs[1].to_log(), joined_mz_bzs[2].to_log())
-                        self.reset_interpolation_parts(bone_name, next_bf, joined_mx_bzs, MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs)
-                        self.reset_interpolation_parts(bone_name, next_bf, joined_my_bzs, MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs)
-                        self.reset_interpolation_parts(bone_name, next_bf, joined_mz_bzs, MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs)
-                    
-                    last_fno = fno
-
-                    # 次も結合テストするため、分離はしない
-                    is_inflection = False
-                else:
-                    # 結合できなかった場合、変曲点チェックに移る
-                    logger.debug("★%s: f: %s(%s), キー:補間曲線失敗: rot_inflection: %s, mx_inflection: %s, my_inflection: %s, mz_inflection: %s", \
-                                    bone_name, fno, start_fno, rot_inflection, mx_inflection, my_inflection, mz_inflection)
-                    
-                    # 前回の分離点で分離する                    
-                    is_inflection = True
-
-                    # # 変曲点があった場合、そこで区切る
-                    # indices = np.array([])
-                    # indices = np.append(indices, rot_inflection)
-                    # indices = np.append(indices, mx_inflection)
-                    # indices = np.append(indices, my_inflection)
-                    # indices = np.append(indices, mz_inflection)
-
-                    # if indices.size > 0:
-                    #     # 昇順に並べ替える
-                    #     indices.sort()
-                    #     logger.debug("indices: %s", indices)
-                    #     # 変曲点で区切る
-                    #     inflection = int(indices[0])
-
-                    #     if inflection <= 0:
-                    #         fno += 1
-                    #         continue
-
-                    #     inflection_fno = start_fno + inflection
-                    #     logger.debug("☆%s: 変曲点: %s, start_f: %s, f: %s, indices: %s", bone_name, inflection_fno, start_fno, fno, indices)
-
-                    #     # 結合したベジェ曲線
-                    #     (joined_rot_bzs, rot_inflection) = MBezierUtils.join_value_2_bezier(inflection_fno, bone_name, rot_values[:(inflection + 1)], \
-                    #                                                                         offset=offset, diff_limit=rot_diff_limit) if is_rot else (True, [])
-                    #     (joined_mx_bzs, mx_inflection) = MBezierUtils.join_value_2_bezier(inflection_fno, bone_name, mx_values[:(inflection + 1)], \
-                    #                                                                       offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
-                    #     (joined_my_bzs, my_inflection) = MBezierUtils.join_value_2_bezier(inflection_fno, bone_name, my_values[:(inflection + 1)], \
-                    #                                                                       offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
-                    #     (joined_mz_bzs, mz_inflection) = MBezierUtils.join_value_2_bezier(inflection_fno, bone_name, mz_values[:(inflection + 1)], \
-                    #                                                                       offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
-
-                    #     if joined_rot_bzs and joined_mx_bzs and joined_my_bzs and joined_mz_bzs:
-                    #         next_bf = self.calc_bf(bone_name, inflection_fno, is_key=False, is_read=False, is_reset_interpolation=False)
-
-                    #         # 結合できた場合、補間曲線をnextに設定
-                    #         if is_rot:
-                    #             logger.debug("☆%s: f: %s(%s), 変曲点:回転補間曲線成功: 1: %s, 2: %s", bone_name, inflection_fno, start_fno, joined_rot_bzs[1].to_log(), joined_rot_bzs[2].to_log())
-                    #             self.reset_interpolation_parts(bone_name, next_bf, joined_rot_bzs, MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs)
-                            
-                    #         if is_mov:
-                    #             logger.debug("☆%s: f: %s(%s), 変曲点:移動X補間曲線成功: 1: %s, 2: %s", bone_name, inflection_fno, start_fno, joined_mx_bzs[1].to_log(), joined_mx_bzs[2].to_log())
-                    #             logger.debug("☆%s: f: %s(%s), 変曲点:移動Y補間曲線成功: 1: %s, 2: %s", bone_name, inflection_fno, start_fno, joined_my_bzs[1].to_log(), joined_my_bzs[2].to_log())
-                    #             logger.debug("☆%s: f: %s(%s), 変曲点:移動Z補間曲線成功: 1: %s, 2: %s", bone_name, inflection_fno, start_fno, joined_mz_bzs[1].to_log(), joined_mz_bzs[2].to_log())
-                    #             self.reset_interpolation_parts(bone_name, next_bf, joined_mx_bzs, MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs)
-                    #             self.reset_interpolation_parts(bone_name, next_bf, joined_my_bzs, MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs)
-                    #             self.reset_interpolation_parts(bone_name, next_bf, joined_mz_bzs, MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs)
-                            
-                    #         # 最終結合キーを置き換える
-                    #         last_fno = inflection_fno
-                    #     else:
-                    #         # 結合できなかった場合、前回最終結合キーで分離する
-                    #         logger.debug("★%s: f: %s(%s), 変曲点:補間曲線失敗: rot_inflection: %s, mx_inflection: %s, my_inflection: %s, mz_inflection: %s", \
-                    #                     bone_name, inflection_fno, start_fno, rot_inflection, mx_inflection, my_inflection, mz_inflection)
-                    # else:
-                    #     # 変曲点がない場合（曲線が補間曲線に合わない場合）、前回最終結合キーで分離する
-                    #     logger.debug("変曲点が見つからなかった場合")
-
-                # 変曲点で登録
-                if next_bf:
-                    if bone_name in self.bones and last_fno in self.bones[bone_name]:
-                        self.bones[bone_name][last_fno].key = True
-                        self.bones[bone_name][last_fno].interpolation = next_bf.interpolation
-                        logger.debug("◇登録 %s: f: %s, next_bf(%s) rot:%s", bone_name, last_fno, next_bf.fno, next_bf.rotation.toEulerAngles4MMD().to_log())
-                    else:
-                        self.regist_bf(next_bf, bone_name, last_fno, copy_interpolation=True)
-                        logger.debug("☆登録 %s: f: %s, next_bf(%s) rot:%s", bone_name, last_fno, next_bf.fno, next_bf.rotation.toEulerAngles4MMD().to_log())
-                
-                for f in range(start_fno + 1, last_fno):
-                    # 結合できた場合、区間内を削除
-                    if f in self.bones[bone_name]:
-                        logger.debug("☆%s: f: %s, キーフレ削除: df: %s", bone_name, last_fno, f)
-                        self.bones[bone_name][f].key = False
-
-                if is_inflection:
-                    logger.debug("%s, 開始キーフレ変更前: start_fno: %s, fno: %s, last_fno: %s", bone_name, start_fno, fno, last_fno)
-
-                    # 開始キーフレは、変曲点までずらす
-                    fno = last_fno if start_fno != last_fno else last_fno + 1
-                    start_fno = fno
-                    last_fno = fno
-
-                    # 配列初期化
-                    rot_values = [0]
-                    mx_values = [0]
-                    my_values = [0]
-                    mz_values = [0]
-
-                    logger.debug("%s, 開始キーフレ変更後: start_fno: %s, fno: %s, last_fno: %s", bone_name, start_fno, fno, last_fno)
 
+        track = self.get_track(bone_name)
+
+        # 範囲内の毎フレームの値(INDEXは先頭からの相対フレーム)
+        dense_fnos = np.arange(fnos[0], fnos[-1] + 1)
+        rotations = track.calc_rotations(dense_fnos)
+        positions = track.calc_positions(dense_fnos)
+
+        # 区間の終点の候補になるキー(先頭以外、末尾は必ず残す)
+        key_fnos = [fno for fno in self.get_bone_fnos(bone_name, start_fno=fnos[0], end_fno=fnos[-1], is_key=True) if fno > fnos[0]]
+        if len(key_fnos) == 0 or key_fnos[-1] != fnos[-1]:
+            key_fnos.append(fnos[-1])
+        key_idxs = np.array(key_fnos, dtype=np.int64) - fnos[0]
+
+        # 回転が大きく変わる区間は結合しないよう、キーのオイラー角を先に求めておく
+        key_eulers = np.array([MQuaternion(rotations[idx]).toEulerAngles().data() for idx in key_idxs.tolist()], dtype=np.float64)
+        start_euler = MQuaternion(rotations[0]).toEulerAngles().data()
+
+        rot_limit = rot_diff_limit * (offset + 1)
+        mov_limit = mov_diff_limit * (offset + 1)
+
+        def fit_keys(start_idx: int, start_euler: np.ndarray, start_kidx: int, end_kidx: int):
+            # 始点から候補キー(start_kidx から end_kidx の手前まで)それぞれまでを、1つの補間曲線で表せるか
+            end_idxs = key_idxs[start_kidx:end_kidx]
+            results, bzs = fit_bf_segments(rotations[start_idx:start_idx + end_idxs[-1] + 1], positions[start_idx:start_idx + end_idxs[-1] + 1], \
+                                           end_idxs - start_idx, is_rot, is_mov, rot_limit, mov_limit)
+            results &= np.linalg.norm(key_eulers[start_kidx:end_kidx] - start_euler, axis=1) < 90
+            return results, bzs
+
+        def fit_key(start_idx: int, start_euler: np.ndarray, good_kidx: int, target_kidx: int):
+            # 始点から対象キーまでを1つの補間曲線で表せるか(結合済みキーより後ろに回転が大きく変わるキーがある場合は不可)
+            if np.any(np.linalg.norm(key_eulers[good_kidx + 1:target_kidx + 1] - start_euler, axis=1) >= 90):
+                return False, None
+            results, bzs = fit_keys(start_idx, start_euler, target_kidx, target_kidx + 1)
+            return bool(results[0]), bzs[0]
+
+        # 区間の終点INDEX: 結合した補間曲線(結合しなかった場合はNone)
+        joined_bzs = {}
+        start_idx = 0
+        kidx = 0
+        while kidx < len(key_idxs):
+            # 候補のキーがすべて結合できる間は、候補を増やして判定し直す(判定する配列の大きさには上限あり)
+            window = REDUCE_KEY_WINDOW
+            while True:
+                end_kidx = min(kidx + window, len(key_idxs))
+                results, bzs = fit_keys(start_idx, start_euler, kidx, end_kidx)
+
+                ng_idxs = np.flatnonzero(~results)
+                next_end_kidx = min(kidx + window * 2, len(key_idxs))
+                if len(ng_idxs) == 0 and end_kidx < len(key_idxs) and \
+                        (next_end_kidx - kidx) * (int(key_idxs[next_end_kidx - 1]) - start_idx + 1) <= REDUCE_KEY_MAX_CELLS:
+                    window *= 2
+                    continue
+                break
+
+            # 最初に結合できなかった候補の手前までを1区間にする
+            joined_cnt = int(ng_idxs[0]) if len(ng_idxs) > 0 else end_kidx - kidx
+            if joined_cnt == 0:
+                # 隣のキーとも結合できない場合、そのまま残す
+                end_kidx = kidx
+                joined_bzs[int(key_idxs[end_kidx])] = None
+            else:
+                end_kidx = kidx + joined_cnt - 1
+                end_bz = bzs[joined_cnt - 1]
+
+                if len(ng_idxs) == 0 and end_kidx + 1 < len(key_idxs):
+                    # 上限まで全て結合できた場合、以降の候補は間隔を倍にしながら1つずつ判定し、
+                    # 結合できなかった候補との間を二分探索する
+                    ng_kidx = len(key_idxs)
+                    step = joined_cnt
+                    while end_kidx + 1 < len(key_idxs):
+                        target_kidx = min(end_kidx + step, len(key_idxs) - 1)
+                        is_fit, bz = fit_key(start_idx, start_euler, end_kidx, target_kidx)
+                        if not is_fit:
+                            ng_kidx = target_kidx
+                            break
+                        end_kidx, end_bz = target_kidx, bz
+                        step *= 2
+
+                    while ng_kidx - end_kidx > 1:
+                        target_kidx = (end_kidx + ng_kidx) // 2
+                        is_fit, bz = fit_key(start_idx, start_euler, end_kidx, target_kidx)
+                        if is_fit:
+                            end_kidx, end_bz = target_kidx, bz
+                        else:
+                            ng_kidx = target_kidx
+
+                joined_cnt = end_kidx - kidx + 1
+                joined_bzs[int(key_idxs[end_kidx])] = end_bz
+
+            logger.debug("☆%s: f: %s - %s, 結合キー数: %s", bone_name, fnos[0] + start_idx, fnos[0] + key_idxs[end_kidx], joined_cnt)
+
+            start_idx = int(key_idxs[end_kidx])
+            start_euler = key_eulers[end_kidx]
+            kidx = end_kidx + 1
+
+            fno = fnos[0] + start_idx
             if fno // 300 > prev_sep_fno and fnos[-1] > 0 and is_show_log:
                 if data_set_no == 0:
                     logger.info("-- %sフレーム目:終了(%s％)【不要キー削除 - %s】", fno, round((fno / fnos[-1]) * 100, 3), bone_name)
@@ -690,47 +1169,88 @@ class VmdMotion:
 
                 prev_sep_fno = fno // 300
 
-            # 必ず進める
-            fno += 1
+        keep_fnos = [fnos[0]] + [fnos[0] + end_idx for end_idx in joined_bzs.keys()]
+        if r_start_fno < 0 and r_end_fno < 0 and np.allclose(rotations, rotations[0]) and np.allclose(positions, positions[0]):
+            # 最後まで変化がない場合、先頭以外を削除
+            keep_fnos = [fnos[0]]
+
+        parts_idxs = [(MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs), \
+                      (MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs), \
+                      (MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs), \
+                      (MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs)]
+        parts = ([0] if is_rot else []) + ([1, 2, 3] if is_mov else [])
+
+        prev_fno = fnos[0]
+        for end_idx, bz in joined_bzs.items():
+            end_fno = fnos[0] + end_idx
+            if end_fno not in keep_fnos:
+                continue
 
-            if r_start_fno < 0 and r_end_fno < 0:
-                # 範囲指定がない場合、全範囲
-                active_fnos = self.get_bone_fnos(bone_name, is_key=True)
-            else:
-                # 範囲指定がある場合はその範囲内だけ
-                active_fnos = self.get_bone_fnos(bone_name, start_fno=r_start_fno, end_fno=r_end_fno, is_key=True)
+            row = int(np.searchsorted(track.fnos, end_fno))
+            track.keys[row] = True
 
-            logger.debug("**☆有効キー(%s-%s) %s: %s", bone_name, start_fno, fno, active_fnos)
-        
-        logger.debug("len: %s, last: %s", len(rot_values), fnos[-1])
+            # 区間内に削除するキーがある場合のみ、補間曲線を結合したものに置き換える
+            if bz is not None and np.any((track.fnos > prev_fno) & (track.fnos < end_fno)):
+                for part in parts:
+                    for idxs, value in zip(parts_idxs[part], bz[part].tolist()):
+                        track.interpolations[row, idxs] = value
 
-        if len(rot_values) == fnos[-1]:
-            # 最後まで変化がない場合、1F目以降を削除
-            for f in range(1, fnos[-1] + 1):
-                if f in self.bones[bone_name]:
-                    del self.bones[bone_name][f]
+            prev_fno = end_fno
 
-        if r_start_fno < 0 and r_end_fno < 0:
-            # 範囲指定がない場合、全範囲
-            active_fnos = self.get_bone_fnos(bone_name, is_key=True)
+        # 範囲内で残さないキーは物理削除
+        track.remove((track.fnos >= fnos[0]) & (track.fnos <= fnos[-1]) & ~np.isin(track.fnos, keep_fnos))
+        self.set_track(bone_name, track)
 
-            for fno in range(fnos[-1]):
-                if fno in self.bones[bone_name] and fno not in active_fnos:
-                    # 最後に物理削除
-                    del self.bones[bone_name][fno]
-        else:
-            # 範囲指定がある場合はその範囲内だけ
-            active_fnos = self.get_bone_fnos(bone_name, start_fno=r_start_fno, end_fno=r_end_fno, is_key=True)
+        logger.debug("remove_unnecessary_bf after: %s, %s, all: %s", bone_name, keep_fnos, len(fnos))
 
-            for fno in range(r_start_fno, r_end_fno):
-                if fno in self.bones[bone_name] and fno not in active_fnos:
-                    # 最後に物理削除
-                    del self.bones[bone_name][fno]
-            
-        logger.debug("remove_unnecessary_bf after: %s, %s, all: %s", bone_name, active_fnos, len(fnos))
+    # 指定ボーンのキーを、許容誤差(またはキー数の上限)に収まるまで間引く
+    # 間引きは remove_unnecessary_bf で行い、残したキー間は結合した補間曲線で再現する
+    # 戻り値: (削減前キー数, 削減後キー数, 回転の最大誤差(度), 移動の最大誤差) (キー以外のフレームは数えない)
+    def compact_bf(self, bone_name: str, is_rot: bool, is_mov: bool, rot_tolerance=0.5, mov_tolerance=0.05, budget=0):
+        org_track = self.get_track(bone_name)
+
+        # 出力されるのはキーのみなので、キーだけで再現した値を基準にする
+        key_track = cPickle.loads(cPickle.dumps(org_track, -1))
+        key_track.remove(~key_track.keys)
+        if len(key_track) <= 2:
+            return len(key_track), len(key_track), 0, 0
+
+        # 前後にキー以外のフレームがある場合、最初と最後のキーの間だけを間引く
+        if key_track.fnos[0] == org_track.fnos[0] and key_track.fnos[-1] == org_track.fnos[-1]:
+            start_fno = end_fno = -1
+        else:
+            start_fno = int(key_track.fnos[0])
+            end_fno = int(key_track.fnos[-1])
+
+        # 回転の許容誤差(度)を、不要キー削除の判定値(1 - 内積)に換算する
+        rot_diff_limit = 1 - math.cos(math.radians(rot_tolerance) / 2)
+
+        def reduce(scale: float):
+            # 間引く前のキーに戻してから、許容誤差を倍率分広げて間引く
+            self.set_track(bone_name, org_track)
+            self.remove_unnecessary_bf(0, bone_name, is_rot, is_mov, offset=scale - 1, rot_diff_limit=rot_diff_limit, \
+                                       mov_diff_limit=mov_tolerance, r_start_fno=start_fno, r_end_fno=end_fno, is_show_log=False)
+            return len(self.get_bone_fnos(bone_name, is_key=True))
+
+        reduce_keys_by_budget(reduce, budget)
+
+        # 実際に達成した誤差
+        track = self.get_track(bone_name)
+        track.remove(~track.keys)
+        dense_fnos = np.arange(key_track.fnos[0], key_track.fnos[-1] + 1)
+        org_rotations = key_track.calc_rotations(dense_fnos)
+        rotations = track.calc_rotations(dense_fnos)
+        rot_dots = np.abs(np.sum(org_rotations * rotations, axis=1)) \
+            / np.maximum(np.linalg.norm(org_rotations, axis=1) * np.linalg.norm(rotations, axis=1), 1e-12)
+        rot_err = float(np.max(np.degrees(2 * np.arccos(np.clip(rot_dots, 0, 1))))) if is_rot else 0
+        mov_err = float(np.max(np.abs(key_track.calc_positions(dense_fnos) - track.calc_positions(dense_fnos)))) if is_mov else 0
+
+        return len(key_track), len(track), rot_err, mov_err
 
     # 補間曲線分割ありで登録
     def regist_bf(self, bf: VmdBoneFrame, bone_name: str, fno: int, copy_interpolation=False, is_key=True):
+        self.clear_pose_cache_by_regist(bone_name, fno, fno)
+
         # 登録対象の場合のみ、補間曲線リセットで登録する
         regist_bf = self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=True)
         regist_bf.position = bf.position.copy()
@@ -749,6 +1269,96 @@ class VmdMotion:
         next_bf = self.calc_bf(bone_name, next_fno, is_key=False, is_read=False, is_reset_interpolation=False)
         self.split_bf_by_fno(bone_name, prev_bf, next_bf, fno)
     
+    # 複数のキーフレをまとめて登録する
+    # 最終キーより後ろへの追加と既存キーの上書きは補間曲線の分割を後回しにして、最後に分割が必要な区間だけまとめて分割する
+    # 既存キーの間への追加は、前後の補間曲線を分割しながら1件ずつ登録する
+    def regist_bf_range(self, bfs: list, bone_name: str, copy_interpolation=False, is_key=True):
+        if len(bfs) == 0:
+            return
+
+        self.clear_pose_cache_by_regist(bone_name, min(bf.fno for bf in bfs), max(bf.fno for bf in bfs))
+
+        if bone_name not in self.bones:
+            self.bones[bone_name] = VmdBoneFrames()
+
+        regist_fnos = []
+        for bf in sorted(bfs, key=lambda bf: bf.fno):
+            frames = self.bones[bone_name]
+            fno = bf.fno
+
+            if fno in frames:
+                # 既存キーの場合、そのまま上書き
+                regist_bf = frames[fno]
+            elif len(frames.fnos) > 0 and fno < frames.fnos[-1]:
+                # 既存キーの間の場合、1件ずつ登録
+                self.regist_bf(bf, bone_name, fno, copy_interpolation=copy_interpolation, is_key=is_key)
+                continue
+            elif len(frames.fnos) > 0:
+                # 最終キーより後ろの場合、最終キーの名前と補間曲線を引き継ぐ
+                last_bf = frames[frames.fnos[-1]]
+                regist_bf = VmdBoneFrame(fno)
+                regist_bf.name = last_bf.name
+                regist_bf.bname = last_bf.bname
+                regist_bf.interpolation = list(last_bf.interpolation)
+            else:
+                regist_bf = VmdBoneFrame(fno)
+                regist_bf.set_name(bone_name)
+
+            regist_bf.position = bf.position.copy()
+            regist_bf.rotation = bf.rotation.copy()
+            regist_bf.org_rotation = bf.org_rotation.copy()
+            if copy_interpolation:
+                regist_bf.interpolation = cPickle.loads(cPickle.dumps(bf.interpolation, -1))
+
+            # キーを登録
+            regist_bf.key = is_key
+            frames[fno] = regist_bf
+            regist_fnos.append(fno)
+
+        # 補間曲線を設定（有効なキーのみ）
+        for fno in regist_fnos:
+            prev_fno, next_fno = self.get_bone_prev_next_fno(bone_name, fno=fno, is_key=True)
+            if not (prev_fno < fno < next_fno):
+                continue
+
+            frames = self.bones[bone_name]
+            regist_bf = frames[fno]
+            if next_fno > frames.fnos[-1]:
+                # 最終キーより後ろは最終キーのコピーになる
+                next_bf = frames[frames.fnos[-1]]
+            elif next_fno in frames:
+                next_bf = frames[next_fno]
+            else:
+                next_bf = self.calc_bf(bone_name, next_fno, is_key=False, is_read=False, is_reset_interpolation=False)
+
+            if self.is_fit_interpolation(regist_bf) and self.is_fit_interpolation(next_bf):
+                # 補間曲線がMMDの範囲内に収まっている場合、分割は不要(分割時と同じく登録対象にだけする)
+                if not regist_bf.key:
+                    regist_bf.key = True
+                    frames[fno] = regist_bf
+                continue
+
+            prev_bf = self.calc_bf(bone_name, prev_fno, is_key=False, is_read=False, is_reset_interpolation=False)
+            next_bf = self.calc_bf(bone_name, next_fno, is_key=False, is_read=False, is_reset_interpolation=False)
+            self.split_bf_by_fno(bone_name, prev_bf, next_bf, fno)
+
+    # 補間曲線が全てMMDの範囲内に収まっているか
+    def is_fit_interpolation(self, bf: VmdBoneFrame):
+        bz = FIT_INTERPOLATION_IDXS(bf.interpolation)
+        if 0 < min(bz) and max(bz) <= MBezierUtils.INTERPOLATION_MMD_MAX:
+            # 全て範囲内で0もない場合、判定不要
+            return True
+
+        for x1_idxs, y1_idxs, x2_idxs, y2_idxs in [(MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs), \
+                                                   (MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs), \
+                                                   (MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs), \
+                                                   (MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs)]:
+            bz = [bf.interpolation[x1_idxs[3]], bf.interpolation[y1_idxs[3]], bf.interpolation[x2_idxs[3]], bf.interpolation[y2_idxs[3]]]
+            if not all(0 <= v <= MBezierUtils.INTERPOLATION_MMD_MAX for v in bz) or bz == [0, 0, 0, 0]:
+                return False
+
+        return True
+
     def regist_mf(self, mf: VmdMorphFrame, morph_name: str, fno: int):
         if morph_name not in self.morphs:
             self.morphs[morph_name] = {}
@@ -762,7 +1372,7 @@ class VmdMotion:
         fill_bf = VmdBoneFrame(fno)
 
         if bone_name not in self.bones:
-            self.bones[bone_name] = {fno: fill_bf}
+            self.bones[bone_name] = VmdBoneFrames({fno: fill_bf})
             fill_bf.set_name(bone_name)
             return fill_bf
         
@@ -779,32 +1389,32 @@ class VmdMotion:
                 return None
 
         # 番号より前のフレーム番号
-        before_fnos = [x for x in sorted(self.bones[bone_name].keys()) if (x < fno)]
+        before_fno = self.bones[bone_name].get_prev_fno(fno)
         # 番号より後のフレーム番号
-        after_fnos = [x for x in sorted(self.bones[bone_name].keys()) if (x > fno)]
+        after_fno = self.bones[bone_name].get_next_fno(fno)
 
-        if len(after_fnos) == 0 and len(before_fnos) == 0:
+        if after_fno is None and before_fno is None:
             fill_bf.set_name(bone_name)
             return fill_bf
 
-        if len(after_fnos) == 0:
+        if after_fno is None:
             # 番号より前があって、後のがない場合、前のをコピーして返す
-            fill_bf = self.bones[bone_name][before_fnos[-1]].copy()
+            fill_bf = self.bones[bone_name][before_fno].copy()
             fill_bf.fno = fno
             fill_bf.key = False
             fill_bf.read = False
             return fill_bf
         
-        if len(before_fnos) == 0:
+        if before_fno is None:
             # 番号より後があって、前がない場合、後のをコピーして返す
-            fill_bf = self.bones[bone_name][after_fnos[0]].copy()
+            fill_bf = self.bones[bone_name][after_fno].copy()
             fill_bf.fno = fno
             fill_bf.key = False
             fill_bf.read = False
             return fill_bf
 
-        prev_bf = self.bones[bone_name][before_fnos[-1]]
-        next_bf = self.bones[bone_name][after_fnos[0]]
+        prev_bf = self.bones[bone_name][before_fno]
+        next_bf = self.bones[bone_name][after_fno]
 
         # 名前をコピー
         fill_bf.name = prev_bf.name
@@ -856,41 +1466,11 @@ class VmdMotion:
 
     # 補間曲線を元に、回転ボーンの値を求める
     def calc_bf_rot(self, prev_bf: VmdBoneFrame, fill_bf: VmdBoneFrame, next_bf: VmdBoneFrame):
-        if prev_bf.rotation != next_bf.rotation:
-            # 回転補間曲線
-            rx, ry, rt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.R_x1_idxs[3]], next_bf.interpolation[MBezierUtils.R_y1_idxs[3]], \
-                                               next_bf.interpolation[MBezierUtils.R_x2_idxs[3]], next_bf.interpolation[MBezierUtils.R_y2_idxs[3]], \
-                                               prev_bf.fno, fill_bf.fno, next_bf.fno)
-            return MQuaternion.slerp(prev_bf.rotation, next_bf.rotation, ry)
-
-        return prev_bf.rotation.copy()
+        return calc_bf_rot(prev_bf, fill_bf, next_bf)
 
     # 補間曲線を元に移動ボーンの値を求める
     def calc_bf_pos(self, prev_bf: VmdBoneFrame, fill_bf: VmdBoneFrame, next_bf: VmdBoneFrame):
-        # 補間曲線を元に間を埋める
-        if prev_bf.position != next_bf.position:
-            # http://rantyen.blog.fc2.com/blog-entry-65.html
-            # X移動補間曲線
-            xx, xy, xt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MX_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y1_idxs[3]], \
-                                               next_bf.interpolation[MBezierUtils.MX_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y2_idxs[3]], \
-                                               prev_bf.fno, fill_bf.fno, next_bf.fno)
-            # Y移動補間曲線
-            yx, yy, yt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MY_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y1_idxs[3]], \
-                                               next_bf.interpolation[MBezierUtils.MY_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y2_idxs[3]], \
-                                               prev_bf.fno, fill_bf.fno, next_bf.fno)
-            # Z移動補間曲線
-            zx, zy, zt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MZ_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y1_idxs[3]], \
-                                               next_bf.interpolation[MBezierUtils.MZ_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y2_idxs[3]], \
-                                               prev_bf.fno, fill_bf.fno, next_bf.fno)
-
-            fill_pos = MVector3D()
-            fill_pos.setX(prev_bf.position.x() + ((next_bf.position.x() - prev_bf.position.x()) * xy))
-            fill_pos.setY(prev_bf.position.y() + ((next_bf.position.y() - prev_bf.position.y()) * yy))
-            fill_pos.setZ(prev_bf.position.z() + ((next_bf.position.z() - prev_bf.position.z()) * zy))
-            
-            return fill_pos
-        
-        return prev_bf.position.copy()
+        return calc_bf_pos(prev_bf, fill_bf, next_bf)
     
     # キーフレを指定されたフレーム番号の前後で分割する
     def split_bf_by_fno(self, target_bone_name: str, prev_bf: VmdBoneFrame, next_bf: VmdBoneFrame, fill_fno: int):
@@ -1120,9 +1700,6 @@ class VmdMotion:
         prev_sep_fno = 0
 
         for n in range(loop):
-            rxfilter = OneEuroFilter(**config)
-
-            fnos = self.get_morph_fnos(morph_name)
             prev_sep_fno = 0
 
             # キーフレを取得する
@@ -1133,10 +1710,16 @@ class VmdMotion:
                 # 範囲指定がある場合はその範囲内だけ
                 fnos = self.get_morph_fnos(morph_name, start_fno=start_fno, end_fno=end_fno)
 
-            # 全区間をフィルタにかける
-            for fno in fnos:
-                now_mf = self.calc_mf(morph_name, fno, is_key=False, is_read=False)
-                now_mf.ratio = rxfilter(now_mf.ratio, fno)
+            if len(fnos) == 0:
+                continue
+
+            now_mfs = [self.calc_mf(morph_name, fno, is_key=False, is_read=False) for fno in fnos]
+
+            # 全区間をまとめてフィルタにかける
+            ratios = one_euro_filter([mf.ratio for mf in now_mfs], fnos, **config).tolist()
+
+            for fidx, (fno, now_mf) in enumerate(zip(fnos, now_mfs)):
+                now_mf.ratio = ratios[fidx]
 
                 if is_show_log and data_set_no > 0 and fno // 2000 > prev_sep_fno and fnos[-1] > 0:
                     logger.info("-- %sフレーム目:終了(%s％)【No.%s - フィルタリング - %s(%s)】", fno, round((fno / fnos[-1]) * 100, 3), data_set_no, morph_name, (n + 1))
@@ -1221,6 +1804,33 @@ class VmdMotion:
 
         return v1
 
+    # 指定モーフのキーを、許容誤差(またはキー数の上限)に収まるまで間引く
+    # 間引きは remove_unnecessary_mf で行う
+    # 戻り値: (削減前キー数, 削減後キー数, 最大誤差)
+    def compact_mf(self, morph_name: str, tolerance=0.05, budget=0):
+        fnos = self.get_morph_fnos(morph_name)
+        if len(fnos) <= 2:
+            return len(fnos), len(fnos), 0
+
+        org_mfs = {fno: self.morphs[morph_name][fno] for fno in fnos}
+
+        def reduce(scale: float):
+            # 間引く前のキーに戻してから、許容誤差を倍率分広げて間引く
+            self.morphs[morph_name] = dict(org_mfs)
+            self.remove_unnecessary_mf(0, morph_name, threshold=tolerance * scale, is_show_log=False)
+            return len(self.morphs[morph_name])
+
+        reduce_keys_by_budget(reduce, budget)
+
+        # 実際に達成した誤差
+        keep_fnos = self.get_morph_fnos(morph_name)
+        ratios = np.array([org_mfs[fno].ratio for fno in fnos], dtype=np.float64)
+        keep_ratios = np.array([org_mfs[fno].ratio for fno in keep_fnos], dtype=np.float64)
+        dense_fnos = np.arange(fnos[0], fnos[-1] + 1)
+        err = float(np.max(np.abs(np.interp(dense_fnos, fnos, ratios) - np.interp(dense_fnos, keep_fnos, keep_ratios))))
+
+        return len(fnos), len(keep_fnos), err
+
     # 有効なキーフレが入っているか
     def is_active_bones(self, bone_name: str):
         for bf in self.bones[bone_name].values():
@@ -1243,32 +1853,44 @@ class VmdMotion:
         start_fno = kwargs["start_fno"] if "start_fno" in kwargs and kwargs["start_fno"] else 0
         end_fno = kwargs["end_fno"] if "end_fno" in kwargs and kwargs["end_fno"] else 9999999999
         
-        # 条件に合致するフレーム番号を探す
-        keys = []
-        for bone_name in bone_names:
-            if bone_name in self.bones:
-                keys.extend([x for x in self.bones[bone_name].keys() if self.bones[bone_name][x].fno >= start_fno and self.bones[bone_name][x].fno <= end_fno and \
-                            (not is_key or (is_key and self.bones[bone_name][x].key)) and (not is_read or (is_read and self.bones[bone_name][x].read))])
-        
+        # 条件に合致するフレーム番号を探す(ボーンごとの昇順索引から範囲を切り出す)
+        bone_fnos = [self.bones[bone_name].get_range_fnos(start_fno, end_fno, is_key, is_read) for bone_name in bone_names if bone_name in self.bones]
+
+        if len(bone_fnos) == 1:
+            return list(bone_fnos[0])
+
         # 重複を除いた昇順フレーム番号リストを返す
-        return sorted(list(set(keys)))
+        return sorted(set(fno for fnos in bone_fnos for fno in fnos))
     
     # 指定されたfnoの前後のキーを取得する
     def get_bone_prev_next_fno(self, *bone_names, **kwargs):
-        # 指定されたボーン名のfnos
-        fnos = self.get_bone_fnos(*bone_names, **kwargs)
+        is_key = True if "is_key" in kwargs and kwargs["is_key"] else False
+        is_read = True if "is_read" in kwargs and kwargs["is_read"] else False
+        start_fno = kwargs["start_fno"] if "start_fno" in kwargs and kwargs["start_fno"] else 0
+        end_fno = kwargs["end_fno"] if "end_fno" in kwargs and kwargs["end_fno"] else 9999999999
 
         fno = kwargs["fno"] if "fno" in kwargs else 0
 
-        # 指定より前のキーフレ
-        prev_fnos = [x for x in fnos if x < fno]
-        # 指定より後のキーフレ
-        next_fnos = [x for x in fnos if x > fno]
-        
+        prev_fnos = []
+        next_fnos = []
+        for bone_name in bone_names:
+            if bone_name not in self.bones:
+                continue
+
+            # 指定より前のキーフレ(範囲内のみ)
+            bone_prev_fno = self.bones[bone_name].get_prev_fno(min(fno, end_fno + 1), is_key, is_read)
+            if bone_prev_fno is not None and bone_prev_fno >= start_fno:
+                prev_fnos.append(bone_prev_fno)
+
+            # 指定より後のキーフレ(範囲内のみ)
+            bone_next_fno = self.bones[bone_name].get_next_fno(max(fno, start_fno - 1), is_key, is_read)
+            if bone_next_fno is not None and bone_next_fno <= end_fno:
+                next_fnos.append(bone_next_fno)
+
         # 前のは取れなければ-1で強制的に前の
-        prev_fno = -1 if len(prev_fnos) <= 0 else prev_fnos[-1]
+        prev_fno = -1 if len(prev_fnos) <= 0 else max(prev_fnos)
         # 後のは取れなければ最終フレーム＋1
-        next_fno = self.last_motion_frame + 1 if len(next_fnos) <= 0 else next_fnos[0]
+        next_fno = self.last_motion_frame + 1 if len(next_fnos) <= 0 else min(next_fnos)
 
         return prev_fno, next_fno
 
@@ -1350,10 +1972,22 @@ class VmdMotion:
     def append_bone_frame(self, frame: VmdBoneFrame):
         if frame.name not in self.bones:
             # まだ該当ボーン名がない場合、追加
-            self.bones[frame.name] = {}
+            self.bones[frame.name] = VmdBoneFrames()
         
         self.bones[frame.name][frame.fno] = frame
 
+    # ボーンキーフレを列指向のトラックとして取得
+    def get_track(self, bone_name: str):
+        if isinstance(self.bones, VmdBoneTracks) and self.bones.get_track(bone_name) is not None:
+            # 読み込み直後で展開していない場合、そのまま返す
+            return self.bones.get_track(bone_name)
+        return VmdBoneTrack.from_frames(bone_name, self.bones[bone_name] if bone_name in self.bones else {})
+
+    # 列指向のトラックでボーンキーフレを置き換える
+    def set_track(self, bone_name: str, track: VmdBoneTrack):
+        self.clear_pose_cache(bone_name)
+        self.bones[bone_name] = track.to_frames()
+
     # モーフキーフレを追加
     def append_morph_frame(self, frame: VmdMorphFrame):
         if frame.name not in self.morphs:
@@ -1367,7 +2001,7 @@ class VmdMotion:
         new_motion = VmdMotion()
 
         for bone_name in self.bones.keys():
-            new_motion.bones[bone_name] = {fno: self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False).copy()}
+            new_motion.bones[bone_name] = VmdBoneFrames({fno: self.calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False).copy()})
         
         return new_motion
 
@@ -1381,7 +2015,7 @@ class VmdMotion:
         motion.motion_cnt = cPickle.loads(cPickle.dumps(self.motion_cnt, -1))
 
         for bone_name, bf_dict in self.bones.items():
-            motion.bones[bone_name] = {}
+            motion.bones[bone_name] = VmdBoneFrames()
             for bf in bf_dict.values():
                 motion.bones[bone_name][bf.fno] = bf.copy()
 
@@ -1400,3 +2034,184 @@ class VmdMotion:
         motion.digest = cPickle.loads(cPickle.dumps(self.digest, -1))
 
         return motion
+
+
+# 補間曲線を元に、回転ボーンの値を求める
+def calc_bf_rot(prev_bf: VmdBoneFrame, fill_bf: VmdBoneFrame, next_bf: VmdBoneFrame):
+    if prev_bf.rotation != next_bf.rotation:
+        # 回転補間曲線
+        rx, ry, rt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.R_x1_idxs[3]], next_bf.interpolation[MBezierUtils.R_y1_idxs[3]], \
+                                           next_bf.interpolation[MBezierUtils.R_x2_idxs[3]], next_bf.interpolation[MBezierUtils.R_y2_idxs[3]], \
+                                           prev_bf.fno, fill_bf.fno, next_bf.fno)
+        return MQuaternion.slerp(prev_bf.rotation, next_bf.rotation, ry)
+
+    return prev_bf.rotation.copy()
+
+
+# 補間曲線を元に移動ボーンの値を求める
+def calc_bf_pos(prev_bf: VmdBoneFrame, fill_bf: VmdBoneFrame, next_bf: VmdBoneFrame):
+    # 補間曲線を元に間を埋める
+    if prev_bf.position != next_bf.position:
+        # http://rantyen.blog.fc2.com/blog-entry-65.html
+        # X移動補間曲線
+        xx, xy, xt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MX_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y1_idxs[3]], \
+                                           next_bf.interpolation[MBezierUtils.MX_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y2_idxs[3]], \
+                                           prev_bf.fno, fill_bf.fno, next_bf.fno)
+        # Y移動補間曲線
+        yx, yy, yt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MY_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y1_idxs[3]], \
+                                           next_bf.interpolation[MBezierUtils.MY_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y2_idxs[3]], \
+                                           prev_bf.fno, fill_bf.fno, next_bf.fno)
+        # Z移動補間曲線
+        zx, zy, zt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MZ_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y1_idxs[3]], \
+                                           next_bf.interpolation[MBezierUtils.MZ_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y2_idxs[3]], \
+                                           prev_bf.fno, fill_bf.fno, next_bf.fno)
+
+        fill_pos = MVector3D()
+        fill_pos.setX(prev_bf.position.x() + ((next_bf.position.x() - prev_bf.position.x()) * xy))
+        fill_pos.setY(prev_bf.position.y() + ((next_bf.position.y() - prev_bf.position.y()) * yy))
+        fill_pos.setZ(prev_bf.position.z() + ((next_bf.position.z() - prev_bf.position.z()) * zy))
+        
+        return fill_pos
+    
+    return prev_bf.position.copy()
+
+
+# MQuaternion.slerp をまとめて行う(q1s, q2s: (..., 4) の回転(w, x, y, z), ts: (...) の補間割合)
+def slerp_array(q1s: np.ndarray, q2s: np.ndarray, ts: np.ndarray):
+    ts = np.asarray(ts, dtype=np.float64)[..., np.newaxis]
+    q1s, q2s, ts = np.broadcast_arrays(q1s, q2s, ts)
+
+    # 逆向きの場合は反転して近い方を補間する
+    dots = np.sum(q1s * q2s, axis=-1, keepdims=True)
+    q2bs = np.where(dots < 0, -q2s, q2s)
+    dots = np.abs(dots)
+
+    # 角度が小さすぎる場合は線形補間
+    angles = np.arccos(np.clip(dots, 0, 1))
+    sin_angles = np.sin(angles)
+    is_slerp = ((1 - dots) > 0.0000001) & (sin_angles > 0.0000001)
+    sin_angles = np.where(is_slerp, sin_angles, 1)
+    factor1 = np.where(is_slerp, np.sin((1 - ts) * angles) / sin_angles, 1 - ts)
+    factor2 = np.where(is_slerp, np.sin(ts * angles) / sin_angles, ts)
+
+    qs = q1s * factor1 + q2bs * factor2
+
+    # 範囲外の場合は前後のまま
+    return np.where(ts <= 0, q1s, np.where(ts >= 1, q2s, qs))
+
+
+# 補間曲線の範囲判定に使う値のINDEX(回転, 移動X, 移動Y, 移動Zの x1, y1, x2, y2)
+FIT_INTERPOLATION_IDXS = operator.itemgetter(*[idxs[3] for idxs in [MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs, \
+                                                                     MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs, \
+                                                                     MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs, \
+                                                                     MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs]])
+
+# 補間曲線を求めなかった場合の線形補間
+LINEAR_MMD_BEZIER = [20, 20, 107, 107]
+# 不要キー削除で一度にまとめて判定する候補キー数(全て結合できた場合は倍に増やす)
+REDUCE_KEY_WINDOW = 32
+# 不要キー削除でまとめて判定する配列の大きさ(候補キー数 * 区間のフレーム数)の上限
+REDUCE_KEY_MAX_CELLS = 2 ** 18
+
+
+# 始点から各候補終点までを、それぞれ1つの補間曲線で表せるかまとめて判定する
+# rotations: (フレーム数, 4), positions: (フレーム数, 3) は始点(INDEX 0)からの毎フレームの値
+# end_idxs: 候補終点のINDEX(昇順)
+# 戻り値: 表せるか (候補数,), 補間曲線 (候補数, 4[回転, 移動X, 移動Y, 移動Z], 4[x1, y1, x2, y2])
+def fit_bf_segments(rotations: np.ndarray, positions: np.ndarray, end_idxs: np.ndarray, is_rot: bool, is_mov: bool, \
+                    rot_diff_limit: float, mov_diff_limit: float):
+    end_idxs = np.asarray(end_idxs, dtype=np.int64)
+    frame_idxs = np.arange(int(end_idxs[-1]) + 1)
+    ends = end_idxs[:, np.newaxis]
+
+    # 候補ごとの経過割合 (候補数, フレーム数) と、始点・終点を除く区間内のフレーム
+    xs = np.minimum(frame_idxs[np.newaxis, :] / ends, 1)
+    inner_mask = (frame_idxs[np.newaxis, :] > 0) & (frame_idxs[np.newaxis, :] < ends)
+
+    results = np.ones(len(end_idxs), dtype=np.bool_)
+    bzs = np.tile(np.array(LINEAR_MMD_BEZIER, dtype=np.int64), (len(end_idxs), 4, 1))
+
+    def fit_values(values: np.ndarray):
+        # 始点からの変化量を終点の変化量で正規化して補間曲線を求める
+        end_values = values[end_idxs][:, np.newaxis]
+        is_diff = np.abs(end_values) >= 1e-8
+        ys = values[np.newaxis, :] / np.where(is_diff, end_values, 1)
+
+        fit_bzs = MBezierUtils.fit_bezier_mmd_array(xs, ys, inner_mask & is_diff)
+        fit_bzs[~is_diff[:, 0]] = LINEAR_MMD_BEZIER
+
+        _, fit_ys, _ = MBezierUtils.evaluate_array(fit_bzs[:, 0, np.newaxis], fit_bzs[:, 1, np.newaxis], fit_bzs[:, 2, np.newaxis], fit_bzs[:, 3, np.newaxis], \
+                                                   0, frame_idxs[np.newaxis, :], ends)
+        return fit_bzs, np.where(is_diff, fit_ys, 0)
+
+    if is_rot:
+        qs = rotations[:len(frame_idxs)]
+        norms = np.linalg.norm(qs, axis=1, keepdims=True)
+        qs = qs / np.where(norms == 0, 1, norms)
+
+        # 始点からの回転角で補間割合を求める
+        angles = np.arccos(np.clip(np.abs(qs.dot(qs[0])), 0, 1))
+        bzs[:, 0], fit_ys = fit_values(angles)
+
+        # 補間曲線で求めた回転と実際の回転の差(1 - 内積)
+        fit_qs = slerp_array(qs[0], qs[end_idxs][:, np.newaxis, :], fit_ys)
+        norms = np.linalg.norm(fit_qs, axis=-1, keepdims=True)
+        fit_qs /= np.where(norms == 0, 1, norms)
+        diffs = 1 - np.abs(np.sum(fit_qs * qs[np.newaxis, :, :], axis=-1))
+        results &= np.max(np.where(inner_mask, diffs, 0), axis=1) <= rot_diff_limit
+
+    if is_mov:
+        for axis in range(3):
+            values = positions[:len(frame_idxs), axis] - positions[0, axis]
+            bzs[:, axis + 1], fit_ys = fit_values(values)
+
+            # 補間曲線で求めた位置と実際の位置の差
+            diffs = np.abs(values[end_idxs][:, np.newaxis] * fit_ys - values[np.newaxis, :])
+            results &= np.max(np.where(inner_mask, diffs, 0), axis=1) <= mov_diff_limit
+
+    return results, bzs
+
+
+# キー数の上限がある場合に、許容誤差を広げる倍率の上限と二分探索の回数
+REDUCE_KEY_MAX_SCALE = 2 ** 16
+REDUCE_KEY_BISECT_CNT = 8
+
+
+# キー数が上限に収まるまで、許容誤差を広げて間引き直す
+# 倍にしながら上限に収まる倍率を探し、収まらなかった倍率との間を二分探索する
+# reduce: 許容誤差の倍率を受け取って間引きを行い、間引いた後のキー数を返す関数
+# 戻り値: 間引いた後のキー数(上限に収まらない場合、最大の倍率で間引いた状態のまま)
+def reduce_keys_by_budget(reduce, budget: int):
+    key_cnt = reduce(1)
+    if budget <= 0 or key_cnt <= budget:
+        return key_cnt
+
+    ng_scale = 1
+    ok_scale = 0
+    scale = 2
+    while scale <= REDUCE_KEY_MAX_SCALE:
+        key_cnt = reduce(scale)
+        if key_cnt <= budget:
+            ok_scale = scale
+            break
+        ng_scale = scale
+        scale *= 2
+
+    if ok_scale == 0:
+        return key_cnt
+
+    ok_cnt = key_cnt
+    for _ in range(REDUCE_KEY_BISECT_CNT):
+        scale = (ng_scale + ok_scale) / 2
+        key_cnt = reduce(scale)
+        if key_cnt <= budget:
+            ok_scale = scale
+            ok_cnt = key_cnt
+        else:
+            ng_scale = scale
+
+    if scale != ok_scale:
+        # 最後に試した倍率が上限を超えていた場合、収まった倍率で間引き直す
+        ok_cnt = reduce(ok_scale)
+
+    return ok_cnt
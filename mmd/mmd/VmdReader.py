@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import mmap
+import struct
+import numpy as np
+
+from mmd.mmd.VmdData import VmdMotion, VmdBoneTrack, VmdMorphFrame, VmdCameraFrame, VmdLightFrame, VmdShadowFrame, VmdShowIkFrame, VmdInfoIk, \
+    VMD_BONE_FRAME_DTYPE, VMD_MORPH_FRAME_DTYPE
+from mmd.module.MMath import MVector3D
+from mmd.utils.MLogger import MLogger # noqa
+
+logger = MLogger(__name__)
+
+# VMDのカメラキーフレ1件分のレコード(61byte)
+VMD_CAMERA_FRAME_DTYPE = np.dtype([('fno', '<u4'), ('length', '<f4'), ('position', '<f4', (3,)), ('euler', '<f4', (3,)), ('interpolation', 'u1', (24,)), \
+                                   ('angle', '<u4'), ('perspective', 'u1')])
+# VMDの照明キーフレ1件分のレコード(28byte)
+VMD_LIGHT_FRAME_DTYPE = np.dtype([('fno', '<u4'), ('color', '<f4', (3,)), ('position', '<f4', (3,))])
+# VMDのセルフ影キーフレ1件分のレコード(9byte)
+VMD_SHADOW_FRAME_DTYPE = np.dtype([('fno', '<u4'), ('type', 'u1'), ('distance', '<f4')])
+
+
+class VmdReader():
+    def __init__(self, vmd_path: str):
+        self.vmd_path = vmd_path
+        self.offset = 0
+
+    def read_data(self):
+        """Read VMD data from a file"""
+        motion = VmdMotion()
+        motion.path = self.vmd_path
+
+        with open(self.vmd_path, "rb") as f:
+            if os.path.getsize(self.vmd_path) == 0:
+                return motion
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                self.offset = 0
+
+                # header
+                signature = self.read_bytes(buffer, 30)
+                motion.signature = self.decode_name(signature)
+
+                # 旧形式はモデル名が10byte
+                model_name_size = 10 if signature.startswith(b'Vocaloid Motion Data file') else 20
+                motion.model_name = self.decode_name(self.read_bytes(buffer, model_name_size))
+
+                # ボーンキーフレ
+                motion.motion_cnt = self.read_uint(buffer)
+                bone_records = self.read_records(buffer, VMD_BONE_FRAME_DTYPE, motion.motion_cnt)
+                self.regist_bone_tracks(motion, bone_records)
+                del bone_records
+
+                if self.offset >= len(buffer):
+                    return motion
+
+                # モーフキーフレ
+                motion.morph_cnt = self.read_uint(buffer)
+                morph_records = self.read_records(buffer, VMD_MORPH_FRAME_DTYPE, motion.morph_cnt)
+                self.regist_morph_frames(motion, morph_records)
+                del morph_records
+
+                if self.offset >= len(buffer):
+                    return motion
+
+                # カメラキーフレ
+                motion.camera_cnt = self.read_uint(buffer)
+                camera_records = self.read_records(buffer, VMD_CAMERA_FRAME_DTYPE, motion.camera_cnt)
+                for record in camera_records:
+                    cf = VmdCameraFrame()
+                    cf.fno = int(record['fno'])
+                    cf.length = float(record['length'])
+                    cf.position = MVector3D(record['position'].astype(np.float64))
+                    cf.euler = MVector3D(record['euler'].astype(np.float64))
+                    cf.interpolation = record['interpolation'].tolist()
+                    cf.angle = int(record['angle'])
+                    cf.perspective = int(record['perspective'])
+                    cf.org_length = cf.length
+                    cf.org_position = cf.position.copy()
+                    motion.cameras[cf.fno] = cf
+                del camera_records
+
+                if self.offset >= len(buffer):
+                    return motion
+
+                # 照明キーフレ
+                motion.light_cnt = self.read_uint(buffer)
+                light_records = self.read_records(buffer, VMD_LIGHT_FRAME_DTYPE, motion.light_cnt)
+                for record in light_records:
+                    lf = VmdLightFrame()
+                    lf.fno = int(record['fno'])
+                    lf.color = MVector3D(record['color'].astype(np.float64))
+                    lf.position = MVector3D(record['position'].astype(np.float64))
+                    motion.lights.append(lf)
+                del light_records
+
+                if self.offset >= len(buffer):
+                    return motion
+
+                # セルフ影キーフレ
+                motion.shadow_cnt = self.read_uint(buffer)
+                shadow_records = self.read_records(buffer, VMD_SHADOW_FRAME_DTYPE, motion.shadow_cnt)
+                for record in shadow_records:
+                    sf = VmdShadowFrame()
+                    sf.fno = int(record['fno'])
+                    sf.type = int(record['type'])
+                    sf.distance = float(record['distance'])
+                    motion.shadows.append(sf)
+                del shadow_records
+
+                if self.offset >= len(buffer):
+                    return motion
+
+                # モデル表示・IK on/offキーフレ(可変長)
+                motion.ik_cnt = self.read_uint(buffer)
+                for _ in range(motion.ik_cnt):
+                    sf = VmdShowIkFrame()
+                    sf.fno = self.read_uint(buffer)
+                    sf.show = self.read_bytes(buffer, 1)[0]
+                    sf.ik_count = self.read_uint(buffer)
+                    for _ in range(sf.ik_count):
+                        ik_bname = self.read_bytes(buffer, 20)
+                        ik = VmdInfoIk(self.decode_name(ik_bname), self.read_bytes(buffer, 1)[0])
+                        ik.bname = ik_bname
+                        sf.ik.append(ik)
+                    motion.showiks.append(sf)
+
+        return motion
+
+    # ボーンごとに列指向のトラックとして登録する(キーフレは参照時に展開)
+    def regist_bone_tracks(self, motion: VmdMotion, records: np.ndarray):
+        if len(records) == 0:
+            return
+
+        # 名前の終端以降は無視する
+        names = np.array([bname.split(b'\x00')[0] for bname in records['name'].tolist()], dtype=records['name'].dtype)
+
+        # ボーン名・フレーム番号順に並べ替える
+        orders = np.lexsort((records['fno'], names))
+        names = names[orders]
+        fnos = records['fno'][orders]
+        # 同じボーン名の区切り
+        bounds = np.flatnonzero(names[1:] != names[:-1]) + 1
+        starts = np.concatenate([[0], bounds])
+        ends = np.concatenate([bounds, [len(records)]])
+
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            # 同じフレーム番号は後のキーを優先
+            bone_orders = orders[start:end]
+            bone_fnos = fnos[start:end]
+            last_idxs = np.flatnonzero(np.append(bone_fnos[1:] != bone_fnos[:-1], True))
+            bone_records = records[bone_orders[last_idxs]]
+
+            bone_name = self.decode_name(names[start])
+            track = VmdBoneTrack(bone_name, len(bone_records))
+            track.bname = bytes(names[start]).ljust(15, b'\x00')
+            track.fnos[:] = bone_records['fno']
+            track.positions[:] = bone_records['position']
+            # (x, y, z, w) から (w, x, y, z) に並べ替え
+            track.rotations[:] = bone_records['rotation'][:, [3, 0, 1, 2]]
+            track.org_rotations[:] = track.rotations
+            track.interpolations[:] = bone_records['interpolation']
+            # 読み込んだキーは登録対象かつ読み込みキー
+            track.keys[:] = True
+            track.reads[:] = True
+
+            motion.bones[bone_name] = track
+            motion.last_motion_frame = max(motion.last_motion_frame, int(track.fnos[-1]))
+
+    def regist_morph_frames(self, motion: VmdMotion, records: np.ndarray):
+        bnames = {}
+        for name, fno, ratio in zip(records['name'].tolist(), records['fno'].tolist(), records['ratio'].tolist()):
+            if name not in bnames:
+                bnames[name] = self.decode_name(name)
+
+            mf = VmdMorphFrame(fno)
+            mf.name = bnames[name]
+            mf.bname = name.split(b'\x00')[0].ljust(15, b'\x00')
+            mf.ratio = ratio
+            mf.key = True
+            mf.read = True
+            motion.append_morph_frame(mf)
+
+    # 名前をデコードする(15byte等で切れた文字は無視)
+    def decode_name(self, bname: bytes):
+        return bytes(bname).split(b'\x00')[0].decode('shift_jis', errors='ignore').strip()
+
+    def read_bytes(self, buffer, size: int):
+        value = buffer[self.offset:self.offset + size]
+        self.offset += size
+        return value
+
+    def read_uint(self, buffer):
+        if self.offset + 4 > len(buffer):
+            return 0
+        value = struct.unpack_from('<L', buffer, self.offset)[0]
+        self.offset += 4
+        return value
+
+    # 固定長レコードを配列として読み込む(mmapからは複製して切り離す)
+    def read_records(self, buffer, dtype: np.dtype, count: int):
+        count = min(count, (len(buffer) - self.offset) // dtype.itemsize)
+        records = np.frombuffer(buffer, dtype=dtype, count=count, offset=self.offset).copy()
+        self.offset += dtype.itemsize * count
+        return records
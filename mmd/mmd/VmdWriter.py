@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 #
 import struct
+import numpy as np
 from mmd.mmd.PmxData import PmxModel
-from mmd.mmd.VmdData import VmdMotion
+from mmd.mmd.VmdData import VmdMotion, VMD_BONE_FRAME_DTYPE, VMD_MORPH_FRAME_DTYPE
 from mmd.utils.MLogger import MLogger # noqa
 
 logger = MLogger(__name__)
@@ -43,11 +44,9 @@ class VmdWriter():
         
         # bone frames
         fout.write(struct.pack('<L', len(bone_frames)))  # ボーンフレーム数
-        for bf in bone_frames:
-            bf.write(fout)
+        fout.write(create_bone_frame_array(bone_frames).tobytes())
         fout.write(struct.pack('<L', len(morph_frames)))  # 表情キーフレーム数
-        for mf in morph_frames:
-            mf.write(fout)
+        fout.write(create_morph_frame_array(morph_frames).tobytes())
         fout.write(struct.pack('<L', len(camera_frames)))  # カメラキーフレーム数
         for cf in camera_frames:
             cf.write(fout)
@@ -64,3 +63,53 @@ class VmdWriter():
                 sf.write(fout)
         
         fout.close()
+
+
+# 名前をVMD用の15byteに変換する(同じ名前は一度だけ変換する)
+def encode_frame_names(frames: list):
+    bnames = {}
+    names = []
+    for frame in frames:
+        if frame.bname:
+            names.append(frame.bname)
+            continue
+
+        if frame.name not in bnames:
+            bnames[frame.name] = frame.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:15]   # 15文字制限
+        names.append(bnames[frame.name])
+
+    return names
+
+
+# ボーンキーフレをVMDのレコード配列にまとめる
+def create_bone_frame_array(bone_frames: list):
+    records = np.zeros(len(bone_frames), dtype=VMD_BONE_FRAME_DTYPE)
+    if len(bone_frames) == 0:
+        return records
+
+    records['name'] = encode_frame_names(bone_frames)
+    records['fno'] = [int(bf.fno) for bf in bone_frames]
+    records['position'] = [bf.position.data() for bf in bone_frames]
+
+    # 回転は正規化して (x, y, z, w) の順(スカラーが0の場合は1とみなす)
+    qs = np.array([bf.rotation.data().components for bf in bone_frames], dtype=np.float64)
+    qs[qs[:, 0] == 0, 0] = 1
+    qs /= np.linalg.norm(qs, axis=1, keepdims=True)
+    records['rotation'] = qs[:, [1, 2, 3, 0]]
+
+    records['interpolation'] = np.clip(np.array([bf.interpolation for bf in bone_frames], dtype=np.int64), 0, 127)
+
+    return records
+
+
+# モーフキーフレをVMDのレコード配列にまとめる
+def create_morph_frame_array(morph_frames: list):
+    records = np.zeros(len(morph_frames), dtype=VMD_MORPH_FRAME_DTYPE)
+    if len(morph_frames) == 0:
+        return records
+
+    records['name'] = encode_frame_names(morph_frames)
+    records['fno'] = [int(mf.fno) for mf in morph_frames]
+    records['ratio'] = [float(mf.ratio) for mf in morph_frames]
+
+    return records
@@ -4,6 +4,7 @@
 # cython: wraparound=False
 #
 import quaternion # noqa
+import os
 import math
 import numpy as np
 from math import sin, cos, acos, atan2, asin, pi, sqrt, degrees, radians
@@ -1728,3 +1729,10 @@ def get_almost_zero_value(v):
     return v
 
 
+# 演算の実装(numpy: 要素をnumpy配列で持つ, scalar: 要素を実数で持つ軽量版)
+# 各モジュールが import する前に、環境変数で選択する
+MATH_MODE = os.environ.get("EXPOSE_MMD_MATH", "numpy")
+
+if MATH_MODE == "scalar":
+    # ベクトル・クォータニオン・行列を差し替える(モジュール内の関数も差し替え後のクラスを使う)
+    from mmd.module.MMathScalar import MVector3D, MQuaternion, MMatrix4x4, crossProduct_MVector3D, dotProduct_MVector3D, dotProduct_MQuaternion # noqa
@@ -0,0 +1,851 @@
+# -*- coding: utf-8 -*-
+#
+# MMath の MVector3D / MQuaternion / MMatrix4x4 と同じAPIを持つ軽量版
+# 要素をnumpy配列ではなく __slots__ の実数で持ち、1件ずつの演算でのnumpyの呼び出しコストを省く
+# (環境変数 EXPOSE_MMD_MATH=scalar の場合に MMath から差し替えられる)
+#
+import quaternion # noqa
+import math
+import numpy as np
+from math import acos, atan2, asin, pi, sqrt, degrees, radians, sin, cos
+
+from mmd.module import MMath
+
+
+# 非数・無限大は0にする(MVector3D.effective と同じ)
+def effective_value(v: float):
+    return v if v - v == 0.0 else 0.0
+
+
+# ゼロ除算は0にする(除算後に effective した値と同じ)
+def effective_div(v1: float, v2: float):
+    return effective_value(v1 / v2) if v2 != 0 else 0.0
+
+
+class MVector3D:
+    __slots__ = ('_x', '_y', '_z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        if isinstance(x, MVector3D):
+            # クラスの場合
+            self._x = x._x
+            self._y = x._y
+            self._z = x._z
+        elif isinstance(x, np.ndarray):
+            # arrayそのものの場合
+            self._x = float(x[0])
+            self._y = float(x[1])
+            self._z = float(x[2])
+        else:
+            self._x = float(x)
+            self._y = float(y)
+            self._z = float(z)
+
+    def copy(self):
+        return new_vector3d(self._x, self._y, self._z)
+
+    def length(self):
+        return sqrt(self._x * self._x + self._y * self._y + self._z * self._z)
+
+    def lengthSquared(self):
+        return self.length()**2
+
+    def normalized(self):
+        l2 = sqrt(self._x * self._x + self._y * self._y + self._z * self._z)
+        if l2 == 0:
+            l2 = 1
+        return new_vector3d(self._x / l2, self._y / l2, self._z / l2)
+
+    def normalize(self):
+        self.effective()
+        l2 = sqrt(self._x * self._x + self._y * self._y + self._z * self._z)
+        if l2 == 0:
+            l2 = 1
+        self._x /= l2
+        self._y /= l2
+        self._z /= l2
+
+    def distanceToPoint(self, v):
+        return new_vector3d(self._x - v.x(), self._y - v.y(), self._z - v.z()).length()
+
+    def project(self, modelView, projection, viewport):
+        tmp = MMath.MVector4D(self._x, self._y, self._z, 1)
+        tmp = projection * modelView * tmp
+        if MMath.is_almost_null(tmp.w()):
+            tmp.setW(1)
+
+        tmp /= tmp.w()
+        tmp = tmp * 0.5 + MMath.MVector4D(0.5, 0.5, 0.5, 0.5)
+        tmp.setX(tmp.x() * viewport.width() + viewport.x())
+        tmp.setY(tmp.y() * viewport.height() + viewport.y())
+
+        tmp.effective()
+        return tmp.toVector3D()
+
+    def unproject(self, modelView, projection, viewport):
+        inverse = (projection * modelView).inverted()
+
+        tmp = MMath.MVector4D(self._x, self._y, self._z, 1)
+        tmp.setX((tmp.x() - viewport.x()) / viewport.width())
+        tmp.setY((tmp.y() - viewport.y()) / viewport.height())
+        tmp = tmp * 2 - MMath.MVector4D(1, 1, 1, 1)
+        tmp.effective()
+
+        obj = inverse * tmp
+        if MMath.is_almost_null(obj.w()):
+            obj.setW(1)
+
+        obj /= obj.w()
+        obj.effective()
+
+        return obj.toVector3D()
+
+    def toVector4D(self):
+        return MMath.MVector4D(self._x, self._y, self._z, 0)
+
+    def is_almost_null(self):
+        return abs(self._x) < 0.0000001 and abs(self._y) < 0.0000001 and abs(self._z) < 0.0000001
+
+    def effective(self):
+        self._x = effective_value(self._x)
+        self._y = effective_value(self._y)
+        self._z = effective_value(self._z)
+
+        return self
+
+    def abs(self):
+        self._x = abs(effective_value(self._x))
+        self._y = abs(effective_value(self._y))
+        self._z = abs(effective_value(self._z))
+
+        return self
+
+    def one(self):
+        self.effective()
+        self._x = 1.0 if abs(self._x) < 0.0000001 else self._x
+        self._y = 1.0 if abs(self._y) < 0.0000001 else self._y
+        self._z = 1.0 if abs(self._z) < 0.0000001 else self._z
+
+        return self
+
+    def non_zero(self):
+        self.effective()
+        self._x = 0.0000001 if abs(self._x) < 0.0000001 else self._x
+        self._y = 0.0000001 if abs(self._y) < 0.0000001 else self._y
+        self._z = 0.0000001 if abs(self._z) < 0.0000001 else self._z
+
+        return self
+
+    def isnan(self):
+        return math.isnan(self._x) or math.isnan(self._y) or math.isnan(self._z)
+
+    @classmethod
+    def crossProduct(cls, v1, v2):
+        return crossProduct_MVector3D(v1, v2)
+
+    @classmethod
+    def dotProduct(cls, v1, v2):
+        return dotProduct_MVector3D(v1, v2)
+
+    def data(self):
+        return np.array([self._x, self._y, self._z], dtype=np.float64)
+
+    def to_log(self):
+        return "x: {0}, y: {1} z: {2}".format(round(self._x, 5), round(self._y, 5), round(self._z, 5))
+
+    def __str__(self):
+        return "MVector3D({0}, {1}, {2})".format(self._x, self._y, self._z)
+
+    def __lt__(self, other):
+        return self._x < other.x() and self._y < other.y() and self._z < other.z()
+
+    def __le__(self, other):
+        return self._x <= other.x() and self._y <= other.y() and self._z <= other.z()
+
+    def __eq__(self, other):
+        return self._x == other.x() and self._y == other.y() and self._z == other.z()
+
+    def __ne__(self, other):
+        return self._x != other.x() or self._y != other.y() or self._z != other.z()
+
+    def __gt__(self, other):
+        return self._x > other.x() and self._y > other.y() and self._z > other.z()
+
+    def __ge__(self, other):
+        return self._x >= other.x() and self._y >= other.y() and self._z >= other.z()
+
+    def __add__(self, other):
+        if isinstance(other, MVector3D):
+            v = new_vector3d(self._x + other._x, self._y + other._y, self._z + other._z)
+        elif isinstance(other, (float, int, np.number)):
+            other = float(other)
+            v = new_vector3d(self._x + other, self._y + other, self._z + other)
+        else:
+            v = MVector3D(self.data() + other)
+        return v.effective()
+
+    def __sub__(self, other):
+        if isinstance(other, MVector3D):
+            v = new_vector3d(self._x - other._x, self._y - other._y, self._z - other._z)
+        elif isinstance(other, (float, int, np.number)):
+            other = float(other)
+            v = new_vector3d(self._x - other, self._y - other, self._z - other)
+        else:
+            v = MVector3D(self.data() - other)
+        return v.effective()
+
+    def __mul__(self, other):
+        if isinstance(other, MVector3D):
+            v = new_vector3d(self._x * other._x, self._y * other._y, self._z * other._z)
+        elif isinstance(other, (float, int, np.number)):
+            other = float(other)
+            v = new_vector3d(self._x * other, self._y * other, self._z * other)
+        else:
+            v = MVector3D(self.data() * other)
+        return v.effective()
+
+    def __truediv__(self, other):
+        if isinstance(other, MVector3D):
+            return new_vector3d(effective_div(self._x, other._x), effective_div(self._y, other._y), effective_div(self._z, other._z))
+        elif isinstance(other, (float, int, np.number)):
+            other = float(other)
+            return new_vector3d(effective_div(self._x, other), effective_div(self._y, other), effective_div(self._z, other))
+        else:
+            return MVector3D(self.data() / other).effective()
+
+    def __floordiv__(self, other):
+        if isinstance(other, (MVector3D, float, int, np.number)):
+            other = other if isinstance(other, MVector3D) else new_vector3d(float(other), float(other), float(other))
+            return new_vector3d(effective_value(self._x // other._x) if other._x != 0 else 0.0, \
+                                effective_value(self._y // other._y) if other._y != 0 else 0.0, \
+                                effective_value(self._z // other._z) if other._z != 0 else 0.0)
+        else:
+            return MVector3D(self.data() // other).effective()
+
+    def __mod__(self, other):
+        if isinstance(other, (MVector3D, float, int, np.number)):
+            other = other if isinstance(other, MVector3D) else new_vector3d(float(other), float(other), float(other))
+            return new_vector3d(effective_value(self._x % other._x) if other._x != 0 else 0.0, \
+                                effective_value(self._y % other._y) if other._y != 0 else 0.0, \
+                                effective_value(self._z % other._z) if other._z != 0 else 0.0)
+        else:
+            return MVector3D(self.data() % other).effective()
+
+    def __lshift__(self, other):
+        if isinstance(other, MVector3D):
+            v = self.data() << other.data()
+        else:
+            v = self.data() << other
+        return MVector3D(v).effective()
+
+    def __rshift__(self, other):
+        if isinstance(other, MVector3D):
+            v = self.data() >> other.data()
+        else:
+            v = self.data() >> other
+        return MVector3D(v).effective()
+
+    def __and__(self, other):
+        return MVector3D(self.data() & other.data()).effective()
+
+    def __dataor__(self, other):
+        return MVector3D(self.data() ^ other.data()).effective()
+
+    def __or__(self, other):
+        return MVector3D(self.data() | other.data()).effective()
+
+    def __neg__(self):
+        return new_vector3d(-self._x, -self._y, -self._z)
+
+    def __pos__(self):
+        return new_vector3d(+self._x, +self._y, +self._z)
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def z(self):
+        return self._z
+
+    def setX(self, x):
+        self._x = float(x)
+
+    def setY(self, y):
+        self._y = float(y)
+
+    def setZ(self, z):
+        self._z = float(z)
+
+
+# 実数から直接生成する(型判定を省く)
+def new_vector3d(x: float, y: float, z: float):
+    v = object.__new__(MVector3D)
+    v._x = x
+    v._y = y
+    v._z = z
+    return v
+
+
+def crossProduct_MVector3D(v1, v2):
+    x1, y1, z1 = v1.x(), v1.y(), v1.z()
+    x2, y2, z2 = v2.x(), v2.y(), v2.z()
+    return new_vector3d(y1 * z2 - z1 * y2, z1 * x2 - x1 * z2, x1 * y2 - y1 * x2)
+
+
+def dotProduct_MVector3D(v1, v2):
+    return v1.x() * v2.x() + v1.y() * v2.y() + v1.z() * v2.z()
+
+
+class MQuaternion:
+    __slots__ = ('_w', '_x', '_y', '_z')
+
+    def __init__(self, w=1.0, x=0.0, y=0.0, z=0.0):
+        if isinstance(w, MQuaternion):
+            # クラスの場合
+            self._w = w._w
+            self._x = w._x
+            self._y = w._y
+            self._z = w._z
+        elif isinstance(w, np.quaternion):
+            # quaternionの場合
+            self._w = w.w
+            self._x = w.x
+            self._y = w.y
+            self._z = w.z
+        elif isinstance(w, np.ndarray):
+            # arrayそのものの場合
+            self._w = float(w[0])
+            self._x = float(w[1])
+            self._y = float(w[2])
+            self._z = float(w[3])
+        else:
+            self._w = float(w)
+            self._x = float(x)
+            self._y = float(y)
+            self._z = float(z)
+
+    def copy(self):
+        return new_quaternion(self._w, self._x, self._y, self._z)
+
+    def __str__(self):
+        return "MQuaternion({0}, {1}, {2}, {3})".format(self._w, self._x, self._y, self._z)
+
+    def inverted(self):
+        norm = self._w * self._w + self._x * self._x + self._y * self._y + self._z * self._z
+        if not norm > 0:
+            v = self.data().inverse()
+            return new_quaternion(v.w, v.x, v.y, v.z)
+        return new_quaternion(self._w / norm, -self._x / norm, -self._y / norm, -self._z / norm)
+
+    def length(self):
+        return sqrt(self._w * self._w + self._x * self._x + self._y * self._y + self._z * self._z)
+
+    def lengthSquared(self):
+        return self.length()**2
+
+    def normalized(self):
+        self.effective()
+        size = self.length()
+        if not size > 0:
+            v = self.data().normalized()
+            return new_quaternion(v.w, v.x, v.y, v.z)
+        return new_quaternion(self._w / size, self._x / size, self._y / size, self._z / size)
+
+    def normalize(self):
+        size = self.length()
+        if not size > 0:
+            v = self.data().normalized()
+            self._w, self._x, self._y, self._z = v.w, v.x, v.y, v.z
+            return
+        self._w /= size
+        self._x /= size
+        self._y /= size
+        self._z /= size
+
+    def effective(self):
+        # MMath.MQuaternion と同じく、Scalarが0の場合のみ1にする
+        if self._w == 0:
+            self._w = 1.0
+
+    def toMatrix4x4(self):
+        w, x, y, z = self._w, self._x, self._y, self._z
+        n = w * w + x * x + y * y + z * z
+
+        rows = [[w * w + x * x - y * y - z * z, 2.0 * x * y - 2.0 * w * z, 2.0 * x * z + 2.0 * w * y, 0.0],
+                [2.0 * x * y + 2.0 * w * z, w * w - x * x + y * y - z * z, 2.0 * y * z - 2.0 * w * x, 0.0],
+                [2.0 * x * z - 2.0 * w * y, 2.0 * y * z + 2.0 * w * x, w * w - x * x - y * y + z * z, 0.0],
+                [0.0, 0.0, 0.0, n]]
+
+        if n > 0:
+            m = np.array([[v / n for v in row] for row in rows], dtype=np.float64)
+        else:
+            # 長さ0・非数の場合はnumpyでの除算結果に合わせる
+            m = np.array(rows, dtype=np.float64)
+            m /= m[3, 3]
+        m[3, 3] = 1.0
+
+        return new_matrix4x4(m)
+
+    def toVector4D(self):
+        return MMath.MVector4D(self._x, self._y, self._z, self._w)
+
+    def toEulerAngles4MMD(self):
+        # MMDの表記に合わせたオイラー角
+        euler = self.toEulerAngles()
+
+        return new_vector3d(euler._x, -euler._y, -euler._z)
+
+    # http://www.j3d.org/matrix_faq/matrfaq_latest.html#Q37
+    def toEulerAngles(self):
+        xp = self._x
+        yp = self._y
+        zp = self._z
+        wp = self._w
+
+        xx = xp * xp
+        xy = xp * yp
+        xz = xp * zp
+        xw = xp * wp
+        yy = yp * yp
+        yz = yp * zp
+        yw = yp * wp
+        zz = zp * zp
+        zw = zp * wp
+        lengthSquared = xx + yy + zz + wp * wp
+
+        if not abs(lengthSquared - 1.0) < 0.0000001 and not abs(lengthSquared) < 0.0000001:
+            xx /= lengthSquared
+            xy /= lengthSquared  # same as (xp / length) * (yp / length)
+            xz /= lengthSquared
+            xw /= lengthSquared
+            yy /= lengthSquared
+            yz /= lengthSquared
+            yw /= lengthSquared
+            zz /= lengthSquared
+            zw /= lengthSquared
+
+        pitch = asin(max(-1, min(1, -2.0 * (yz - xw))))
+        yaw = 0
+        roll = 0
+
+        if pitch < (pi / 2):
+            if pitch > -(pi / 2):
+                yaw = atan2(2.0 * (xz + yw), 1.0 - 2.0 * (xx + yy))
+                roll = atan2(2.0 * (xy + zw), 1.0 - 2.0 * (xx + zz))
+            else:
+                # not a unique solution
+                roll = 0.0
+                yaw = -atan2(-2.0 * (xy - zw), 1.0 - 2.0 * (yy + zz))
+        else:
+            # not a unique solution
+            roll = 0.0
+            yaw = atan2(-2.0 * (xy - zw), 1.0 - 2.0 * (yy + zz))
+
+        return MVector3D(degrees(pitch), degrees(yaw), degrees(roll))
+
+    # 角度に変換
+    def toDegree(self):
+        return degrees(2 * acos(min(1, max(-1, self._w))))
+
+    # 自分ともうひとつの値vとのtheta（変位量）を返す
+    def calcTheata(self, v):
+        return (1 - dotProduct_MQuaternion(self.normalized(), v.normalized()))
+
+    @classmethod
+    def dotProduct(cls, v1, v2):
+        return dotProduct_MQuaternion(v1, v2)
+
+    @classmethod
+    def fromAxisAndAngle(cls, vec3, angle):
+        return MMath.fromAxisAndAngle(vec3, angle)
+
+    @classmethod
+    def fromAxisAndQuaternion(cls, vec3, qq):
+        return MMath.fromAxisAndQuaternion(vec3, qq)
+
+    @classmethod
+    def fromDirection(cls, direction, up):
+        return MMath.fromDirection(direction, up)
+
+    @classmethod
+    def fromAxes(cls, xAxis, yAxis, zAxis):
+        return MMath.fromAxes(xAxis, yAxis, zAxis)
+
+    @classmethod
+    def fromRotationMatrix(cls, rot3x3):
+        return MMath.fromRotationMatrix(rot3x3)
+
+    @classmethod
+    def rotationTo(cls, fromv, tov):
+        return MMath.rotationTo(fromv, tov)
+
+    @classmethod
+    def fromEulerAngles(cls, pitch, yaw, roll):
+        return MMath.fromEulerAngles(pitch, yaw, roll)
+
+    @classmethod
+    def nlerp(cls, q1, q2, t):
+        return MMath.nlerp(q1, q2, t)
+
+    @classmethod
+    def slerp(cls, q1, q2, t):
+        return MMath.slerp(q1, q2, t)
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def z(self):
+        return self._z
+
+    def scalar(self):
+        return self._w
+
+    def vector(self):
+        return new_vector3d(self._x, self._y, self._z)
+
+    def setX(self, x):
+        self._x = float(x)
+
+    def setY(self, y):
+        self._y = float(y)
+
+    def setZ(self, z):
+        self._z = float(z)
+
+    def setScalar(self, w):
+        self._w = float(w)
+
+    def data(self):
+        return np.quaternion(self._w, self._x, self._y, self._z)
+
+    def __lt__(self, other):
+        return self.data().less(other.data())
+
+    def __le__(self, other):
+        return self.data().less_equal(other.data())
+
+    def __eq__(self, other):
+        return self._w == other.scalar() and self._x == other.x() and self._y == other.y() and self._z == other.z()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __gt__(self, other):
+        return self.data().greater(other.data())
+
+    def __ge__(self, other):
+        return self.data().greater_equal(other.data())
+
+    def __add__(self, other):
+        if isinstance(other, MQuaternion):
+            return new_quaternion(self._w + other._w, self._x + other._x, self._y + other._y, self._z + other._z)
+        elif isinstance(other, (float, int, np.number)):
+            # 実数はScalarにのみ加算
+            return new_quaternion(self._w + float(other), self._x, self._y, self._z)
+        v = self.data() + other
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __sub__(self, other):
+        if isinstance(other, MQuaternion):
+            return new_quaternion(self._w - other._w, self._x - other._x, self._y - other._y, self._z - other._z)
+        elif isinstance(other, (float, int, np.number)):
+            return new_quaternion(self._w - float(other), self._x, self._y, self._z)
+        v = self.data() - other
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __mul__(self, other):
+        if isinstance(other, MQuaternion):
+            w1, x1, y1, z1 = self._w, self._x, self._y, self._z
+            w2, x2, y2, z2 = other._w, other._x, other._y, other._z
+            return new_quaternion(w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+                                  w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+                                  w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+                                  w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2)
+        elif isinstance(other, MVector3D):
+            return self.toMatrix4x4() * other
+        elif isinstance(other, (float, int, np.number)):
+            other = float(other)
+            return new_quaternion(self._w * other, self._x * other, self._y * other, self._z * other)
+        v = self.data() * other
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __truediv__(self, other):
+        if isinstance(other, MQuaternion):
+            v = self.data() / other.data()
+        else:
+            v = self.data() / other
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __floordiv__(self, other):
+        if isinstance(other, MQuaternion):
+            v = self.data() // other.data()
+        else:
+            v = self.data() // other
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __mod__(self, other):
+        if isinstance(other, MQuaternion):
+            v = self.data() % other.data()
+        else:
+            v = self.data() % other
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __lshift__(self, other):
+        if isinstance(other, MQuaternion):
+            v = self.data() << other.data()
+        else:
+            v = self.data() << other
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __rshift__(self, other):
+        if isinstance(other, MQuaternion):
+            v = self.data() >> other.data()
+        else:
+            v = self.data() >> other
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __and__(self, other):
+        v = self.data() & other.data()
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __dataor__(self, other):
+        v = self.data() ^ other.data()
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __or__(self, other):
+        v = self.data() | other.data()
+        return MQuaternion(v.w, v.x, v.y, v.z)
+
+    def __neg__(self):
+        return new_quaternion(-self._w, -self._x, -self._y, -self._z)
+
+    def __pos__(self):
+        return new_quaternion(+self._w, +self._x, +self._y, +self._z)
+
+    def __invert__(self):
+        return MQuaternion(~self._w, ~self._x, ~self._y, ~self._z)
+
+
+# 実数から直接生成する(型判定を省く)
+def new_quaternion(w: float, x: float, y: float, z: float):
+    q = object.__new__(MQuaternion)
+    q._w = w
+    q._x = x
+    q._y = y
+    q._z = z
+    return q
+
+
+def dotProduct_MQuaternion(v1, v2):
+    return v1.scalar() * v2.scalar() + v1.x() * v2.x() + v1.y() * v2.y() + v1.z() * v2.z()
+
+
+# 単位行列の元データ
+IDENTITY_MATRIX = np.eye(4, dtype=np.float64)
+IDENTITY_ARGS = (0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+
+
+class MMatrix4x4:
+    __slots__ = ('_data',)
+
+    def __init__(self, m11=None, m12=0.0, m13=0.0, m14=0.0, m21=0.0, m22=1.0, m23=0.0, m24=0.0, m31=0.0, m32=0.0, m33=1.0, m34=0.0, m41=0.0, m42=0.0, m43=0.0, m44=1.0):
+        if m11 is None:
+            if (m12, m13, m14, m21, m22, m23, m24, m31, m32, m33, m34, m41, m42, m43, m44) == IDENTITY_ARGS:
+                # 単位行列は複製で作る
+                self._data = IDENTITY_MATRIX.copy()
+                return
+            m11 = 1.0
+
+        if isinstance(m11, MMatrix4x4):
+            # 行列クラスの場合
+            self._data = m11._data.copy()
+        elif isinstance(m11, np.ndarray):
+            # 行列そのものの場合
+            self._data = np.array(m11[:4, :4], dtype=np.float64)
+        else:
+            # べた値の場合
+            self._data = np.array([[m11, m12, m13, m14], [m21, m22, m23, m24], [m31, m32, m33, m34], [m41, m42, m43, m44]], dtype=np.float64)
+
+    def copy(self):
+        return new_matrix4x4(self._data.copy())
+
+    def data(self):
+        return self._data
+
+    # 逆行列
+    def inverted(self):
+        return new_matrix4x4(np.linalg.inv(self._data))
+
+    # 回転行列
+    def rotate(self, qq):
+        self._data = self._data.dot(qq.toMatrix4x4().data())
+
+    # 平行移動行列
+    def translate(self, vec3):
+        x, y, z = vec3.x(), vec3.y(), vec3.z()
+        self._data[:, 3] = [m4 + (m1 * x + m2 * y + m3 * z) for m1, m2, m3, m4 in self._data.tolist()]
+
+    # 縮尺行列
+    def scale(self, scale):
+        self._data[:, :3] *= scale
+
+    # 単位行列
+    def setToIdentity(self):
+        self._data = IDENTITY_MATRIX.copy()
+
+    def lookAt(self, eye, center, up):
+        forward = center - eye
+        if forward.is_almost_null():
+            # ほぼ0の場合終了
+            return
+
+        forward.normalize()
+        side = crossProduct_MVector3D(forward, up).normalized()
+        upVector = crossProduct_MVector3D(side, forward)
+
+        m = MMatrix4x4()
+        m._data[0, :-1] = side.data()
+        m._data[1, :-1] = upVector.data()
+        m._data[2, :-1] = -forward.data()
+        m._data[-1, -1] = 1.0
+
+        self *= m
+        self.translate(-eye)
+
+    def perspective(self, verticalAngle: float, aspectRatio: float, nearPlane: float, farPlane: float):
+        if nearPlane == farPlane or aspectRatio == 0:
+            return
+
+        rad = radians(verticalAngle / 2)
+        sine = sin(rad)
+
+        if sine == 0:
+            return
+
+        cotan = cos(rad) / sine
+        clip = farPlane - nearPlane
+
+        m = MMatrix4x4()
+        m._data[0, 0] = cotan / aspectRatio
+        m._data[1, 1] = cotan
+        m._data[2, 2] = -(nearPlane + farPlane) / clip
+        m._data[2, 3] = -(2 * nearPlane * farPlane) / clip
+        m._data[3, 2] = -1
+
+        self *= m
+
+    def mapVector(self, vector):
+        x, y, z = vector.x(), vector.y(), vector.z()
+        (m11, m12, m13, _), (m21, m22, m23, _), (m31, m32, m33, _), _ = self._data.tolist()
+
+        return new_vector3d(m11 * x + m12 * y + m13 * z, m21 * x + m22 * y + m23 * z, m31 * x + m32 * y + m33 * z)
+
+    def toQuaternion(self):
+        a = self._data.tolist()
+
+        # I removed + 1
+        trace = a[0][0] + a[1][1] + a[2][2]
+        # I changed M_EPSILON to 0
+        if trace > 0:
+            s = 0.5 / sqrt(trace + 1)
+            return new_quaternion(0.25 / s, (a[2][1] - a[1][2]) * s, (a[0][2] - a[2][0]) * s, (a[1][0] - a[0][1]) * s)
+        elif a[0][0] > a[1][1] and a[0][0] > a[2][2]:
+            s = 2 * sqrt(1 + a[0][0] - a[1][1] - a[2][2])
+            return new_quaternion((a[2][1] - a[1][2]) / s, 0.25 * s, (a[0][1] + a[1][0]) / s, (a[0][2] + a[2][0]) / s)
+        elif a[1][1] > a[2][2]:
+            s = 2 * sqrt(1 + a[1][1] - a[0][0] - a[2][2])
+            return new_quaternion((a[0][2] - a[2][0]) / s, (a[0][1] + a[1][0]) / s, 0.25 * s, (a[1][2] + a[2][1]) / s)
+        else:
+            s = 2 * sqrt(1 + a[2][2] - a[0][0] - a[1][1])
+            return new_quaternion((a[1][0] - a[0][1]) / s, (a[0][2] + a[2][0]) / s, (a[1][2] + a[2][1]) / s, 0.25 * s)
+
+    def __str__(self):
+        return "MMatrix4x4({0})".format(self._data)
+
+    def __lt__(self, other):
+        return np.all(np.less(self._data, other.data()))
+
+    def __le__(self, other):
+        return np.all(np.less_equal(self._data, other.data()))
+
+    def __eq__(self, other):
+        return np.all(np.equal(self._data, other.data()))
+
+    def __ne__(self, other):
+        return np.any(np.not_equal(self._data, other.data()))
+
+    def __gt__(self, other):
+        return np.all(np.greater(self._data, other.data()))
+
+    def __ge__(self, other):
+        return np.all(np.greater_equal(self._data, other.data()))
+
+    def __add__(self, other):
+        if isinstance(other, MMatrix4x4):
+            return new_matrix4x4(self._data + other._data)
+        return MMatrix4x4(self._data + other)
+
+    def __sub__(self, other):
+        if isinstance(other, MMatrix4x4):
+            return new_matrix4x4(self._data - other._data)
+        return MMatrix4x4(self._data - other)
+
+    def __mul__(self, other):
+        if isinstance(other, MVector3D):
+            return self.mul_MVector3D(other)
+        elif isinstance(other, MMatrix4x4):
+            return new_matrix4x4(np.dot(self._data, other._data))
+        elif isinstance(other, MMath.MVector4D):
+            return self.mul_MVector4D(other)
+        return MMatrix4x4(self._data * other)
+
+    def mul_MVector3D(self, other):
+        vx, vy, vz = other._x, other._y, other._z
+        (m11, m12, m13, m14), (m21, m22, m23, m24), (m31, m32, m33, m34), (m41, m42, m43, m44) = self._data.tolist()
+
+        x = m11 * vx + m12 * vy + m13 * vz + m14
+        y = m21 * vx + m22 * vy + m23 * vz + m24
+        z = m31 * vx + m32 * vy + m33 * vz + m34
+        w = m41 * vx + m42 * vy + m43 * vz + m44
+
+        if w == 1.0:
+            return new_vector3d(x, y, z)
+        elif w == 0.0:
+            return MVector3D()
+        else:
+            return new_vector3d(x / w, y / w, z / w)
+
+    def mul_MVector4D(self, other):
+        vx, vy, vz, vw = other.x(), other.y(), other.z(), other.w()
+        (m11, m12, m13, m14), (m21, m22, m23, m24), (m31, m32, m33, m34), (m41, m42, m43, m44) = self._data.tolist()
+
+        return MMath.MVector4D(m11 * vx + m12 * vy + m13 * vz + m14 * vw, m21 * vx + m22 * vy + m23 * vz + m24 * vw, \
+                               m31 * vx + m32 * vy + m33 * vz + m34 * vw, m41 * vx + m42 * vy + m43 * vz + m44 * vw)
+
+    def __iadd__(self, other):
+        self._data = self._data + other.data().T
+        return self
+
+    def __isub__(self, other):
+        self._data = self._data + other.data().T
+        return self
+
+    def __imul__(self, other):
+        self._data = np.dot(self._data, other.data())
+        return self
+
+    def __itruediv__(self, other):
+        self._data = self._data / other.data().T
+        return self
+
+
+# 配列をそのまま持たせて生成する(複製を省く)
+def new_matrix4x4(m: np.ndarray):
+    mat = object.__new__(MMatrix4x4)
+    mat._data = m
+    return mat
@@ -14,16 +14,17 @@ import math
 from mmd.utils import MServiceUtils
 
 from mmd.utils.MLogger import MLogger
-from mmd.utils.MServiceUtils import sort_by_numeric
+from mmd.utils.MServiceUtils import sort_by_numeric, execute_by_person, frame_executor
 from lighttrack.visualizer.detection_visualizer import draw_bbox
 
 from mmd.utils.MBezierUtils import join_value_2_bezier, R_x1_idxs, R_y1_idxs, R_x2_idxs, R_y2_idxs, MX_x1_idxs, MX_y1_idxs, MX_x2_idxs, MX_y2_idxs
 from mmd.utils.MBezierUtils import MY_x1_idxs, MY_y1_idxs, MY_x2_idxs, MY_y2_idxs, MZ_x1_idxs, MZ_y1_idxs, MZ_x2_idxs, MZ_y2_idxs
 from mmd.mmd.VmdWriter import VmdWriter
 from mmd.module.MMath import MQuaternion, MVector3D, MVector2D, MMatrix4x4, MRect, fromEulerAngles
-from mmd.mmd.VmdData import VmdBoneFrame, VmdMorphFrame, VmdMotion, VmdShowIkFrame, VmdInfoIk, OneEuroFilter
+from mmd.mmd.VmdData import VmdBoneFrame, VmdMorphFrame, VmdMotion, VmdShowIkFrame, VmdInfoIk, one_euro_filter
 from mmd.mmd.PmxData import PmxModel, Bone, Vertex, Bdef1, Ik, IkLink
-from mmd.utils.MServiceUtils import get_file_encoding, calc_global_pos, separate_local_qq
+from mmd.utils.MServiceUtils import get_file_encoding, calc_global_pos, calc_global_pos_range, calc_leg_fk2ik_range, separate_local_qq
+from mmd.utils.MJointUtils import JointStore
 
 logger = MLogger(__name__, level=1)
 
@@ -50,446 +51,498 @@ def execute(args):
         # 全人物分の順番別フォルダ
         ordered_person_dir_pathes = sorted(glob.glob(os.path.join(args.img_dir, "smooth", "*")), key=sort_by_numeric)
 
-        smooth_pattern = re.compile(r'^smooth_(\d+)\.')
-        start_z = 9999999999
+        # 最初の人物の深度を0にする(全人物で共通なので先に求めておく)
+        start_z = calc_start_z(args, ordered_person_dir_pathes)
 
-        for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes):    
-            logger.info("【No.{0}】FKボーン角度計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+        # 人物ごとに(並列で)モーション生成
+        execute_by_person(args.jobs, execute_motion_person, [(args, model, oidx, ordered_person_dir_path, motion_dir_path, process_datetime, start_z) \
+                                                            for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes)])
 
-            smooth_json_pathes = sorted(glob.glob(os.path.join(ordered_person_dir_path, "smooth_*.json")), key=sort_by_numeric)
+        logger.info('モーション生成処理全件終了', decoration=MLogger.DECORATION_BOX)
+
+        return True
+    except Exception as e:
+        logger.critical("モーション生成で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
+        return False
 
-            motion = VmdMotion()
-            all_frame_joints = {}
-            prev_fno = 9999999999
+# 人物ごとのモーション生成(フレーム並列用のプロセスプールは人物ごとに開き、終わったら閉じる)
+def execute_motion_person(args, model: PmxModel, oidx: int, ordered_person_dir_path: str, motion_dir_path: str, process_datetime: str, start_z: float):
+    with frame_executor(args.frame_jobs):
+        return create_motion_person(args, model, oidx, ordered_person_dir_path, motion_dir_path, process_datetime, start_z)
+
+
+# 人物ごとのモーション生成
+def create_motion_person(args, model: PmxModel, oidx: int, ordered_person_dir_path: str, motion_dir_path: str, process_datetime: str, start_z: float):
+    smooth_pattern = re.compile(r'^smooth_(\d+)\.')
+
+    logger.info("【No.{0}】FKボーン角度計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+    # 人物別のスムージング済み関節情報
+    smooth_store = JointStore(ordered_person_dir_path, json_pattern="smooth_*.json")
+    smooth_json_pathes = smooth_store.glob("smooth_*.json")
+
+    motion = VmdMotion()
+    all_frame_joints = {}
+    prev_fno = 9999999999
+
+    right_leg_lengths = []
+    left_leg_lengths = []
+    leg_lengths = []
+    # foot_ys = []
+    leg_degrees = []
+    flip_fnos = []
+    # KEY: 処理対象ボーン名, VALUE: 誤差許容範囲
+    target_bone_names = {}
+
+    for sidx, smooth_json_path in enumerate(tqdm(smooth_json_pathes, desc=f"No.{oidx:03} ... ")):
+        m = smooth_pattern.match(os.path.basename(smooth_json_path))
+        if m:
+            # キーフレの場所を確定（間が空く場合もある）
+            fno = int(m.groups()[0])
+
+            frame_joints = smooth_store.get(smooth_json_path)
+            all_frame_joints[fno] = frame_joints
+
+            left_hip_vec = get_vec3(all_frame_joints[fno]["joints"], "left_hip")
+            left_foot_vec = get_vec3(all_frame_joints[fno]["joints"], "left_foot")
+            right_hip_vec = get_vec3(all_frame_joints[fno]["joints"], "right_hip")
+            right_foot_vec = get_vec3(all_frame_joints[fno]["joints"], "right_foot")
+
+            right_leg_lengths.append(right_hip_vec.distanceToPoint(right_foot_vec))
+            left_leg_lengths.append(left_hip_vec.distanceToPoint(left_foot_vec))
+            # 両足の長さを平均
+            leg_lengths.append(np.mean([left_hip_vec.distanceToPoint(left_foot_vec), right_hip_vec.distanceToPoint(right_foot_vec)]))
+            # # 踵の位置を平均
+            # foot_ys.append(np.mean([left_foot_vec.y(), right_foot_vec.y()]))
+
+            if args.body_motion == 1 or args.face_motion == 1:
+
+                is_flip = False
+                if prev_fno < fno and sorted(all_frame_joints.keys())[-1] <= sorted(all_frame_joints.keys())[-2] + 2:
+                    # 前のキーフレがある場合、体幹に近いボーンが反転していたらスルー(直近が3フレーム以上離れていたらスルーなし)
+                    for ljname in ['left_hip', 'left_shoulder']:
+                        rjname = ljname.replace('left', 'right')
+                        prev_lsign = np.sign(all_frame_joints[prev_fno]["joints"][ljname]["x"] - all_frame_joints[prev_fno]["joints"]["pelvis"]["x"])
+                        prev_rsign = np.sign(all_frame_joints[prev_fno]["joints"][rjname]["x"] - all_frame_joints[prev_fno]["joints"]["pelvis"]["x"])
+                        lsign = np.sign(all_frame_joints[fno]["joints"][ljname]["x"] - all_frame_joints[fno]["joints"]["pelvis"]["x"])
+                        rsign = np.sign(all_frame_joints[fno]["joints"][rjname]["x"] - all_frame_joints[fno]["joints"]["pelvis"]["x"])
+                        ldiff = abs(np.diff([all_frame_joints[prev_fno]["joints"][ljname]["x"], all_frame_joints[fno]["joints"][ljname]["x"]]))
+                        rdiff = abs(np.diff([all_frame_joints[prev_fno]["joints"][rjname]["x"], all_frame_joints[fno]["joints"][rjname]["x"]]))
+                        lrdiff = abs(np.diff([all_frame_joints[fno]["joints"][ljname]["x"], all_frame_joints[fno]["joints"][rjname]["x"]]))
+
+                        if prev_lsign != lsign and prev_rsign != rsign and ldiff > 0.15 and rdiff > 0.15 and lrdiff > 0.15:
+                            is_flip = True
+                            break
+
+                if is_flip:
+                    flip_fnos.append(fno)
+                    continue
+
+                for jname, (bone_name, name_list, parent_list, initial_qq, ranges, diff_limits, is_hand, is_head) in VMD_CONNECTIONS.items():
+                    if name_list is None:
+                        continue
 
-            right_leg_lengths = []
-            left_leg_lengths = []
-            leg_lengths = []
-            # foot_ys = []
-            leg_degrees = []
-            flip_fnos = []
-            # KEY: 処理対象ボーン名, VALUE: 誤差許容範囲
-            target_bone_names = {}
-        
-            for sidx, smooth_json_path in enumerate(tqdm(smooth_json_pathes, desc=f"No.{oidx:03} ... ")):
-                m = smooth_pattern.match(os.path.basename(smooth_json_path))
-                if m:
-                    # キーフレの場所を確定（間が空く場合もある）
-                    fno = int(m.groups()[0])
-
-                    frame_joints = {}
-                    with open(smooth_json_path, 'r', encoding='utf-8') as f:
-                        frame_joints = json.load(f)
-                    all_frame_joints[fno] = frame_joints
-
-                    left_hip_vec = get_vec3(all_frame_joints[fno]["joints"], "left_hip")
-                    left_foot_vec = get_vec3(all_frame_joints[fno]["joints"], "left_foot")
-                    right_hip_vec = get_vec3(all_frame_joints[fno]["joints"], "right_hip")
-                    right_foot_vec = get_vec3(all_frame_joints[fno]["joints"], "right_foot")
-
-                    right_leg_lengths.append(right_hip_vec.distanceToPoint(right_foot_vec))
-                    left_leg_lengths.append(left_hip_vec.distanceToPoint(left_foot_vec))
-                    # 両足の長さを平均
-                    leg_lengths.append(np.mean([left_hip_vec.distanceToPoint(left_foot_vec), right_hip_vec.distanceToPoint(right_foot_vec)]))
-                    # # 踵の位置を平均
-                    # foot_ys.append(np.mean([left_foot_vec.y(), right_foot_vec.y()]))
-
-                    if args.body_motion == 1 or args.face_motion == 1:
-                        
-                        is_flip = False
-                        if prev_fno < fno and sorted(all_frame_joints.keys())[-1] <= sorted(all_frame_joints.keys())[-2] + 2:
-                            # 前のキーフレがある場合、体幹に近いボーンが反転していたらスルー(直近が3フレーム以上離れていたらスルーなし)
-                            for ljname in ['left_hip', 'left_shoulder']:
-                                rjname = ljname.replace('left', 'right')
-                                prev_lsign = np.sign(all_frame_joints[prev_fno]["joints"][ljname]["x"] - all_frame_joints[prev_fno]["joints"]["pelvis"]["x"])
-                                prev_rsign = np.sign(all_frame_joints[prev_fno]["joints"][rjname]["x"] - all_frame_joints[prev_fno]["joints"]["pelvis"]["x"])
-                                lsign = np.sign(all_frame_joints[fno]["joints"][ljname]["x"] - all_frame_joints[fno]["joints"]["pelvis"]["x"])
-                                rsign = np.sign(all_frame_joints[fno]["joints"][rjname]["x"] - all_frame_joints[fno]["joints"]["pelvis"]["x"])
-                                ldiff = abs(np.diff([all_frame_joints[prev_fno]["joints"][ljname]["x"], all_frame_joints[fno]["joints"][ljname]["x"]]))
-                                rdiff = abs(np.diff([all_frame_joints[prev_fno]["joints"][rjname]["x"], all_frame_joints[fno]["joints"][rjname]["x"]]))
-                                lrdiff = abs(np.diff([all_frame_joints[fno]["joints"][ljname]["x"], all_frame_joints[fno]["joints"][rjname]["x"]]))
-
-                                if prev_lsign != lsign and prev_rsign != rsign and ldiff > 0.15 and rdiff > 0.15 and lrdiff > 0.15:
-                                    is_flip = True
-                                    break
-                        
-                        if is_flip:
-                            flip_fnos.append(fno)
+                    if not args.hand_motion == 1 and is_hand:
+                        # 手トレースは手ON時のみ
+                        continue
+
+                    if args.body_motion == 0 and args.face_motion == 1 and not is_head:
+                        continue
+
+                    # 前のキーフレから大幅に離れていたらスルー
+                    if prev_fno < fno and jname in all_frame_joints[prev_fno]["joints"]:
+                        if abs(all_frame_joints[prev_fno]["joints"][jname]["x"] - all_frame_joints[fno]["joints"][jname]["x"]) > 0.1:
                             continue
 
-                        for jname, (bone_name, name_list, parent_list, initial_qq, ranges, diff_limits, is_hand, is_head) in VMD_CONNECTIONS.items():
-                            if name_list is None:
-                                continue
+                    bf = VmdBoneFrame(fno)
+                    bf.set_name(bone_name)
 
-                            if not args.hand_motion == 1 and is_hand:
-                                # 手トレースは手ON時のみ
-                                continue
-                            
-                            if args.body_motion == 0 and args.face_motion == 1 and not is_head:
-                                continue
-                            
-                            # 前のキーフレから大幅に離れていたらスルー
-                            if prev_fno < fno and jname in all_frame_joints[prev_fno]["joints"]:
-                                if abs(all_frame_joints[prev_fno]["joints"][jname]["x"] - all_frame_joints[fno]["joints"][jname]["x"]) > 0.1:
-                                    continue
-
-                            bf = VmdBoneFrame(fno)
-                            bf.set_name(bone_name)
-                            
-                            if len(name_list) == 4:
-                                rotation = calc_direction_qq(bf.fno, motion, frame_joints, *name_list)
-                                initial = calc_bone_direction_qq(bf, motion, model, jname, *name_list)
-                            else:
-                                rotation = calc_direction_qq2(bf.fno, motion, frame_joints, *name_list)
-                                initial = calc_bone_direction_qq2(bf, motion, model, jname, *name_list)
-
-                            qq = MQuaternion()
-                            for parent_name in reversed(parent_list):
-                                qq *= motion.calc_bf(parent_name, bf.fno).rotation.inverted()
-                            bf.rotation = qq * initial_qq * rotation * initial.inverted()
-
-                            motion.regist_bf(bf, bf.name, bf.fno, is_key=(not is_flip))
-                            target_bone_names[bf.name] = diff_limits
-                                
-                    if "faces" in frame_joints and args.face_motion == 1:
-                        # 表情がある場合出力
-                        # まばたき・視線の向き
-                        left_eye_euler = calc_left_eye(fno, motion, frame_joints)
-                        right_eye_euler = calc_right_eye(fno, motion, frame_joints)
-                        blend_eye(fno, motion, left_eye_euler, right_eye_euler)
-                        target_bone_names["両目"] = VMD_CONNECTIONS["nose"][5]
-
-                        # 口
-                        calc_lip(fno, motion, frame_joints)
-
-                        # 眉
-                        calc_eyebrow(fno, motion, frame_joints)
-                    
-                    prev_fno = fno
-
-            start_fno = sorted(all_frame_joints.keys())[0]
-            last_fno = sorted(all_frame_joints.keys())[-1]
-            fnos = list(range(start_fno, last_fno + 1))
-
-            if args.body_motion == 1:
-
-                if args.smooth_key == 1:
-                    logger.info("【No.{0}】スムージング開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-
-                    with tqdm(total=(((len(list(target_bone_names.keys())) - 3) * len(fnos) * 3) + (3 * len(fnos)))) as pchar:
-                        for bone_name in target_bone_names.keys():
-                            xvalues = []
-                            yvalues = []
-                            zvalues = []
-
-                            for fidx, fno in enumerate(fnos):
-                                pchar.update(1)
-                                prev_fno, next_fno = motion.get_bone_prev_next_fno(bone_name, fno=fno, is_key=True)
-
-                                prev_bf = motion.calc_bf(bone_name, prev_fno)
-                                next_bf = motion.calc_bf(bone_name, next_fno)
-
-                                if fno in flip_fnos or fno not in all_frame_joints:
-                                    # キーフレがないフレームの場合、前後の線形補間
-                                    if fidx == 0:
-                                        xvalues.append(0)
-                                        yvalues.append(0)
-                                        zvalues.append(0)
-                                    else:
-                                        now_rot = MQuaternion.slerp(prev_bf.rotation, next_bf.rotation, ((fno - prev_fno) / (next_fno - prev_fno)))
-                                        now_euler = now_rot.toEulerAngles()
-                                        xvalues.append(now_euler.x())
-                                        yvalues.append(now_euler.y())
-                                        zvalues.append(now_euler.z())
-                                    continue
-
-                                now_bf = motion.calc_bf(bone_name, fno)
-
-                                # 前のキーフレから大きく変化しすぎてる場合、前後の線形補間をコピーしてスルー
-                                if fidx > 0:
-                                    dot = MQuaternion.dotProduct(now_bf.rotation, prev_bf.rotation)
-                                    if dot < 1 - ((now_bf.fno - prev_bf.fno) * (0.2 if bone_name in ["上半身", "下半身"] else 0.1)):
-                                        now_rot = MQuaternion.slerp(prev_bf.rotation, next_bf.rotation, ((fno - prev_fno) / (next_fno - prev_fno)))
-                                        now_euler = now_rot.toEulerAngles()
-                                        xvalues.append(now_euler.x())
-                                        yvalues.append(now_euler.y())
-                                        zvalues.append(now_euler.z())
-
-                                        # フリップに相当している場合、キーフレ削除
-                                        if fno in motion.bones[bone_name]:
-                                            del motion.bones[bone_name][fno]
-
-                                        if bone_name in ["上半身", "下半身"]:
-                                            # 体幹の場合、フリップに追加
-                                            flip_fnos.append(fno)
-
-                                        continue
-
-                                euler = now_bf.rotation.toEulerAngles()
-                                xvalues.append(euler.x())
-                                yvalues.append(euler.y())
-                                zvalues.append(euler.z())
-
-                            smooth_xs = []                            
-                            smooth_ys = []
-                            smooth_zs = []
-
-
-                            if bone_name in ["上半身2"]:
-                                # 強制的に平滑化
-                                smooth_xs = smooth_values(9, xvalues)
-                                smooth_ys = smooth_values(9, yvalues)
-                                smooth_zs = smooth_values(9, zvalues)
-
-                            elif bone_name in ["上半身", "下半身"]:
-                                smooth_xs = smooth_values(9, xvalues)
-                                smooth_zs = smooth_values(9, zvalues)
-
-                                # 体幹Yは回転を殺さないようフィルタスムージング
-                                ryfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                                smooth_ys = []
-                                for fidx, fno in enumerate(fnos):
-                                    smooth_ys.append(ryfilter(yvalues[fidx], fno))
-                                    pchar.update(1)
-
-                            elif bone_name in ["左手首", "右手首"]:
-                                # 他は強制的に平滑化
-                                smooth_xs = smooth_values(17, xvalues)
-                                smooth_ys = smooth_values(17, yvalues)
-                                smooth_zs = smooth_values(17, zvalues)
+                    if len(name_list) == 4:
+                        rotation = calc_direction_qq(bf.fno, motion, frame_joints, *name_list)
+                        initial = calc_bone_direction_qq(bf, motion, model, jname, *name_list)
+                    else:
+                        rotation = calc_direction_qq2(bf.fno, motion, frame_joints, *name_list)
+                        initial = calc_bone_direction_qq2(bf, motion, model, jname, *name_list)
 
+                    qq = MQuaternion()
+                    for parent_name in reversed(parent_list):
+                        qq *= motion.calc_bf(parent_name, bf.fno).rotation.inverted()
+                    bf.rotation = qq * initial_qq * rotation * initial.inverted()
+
+                    motion.regist_bf(bf, bf.name, bf.fno, is_key=(not is_flip))
+                    target_bone_names[bf.name] = diff_limits
+
+            if "faces" in frame_joints and args.face_motion == 1:
+                # 表情がある場合出力
+                # まばたき・視線の向き
+                left_eye_euler = calc_left_eye(fno, motion, frame_joints)
+                right_eye_euler = calc_right_eye(fno, motion, frame_joints)
+                blend_eye(fno, motion, left_eye_euler, right_eye_euler)
+                target_bone_names["両目"] = VMD_CONNECTIONS["nose"][5]
+
+                # 口
+                calc_lip(fno, motion, frame_joints)
+
+                # 眉
+                calc_eyebrow(fno, motion, frame_joints)
+
+            prev_fno = fno
+
+    start_fno = sorted(all_frame_joints.keys())[0]
+    last_fno = sorted(all_frame_joints.keys())[-1]
+    fnos = list(range(start_fno, last_fno + 1))
+
+    if args.body_motion == 1:
+
+        if args.smooth_key == 1:
+            logger.info("【No.{0}】スムージング開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+            with tqdm(total=(((len(list(target_bone_names.keys())) - 3) * len(fnos) * 3) + (3 * len(fnos)))) as pchar:
+                for bone_name in target_bone_names.keys():
+                    xvalues = []
+                    yvalues = []
+                    zvalues = []
+
+                    for fidx, fno in enumerate(fnos):
+                        pchar.update(1)
+                        prev_fno, next_fno = motion.get_bone_prev_next_fno(bone_name, fno=fno, is_key=True)
+
+                        prev_bf = motion.calc_bf(bone_name, prev_fno)
+                        next_bf = motion.calc_bf(bone_name, next_fno)
+
+                        if fno in flip_fnos or fno not in all_frame_joints:
+                            # キーフレがないフレームの場合、前後の線形補間
+                            if fidx == 0:
+                                xvalues.append(0)
+                                yvalues.append(0)
+                                zvalues.append(0)
                             else:
-                                rxfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                                ryfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                                rzfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                                for fidx, fno in enumerate(fnos):
-                                    smooth_xs.append(rxfilter(xvalues[fidx], fno))
-                                    smooth_ys.append(ryfilter(yvalues[fidx], fno))
-                                    smooth_zs.append(rzfilter(zvalues[fidx], fno))
-                                    pchar.update(1)
-
-                            for fidx, fno in enumerate(fnos):
-                                # 平滑化したのを登録
-                                if fno in flip_fnos and fno in motion.bones[bone_name] and bone_name in ["上半身", "下半身"]:
+                                now_rot = MQuaternion.slerp(prev_bf.rotation, next_bf.rotation, ((fno - prev_fno) / (next_fno - prev_fno)))
+                                now_euler = now_rot.toEulerAngles()
+                                xvalues.append(now_euler.x())
+                                yvalues.append(now_euler.y())
+                                zvalues.append(now_euler.z())
+                            continue
+
+                        now_bf = motion.calc_bf(bone_name, fno)
+
+                        # 前のキーフレから大きく変化しすぎてる場合、前後の線形補間をコピーしてスルー
+                        if fidx > 0:
+                            dot = MQuaternion.dotProduct(now_bf.rotation, prev_bf.rotation)
+                            if dot < 1 - ((now_bf.fno - prev_bf.fno) * (0.2 if bone_name in ["上半身", "下半身"] else 0.1)):
+                                now_rot = MQuaternion.slerp(prev_bf.rotation, next_bf.rotation, ((fno - prev_fno) / (next_fno - prev_fno)))
+                                now_euler = now_rot.toEulerAngles()
+                                xvalues.append(now_euler.x())
+                                yvalues.append(now_euler.y())
+                                zvalues.append(now_euler.z())
+
+                                # フリップに相当している場合、キーフレ削除
+                                if fno in motion.bones[bone_name]:
                                     del motion.bones[bone_name][fno]
-                                else:
-                                    now_bf = motion.calc_bf(bone_name, fno)
-                                    now_bf.rotation = MQuaternion.fromEulerAngles(smooth_xs[fidx], smooth_ys[fidx], smooth_zs[fidx])
-                                    motion.regist_bf(now_bf, now_bf.name, now_bf.fno, is_key=now_bf.key)
-                                pchar.update(1)
-
-                logger.info("【No.{0}】移動ボーン初期化開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-
-                for fidx, fno in enumerate(tqdm(fnos, desc=f"{oidx:03} ... ")):
-                    # 平滑化したのを登録
-                    if fno not in flip_fnos and fno in all_frame_joints:
-                        # センター・グルーブ・足IKは初期値
-                        center_bf = VmdBoneFrame(fno)
-                        center_bf.set_name("センター")
-                        motion.regist_bf(center_bf, center_bf.name, fno)
-                        target_bone_names["センター"] = VMD_CONNECTIONS["center"][5]
-
-                        groove_bf = VmdBoneFrame(fno)
-                        groove_bf.set_name("グルーブ")
-                        motion.regist_bf(groove_bf, groove_bf.name, fno)
-                        target_bone_names["グルーブ"] = VMD_CONNECTIONS["groove"][5]
-
-                        left_leg_ik_bf = VmdBoneFrame(fno)
-                        left_leg_ik_bf.set_name("左足ＩＫ")
-                        motion.regist_bf(left_leg_ik_bf, left_leg_ik_bf.name, fno)
-                        target_bone_names["左足ＩＫ"] = VMD_CONNECTIONS["leg_ik"][5]
-
-                        right_leg_ik_bf = VmdBoneFrame(fno)
-                        right_leg_ik_bf.set_name("右足ＩＫ")
-                        motion.regist_bf(right_leg_ik_bf, right_leg_ik_bf.name, fno)
-                        target_bone_names["右足ＩＫ"] = VMD_CONNECTIONS["leg_ik"][5]
-
-                    if fno in all_frame_joints:
-                        if fno not in flip_fnos:
-                            # フリップしてない場合、足の角度
-                            right_leg_bf = motion.calc_bf("右足", fno)
-                            right_knee_bf = motion.calc_bf("右ひざ", fno)
-                            left_leg_bf = motion.calc_bf("左足", fno)
-                            left_knee_bf = motion.calc_bf("左ひざ", fno)
-                            
-                            total_degree = 0
-                            right_leg_degree = right_leg_bf.rotation.toDegree()
-                            total_degree += right_leg_degree if right_leg_degree < 180 else 360 - right_leg_degree
-                            right_knee_degree = right_knee_bf.rotation.toDegree()
-                            total_degree += right_knee_degree if right_knee_degree < 180 else 360 - right_knee_degree
-                            left_leg_degree = left_leg_bf.rotation.toDegree()
-                            total_degree += left_leg_degree if left_leg_degree < 180 else 360 - left_leg_degree
-                            left_knee_degree = left_knee_bf.rotation.toDegree()
-                            total_degree += left_knee_degree if left_knee_degree < 180 else 360 - left_knee_degree
-                            leg_degrees.append(total_degree)
-                        else:
-                            # フリップしてる場合、対象外として最もデカいのを挿入
-                            leg_degrees.append(99999999)
-
-                logger.info("【No.{0}】直立姿勢計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-                
-                # 足とひざの角度が最も小さい（最も伸びている）を対象とする
-                degree_fidxs = np.argsort(leg_degrees)
-                upright_fidx = degree_fidxs[0]
-                upright_fno = list(all_frame_joints.keys())[upright_fidx]
-
-                # 直立キーフレの骨盤は地に足がついているとみなす
-                upright_pelvis_vec = calc_pelvis_vec(all_frame_joints, upright_fno, args)
-
-                logger.info("【No.{0}】直立キーフレ: {1}", f"{oidx:03}", upright_fno)
-
-                # かかと末端までのリンク
-                right_heel_links = model.create_link_2_top_one("右かかと", is_defined=False)
-                left_heel_links = model.create_link_2_top_one("左かかと", is_defined=False)
-
-                # つま先ＩＫまでのリンク
-                right_toe_ik_links = model.create_link_2_top_one("右つま先ＩＫ", is_defined=False)
-                left_toe_ik_links = model.create_link_2_top_one("左つま先ＩＫ", is_defined=False)
-
-                logger.info("【No.{0}】センター計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-                
-                pelvis_xs = []
-                pelvis_ys = []
-                pelvis_zs = []
-                for fidx, fno in enumerate(tqdm(fnos, desc=f"No.{oidx:03} ... ")):
-                    if fno in flip_fnos or fno not in all_frame_joints:
-                        # キーフレがないフレームの場合、前のをコピー
-                        if fidx == 0:
-                            pelvis_xs.append(0)
-                            pelvis_ys.append(0)
-                            pelvis_zs.append(0)
+
+                                if bone_name in ["上半身", "下半身"]:
+                                    # 体幹の場合、フリップに追加
+                                    flip_fnos.append(fno)
+
+                                continue
+
+                        euler = now_bf.rotation.toEulerAngles()
+                        xvalues.append(euler.x())
+                        yvalues.append(euler.y())
+                        zvalues.append(euler.z())
+
+                    smooth_xs = []                            
+                    smooth_ys = []
+                    smooth_zs = []
+
+
+                    if bone_name in ["上半身2"]:
+                        # 強制的に平滑化
+                        smooth_xs = smooth_values(9, xvalues)
+                        smooth_ys = smooth_values(9, yvalues)
+                        smooth_zs = smooth_values(9, zvalues)
+
+                    elif bone_name in ["上半身", "下半身"]:
+                        smooth_xs = smooth_values(9, xvalues)
+                        smooth_zs = smooth_values(9, zvalues)
+
+                        # 体幹Yは回転を殺さないようフィルタスムージング
+                        smooth_ys = one_euro_filter(yvalues, fnos, freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1).tolist()
+                        pchar.update(len(fnos))
+
+                    elif bone_name in ["左手首", "右手首"]:
+                        # 他は強制的に平滑化
+                        smooth_xs = smooth_values(17, xvalues)
+                        smooth_ys = smooth_values(17, yvalues)
+                        smooth_zs = smooth_values(17, zvalues)
+
+                    else:
+                        # XYZまとめてフィルタにかける
+                        smooth_xs, smooth_ys, smooth_zs = \
+                            one_euro_filter(np.array([xvalues, yvalues, zvalues], dtype=np.float64).T, fnos, \
+                                            freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1).T.tolist()
+                        pchar.update(len(fnos))
+
+                    for fidx, fno in enumerate(fnos):
+                        # 平滑化したのを登録
+                        if fno in flip_fnos and fno in motion.bones[bone_name] and bone_name in ["上半身", "下半身"]:
+                            del motion.bones[bone_name][fno]
                         else:
-                            pelvis_xs.append(pelvis_xs[-1])
-                            pelvis_ys.append(pelvis_ys[-1])
-                            pelvis_zs.append(pelvis_zs[-1])
+                            now_bf = motion.calc_bf(bone_name, fno)
+                            now_bf.rotation = MQuaternion.fromEulerAngles(smooth_xs[fidx], smooth_ys[fidx], smooth_zs[fidx])
+                            motion.regist_bf(now_bf, now_bf.name, now_bf.fno, is_key=now_bf.key)
+                        pchar.update(1)
+
+        logger.info("【No.{0}】移動ボーン初期化開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+        # センター・グルーブ・足IKは初期値(このループでは参照しないので、最後にまとめて登録する)
+        init_bfs = {"センター": [], "グルーブ": [], "左足ＩＫ": [], "右足ＩＫ": []}
+        for fidx, fno in enumerate(tqdm(fnos, desc=f"{oidx:03} ... ")):
+            # 平滑化したのを登録
+            if fno not in flip_fnos and fno in all_frame_joints:
+                for bone_name in init_bfs.keys():
+                    init_bf = VmdBoneFrame(fno)
+                    init_bf.set_name(bone_name)
+                    init_bfs[bone_name].append(init_bf)
+                target_bone_names["センター"] = VMD_CONNECTIONS["center"][5]
+                target_bone_names["グルーブ"] = VMD_CONNECTIONS["groove"][5]
+                target_bone_names["左足ＩＫ"] = VMD_CONNECTIONS["leg_ik"][5]
+                target_bone_names["右足ＩＫ"] = VMD_CONNECTIONS["leg_ik"][5]
+
+            if fno in all_frame_joints:
+                if fno not in flip_fnos:
+                    # フリップしてない場合、足の角度
+                    right_leg_bf = motion.calc_bf("右足", fno)
+                    right_knee_bf = motion.calc_bf("右ひざ", fno)
+                    left_leg_bf = motion.calc_bf("左足", fno)
+                    left_knee_bf = motion.calc_bf("左ひざ", fno)
+
+                    total_degree = 0
+                    right_leg_degree = right_leg_bf.rotation.toDegree()
+                    total_degree += right_leg_degree if right_leg_degree < 180 else 360 - right_leg_degree
+                    right_knee_degree = right_knee_bf.rotation.toDegree()
+                    total_degree += right_knee_degree if right_knee_degree < 180 else 360 - right_knee_degree
+                    left_leg_degree = left_leg_bf.rotation.toDegree()
+                    total_degree += left_leg_degree if left_leg_degree < 180 else 360 - left_leg_degree
+                    left_knee_degree = left_knee_bf.rotation.toDegree()
+                    total_degree += left_knee_degree if left_knee_degree < 180 else 360 - left_knee_degree
+                    leg_degrees.append(total_degree)
+                else:
+                    # フリップしてる場合、対象外として最もデカいのを挿入
+                    leg_degrees.append(99999999)
+
+        for bone_name, bfs in init_bfs.items():
+            motion.regist_bf_range(bfs, bone_name)
+
+        logger.info("【No.{0}】直立姿勢計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+        # 足とひざの角度が最も小さい（最も伸びている）を対象とする
+        degree_fidxs = np.argsort(leg_degrees)
+        upright_fidx = degree_fidxs[0]
+        upright_fno = list(all_frame_joints.keys())[upright_fidx]
+
+        # 直立キーフレの骨盤は地に足がついているとみなす
+        upright_pelvis_vec = calc_pelvis_vec(all_frame_joints, upright_fno, args)
+
+        logger.info("【No.{0}】直立キーフレ: {1}", f"{oidx:03}", upright_fno)
+
+        # かかと末端までのリンク
+        right_heel_links = model.create_link_2_top_one("右かかと", is_defined=False)
+        left_heel_links = model.create_link_2_top_one("左かかと", is_defined=False)
+
+        # つま先ＩＫまでのリンク
+        right_toe_ik_links = model.create_link_2_top_one("右つま先ＩＫ", is_defined=False)
+        left_toe_ik_links = model.create_link_2_top_one("左つま先ＩＫ", is_defined=False)
+
+        # ここ以降は同じフレームのグローバル位置を何度も求めるので、キャッシュする
+        motion.enable_pose_cache()
+
+        logger.info("【No.{0}】センター計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+        # かかと・つま先のグローバル位置は、全フレーム分をまとめて計算しておく
+        heel_fnos = [fno for fno in fnos if fno not in flip_fnos and fno in all_frame_joints]
+        heel_fidxs = {fno: fidx for fidx, fno in enumerate(heel_fnos)}
+        left_heel_link_idxs = {lname: lidx for lidx, lname in enumerate(left_heel_links.all().keys())}
+        right_heel_link_idxs = {lname: lidx for lidx, lname in enumerate(right_heel_links.all().keys())}
+        left_heel_global_3ds, _ = calc_global_pos_range(model, left_heel_links, motion, heel_fnos, jobs=args.frame_jobs)
+        right_heel_global_3ds, _ = calc_global_pos_range(model, right_heel_links, motion, heel_fnos, jobs=args.frame_jobs)
+
+        pelvis_xs = []
+        pelvis_ys = []
+        pelvis_zs = []
+        for fidx, fno in enumerate(tqdm(fnos, desc=f"No.{oidx:03} ... ")):
+            if fno in flip_fnos or fno not in all_frame_joints:
+                # キーフレがないフレームの場合、前のをコピー
+                if fidx == 0:
+                    pelvis_xs.append(0)
+                    pelvis_ys.append(0)
+                    pelvis_zs.append(0)
+                else:
+                    pelvis_xs.append(pelvis_xs[-1])
+                    pelvis_ys.append(pelvis_ys[-1])
+                    pelvis_zs.append(pelvis_zs[-1])
+                continue
+
+            pelvis_vec = calc_pelvis_vec(all_frame_joints, fno, args)
+
+            if start_z == 9999999999:
+                # 最初の人物の深度を0にする
+                start_z = pelvis_vec.z()
+
+            # Yは先に接地を検討する ----------
+            now_left_toe_vec = MVector3D(left_heel_global_3ds[heel_fidxs[fno], left_heel_link_idxs["左つま先"]])
+            now_left_heel_vec = MVector3D(left_heel_global_3ds[heel_fidxs[fno], left_heel_link_idxs["左かかと"]])
+            left_foot_vec = (now_left_toe_vec - now_left_heel_vec).normalized()
+
+            now_right_toe_vec = MVector3D(right_heel_global_3ds[heel_fidxs[fno], right_heel_link_idxs["右つま先"]])
+            now_right_heel_vec = MVector3D(right_heel_global_3ds[heel_fidxs[fno], right_heel_link_idxs["右かかと"]])
+            right_foot_vec = (now_right_toe_vec - now_right_heel_vec).normalized()
+
+            # かかとからつま先の向きが大体水平なら接地
+            diff_y = 0
+            if 0.2 > abs(left_foot_vec.y()) and 0.2 > abs(right_foot_vec.y()):
+                # 両足水平の場合
+                diff_y = min(now_left_toe_vec.y(), now_left_heel_vec.y(), now_right_toe_vec.y(), now_right_heel_vec.y())
+            elif 0.2 > abs(left_foot_vec.y()):
+                # 左足水平の場合
+                diff_y = min(now_left_toe_vec.y(), now_left_heel_vec.y())
+            elif 0.2 > abs(right_foot_vec.y()):
+                # 右足水平の場合
+                diff_y = min(now_right_toe_vec.y(), now_right_heel_vec.y())
+
+            pelvis_xs.append(pelvis_vec.x())
+            pelvis_ys.append(pelvis_vec.y() - upright_pelvis_vec.y() - diff_y)
+            pelvis_zs.append(pelvis_vec.z() - start_z)
+
+        logger.info("【No.{0}】センター登録開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+        smooth_pelvis_xs = smooth_values(9, pelvis_xs)
+        smooth_pelvis_ys = smooth_values(11, pelvis_ys)
+        smooth_pelvis_zs = smooth_values(11, pelvis_zs)
+
+        center_bfs = []
+        groove_bfs = []
+        for fidx, fno in enumerate(tqdm(fnos, desc=f"No.{oidx:03} ... ")):
+            center_bf = VmdBoneFrame()
+            center_bf.fno = fno
+            center_bf.set_name("センター")
+
+            # XZはセンター
+            center_bf.position.setX(smooth_pelvis_xs[fidx])
+            center_bf.position.setZ(smooth_pelvis_zs[fidx])
+            center_bfs.append(center_bf)
+
+            # Yはグルーブ
+            if args.upper_motion == 0:
+                groove_bf = VmdBoneFrame()
+                groove_bf.fno = fno
+                groove_bf.set_name("グルーブ")
+                groove_bf.position.setY(max(-7, smooth_pelvis_ys[fidx]))
+                groove_bfs.append(groove_bf)
+
+        motion.regist_bf_range(center_bfs, "センター")
+        motion.regist_bf_range(groove_bfs, "グルーブ")
+
+        logger.info("【No.{0}】右足IK計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+        convert_leg_fk2ik(oidx, all_frame_joints, motion, model, flip_fnos, "右", args.frame_jobs)
+
+        logger.info("【No.{0}】左足IK計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+        convert_leg_fk2ik(oidx, all_frame_joints, motion, model, flip_fnos, "左", args.frame_jobs)
+
+        logger.info("【No.{0}】足IK固定開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+        for fidx, fno in enumerate(tqdm(fnos, desc=f"No.{oidx:03} ... ")):
+            prev_fno, _ = motion.get_bone_prev_next_fno("センター", fno=fno, is_key=True)
+
+            # 画面内の関節位置から位置調整
+            check_proj_joints(model, motion, all_frame_joints, right_heel_links, left_heel_links, fidx, fno, prev_fno, True, right_toe_ik_links, left_toe_ik_links)
+
+        if args.smooth_key == 1:
+            logger.info("【No.{0}】足ＩＫスムージング開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+            with tqdm(total=(2 * len(fnos))) as pchar:
+                for bone_name in ["左足ＩＫ", "右足ＩＫ"]:
+                    # 処理対象のキーフレだけを取り出して、まとめてフィルタにかける
+                    target_fnos = []
+                    target_bfs = []
+                    for fidx, fno in enumerate(fnos):
+                        bf = motion.calc_bf(bone_name, fno)
+                        pchar.update(1)
+
+                        if fno in flip_fnos or fno not in all_frame_joints:
+                            continue
+
+                        target_fnos.append(fno)
+                        target_bfs.append(bf)
+
+                    if len(target_bfs) == 0:
                         continue
 
-                    pelvis_vec = calc_pelvis_vec(all_frame_joints, fno, args)
-
-                    if start_z == 9999999999:
-                        # 最初の人物の深度を0にする
-                        start_z = pelvis_vec.z()
-                    
-                    # Yは先に接地を検討する ----------
-                    now_left_heel_3ds_dic = calc_global_pos(model, left_heel_links, motion, fno)
-                    now_left_toe_vec = now_left_heel_3ds_dic["左つま先"]
-                    now_left_heel_vec = now_left_heel_3ds_dic["左かかと"]
-                    left_foot_vec = (now_left_toe_vec - now_left_heel_vec).normalized()
-
-                    now_right_heel_3ds_dic = calc_global_pos(model, right_heel_links, motion, fno)
-                    now_right_toe_vec = now_right_heel_3ds_dic["右つま先"]
-                    now_right_heel_vec = now_right_heel_3ds_dic["右かかと"]
-                    right_foot_vec = (now_right_toe_vec - now_right_heel_vec).normalized()
-
-                    # かかとからつま先の向きが大体水平なら接地
-                    diff_y = 0
-                    if 0.2 > abs(left_foot_vec.y()) and 0.2 > abs(right_foot_vec.y()):
-                        # 両足水平の場合
-                        diff_y = min(now_left_toe_vec.y(), now_left_heel_vec.y(), now_right_toe_vec.y(), now_right_heel_vec.y())
-                    elif 0.2 > abs(left_foot_vec.y()):
-                        # 左足水平の場合
-                        diff_y = min(now_left_toe_vec.y(), now_left_heel_vec.y())
-                    elif 0.2 > abs(right_foot_vec.y()):
-                        # 右足水平の場合
-                        diff_y = min(now_right_toe_vec.y(), now_right_heel_vec.y())
-
-                    pelvis_xs.append(pelvis_vec.x())
-                    pelvis_ys.append(pelvis_vec.y() - upright_pelvis_vec.y() - diff_y)
-                    pelvis_zs.append(pelvis_vec.z() - start_z)
-
-                logger.info("【No.{0}】センター登録開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-
-                smooth_pelvis_xs = smooth_values(9, pelvis_xs)
-                smooth_pelvis_ys = smooth_values(11, pelvis_ys)
-                smooth_pelvis_zs = smooth_values(11, pelvis_zs)
-
-                for fidx, fno in enumerate(tqdm(fnos, desc=f"No.{oidx:03} ... ")):
-                    center_bf = VmdBoneFrame()
-                    center_bf.fno = fno
-                    center_bf.set_name("センター")
-
-                    # XZはセンター
-                    center_bf.position.setX(smooth_pelvis_xs[fidx])
-                    center_bf.position.setZ(smooth_pelvis_zs[fidx])
-                    motion.regist_bf(center_bf, center_bf.name, fno)
-
-                    # Yはグルーブ
-                    if args.upper_motion == 0:
-                        groove_bf = VmdBoneFrame()
-                        groove_bf.fno = fno
-                        groove_bf.set_name("グルーブ")
-                        groove_bf.position.setY(max(-7, smooth_pelvis_ys[fidx]))
-                        motion.regist_bf(groove_bf, groove_bf.name, fno)
-
-                logger.info("【No.{0}】右足IK計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-                convert_leg_fk2ik(oidx, all_frame_joints, motion, model, flip_fnos, "右")
-
-                logger.info("【No.{0}】左足IK計算開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-                convert_leg_fk2ik(oidx, all_frame_joints, motion, model, flip_fnos, "左")
-
-                logger.info("【No.{0}】足IK固定開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-
-                for fidx, fno in enumerate(tqdm(fnos, desc=f"No.{oidx:03} ... ")):
-                    prev_fno, _ = motion.get_bone_prev_next_fno("センター", fno=fno, is_key=True)
-
-                    # 画面内の関節位置から位置調整
-                    check_proj_joints(model, motion, all_frame_joints, right_heel_links, left_heel_links, fidx, fno, prev_fno, True, right_toe_ik_links, left_toe_ik_links)
-
-                if args.smooth_key == 1:
-                    logger.info("【No.{0}】足ＩＫスムージング開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-
-                    with tqdm(total=(2 * len(fnos))) as pchar:
-                        for bone_name in ["左足ＩＫ", "右足ＩＫ"]:
-                            mxfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                            myfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                            mzfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                            rxfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                            ryfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-                            rzfilter = OneEuroFilter(freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1)
-
-                            for fidx, fno in enumerate(fnos):
-                                bf = motion.calc_bf(bone_name, fno)
-                                pchar.update(1)
-
-                                if fno in flip_fnos or fno not in all_frame_joints:
-                                    continue
-
-                                if model.bones[bone_name].getRotatable():
-                                    # 回転ありボーンの場合
-                                    euler = bf.rotation.toEulerAngles()
-                                    bf.rotation = MQuaternion.fromEulerAngles(rxfilter(euler.x(), fno), ryfilter(euler.y(), fno), rzfilter(euler.z(), fno))
-                                
-                                if model.bones[bone_name].getTranslatable():
-                                    # 移動ありボーンの場合
-                                    bf.position.setX(mxfilter(bf.position.x(), fno))
-                                    bf.position.setY(myfilter(bf.position.y(), fno))
-                                    bf.position.setZ(mzfilter(bf.position.z(), fno))
-                                
-                                motion.regist_bf(bf, bone_name, fno, is_key=bf.key)
-
-            if args.face_motion == 1:
-                # モーフはキーフレ上限があるので、削除処理を入れておく
-                logger.info("【No.{0}】モーフスムージング", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-                for morph_name in tqdm(motion.morphs.keys(), desc=f"No.{oidx:03} ... "):
-                    motion.smooth_filter_mf(0, morph_name, config={"freq": 30, "mincutoff": 0.1, "beta": 1, "dcutoff": 1})
-        
-                logger.info("【No.{0}】不要モーフ削除処理", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-                for morph_name in tqdm(motion.morphs.keys(), desc=f"No.{oidx:03} ... "):
-                    motion.remove_unnecessary_mf(0, morph_name, threshold=0.05)
+                    if model.bones[bone_name].getRotatable():
+                        # 回転ありボーンの場合
+                        eulers = one_euro_filter([bf.rotation.toEulerAngles().data() for bf in target_bfs], target_fnos, \
+                                                 freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1).tolist()
 
-            logger.info("【No.{0}】モーション生成開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-            motion_path = os.path.join(motion_dir_path, "output_{0}_no{1:03}.vmd".format(process_datetime, oidx))
-            writer = VmdWriter(model, motion, motion_path)
-            writer.write()
+                    if model.bones[bone_name].getTranslatable():
+                        # 移動ありボーンの場合
+                        positions = one_euro_filter([bf.position.data() for bf in target_bfs], target_fnos, \
+                                                    freq=30, mincutoff=1, beta=0.000000000000001, dcutoff=1).tolist()
 
-            logger.info("【No.{0}】モーション生成終了: {1}", f"{oidx:03}", motion_path, decoration=MLogger.DECORATION_BOX)
+                    for tidx, (fno, bf) in enumerate(zip(target_fnos, target_bfs)):
+                        if model.bones[bone_name].getRotatable():
+                            bf.rotation = MQuaternion.fromEulerAngles(*eulers[tidx])
 
-        logger.info('モーション生成処理全件終了', decoration=MLogger.DECORATION_BOX)
+                        if model.bones[bone_name].getTranslatable():
+                            bf.position.setX(positions[tidx][0])
+                            bf.position.setY(positions[tidx][1])
+                            bf.position.setZ(positions[tidx][2])
+
+                        motion.regist_bf(bf, bone_name, fno, is_key=bf.key)
+
+    if args.face_motion == 1:
+        # モーフはキーフレ上限があるので、削除処理を入れておく
+        logger.info("【No.{0}】モーフスムージング", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+        for morph_name in tqdm(motion.morphs.keys(), desc=f"No.{oidx:03} ... "):
+            motion.smooth_filter_mf(0, morph_name, config={"freq": 30, "mincutoff": 0.1, "beta": 1, "dcutoff": 1})
+
+        logger.info("【No.{0}】不要モーフ削除処理", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+        for morph_name in tqdm(list(motion.morphs.keys()), desc=f"No.{oidx:03} ... "):
+            before_cnt, after_cnt, err = motion.compact_mf(morph_name, tolerance=0.05, budget=args.key_budget)
+            logger.debug("{0}: キー数 {1} -> {2}, 最大誤差: {3}", morph_name, before_cnt, after_cnt, err)
+
+    if args.remove_key == 1:
+        # 全フレームにキーを打っているので、補間曲線で許容誤差に収まる範囲のキーを間引く(remove_unnecessary_bf)
+        logger.info("【No.{0}】不要キー削除処理", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+        for bone_name in tqdm(list(motion.bones.keys()), desc=f"No.{oidx:03} ... "):
+            is_rot = model.bones[bone_name].getRotatable() if bone_name in model.bones else True
+            is_mov = model.bones[bone_name].getTranslatable() if bone_name in model.bones else True
+            before_cnt, after_cnt, rot_err, mov_err = motion.compact_bf(bone_name, is_rot, is_mov, rot_tolerance=args.key_rot_tolerance, \
+                                                                        mov_tolerance=args.key_mov_tolerance, budget=args.key_budget)
+            logger.info("【No.{0}】{1}: キー数 {2} -> {3}, 最大誤差 回転: {4:.3f}度, 移動: {5:.3f}", f"{oidx:03}", bone_name, before_cnt, after_cnt, rot_err, mov_err)
+
+    logger.info("【No.{0}】モーション生成開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+    motion_path = os.path.join(motion_dir_path, "output_{0}_no{1:03}.vmd".format(process_datetime, oidx))
+    writer = VmdWriter(model, motion, motion_path)
+    writer.write()
+
+    logger.info("【No.{0}】モーション生成終了: {1}", f"{oidx:03}", motion_path, decoration=MLogger.DECORATION_BOX)
+
+    return True
+
+
+# 最初の人物の最初のキーフレの深度
+def calc_start_z(args, ordered_person_dir_pathes: list):
+    if len(ordered_person_dir_pathes) == 0:
+        return 9999999999
+
+    smooth_store = JointStore(ordered_person_dir_pathes[0], json_pattern="smooth_*.json")
+    smooth_json_pathes = smooth_store.glob("smooth_*.json")
+    if len(smooth_json_pathes) == 0:
+        return 9999999999
+
+    first_fno = int(re.compile(r'^smooth_(\d+)\.').match(os.path.basename(smooth_json_pathes[0])).groups()[0])
+    return calc_pelvis_vec({first_fno: smooth_store.get(smooth_json_pathes[0])}, first_fno, args).z()
 
-        return True
-    except Exception as e:
-        logger.critical("モーション生成で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
-        return False
 
 # 平滑化
 def smooth_values(delimiter: int, values: list):
@@ -778,79 +831,29 @@ def create_projection_view(image_size: list, sensor_width: float, focal_length_i
     return mat
 
 # 足ＩＫ変換処理実行
-def convert_leg_fk2ik(oidx: int, all_frame_joints: dict, motion: VmdMotion, model: PmxModel, flip_fnos: list, direction: str):
+def convert_leg_fk2ik(oidx: int, all_frame_joints: dict, motion: VmdMotion, model: PmxModel, flip_fnos: list, direction: str, jobs=1):
     leg_ik_bone_name = "{0}足ＩＫ".format(direction)
-    toe_ik_bone_name = "{0}つま先ＩＫ".format(direction)
     leg_bone_name = "{0}足".format(direction)
     knee_bone_name = "{0}ひざ".format(direction)
     ankle_bone_name = "{0}足首".format(direction)
-    toe_bone_name = "{0}つま先".format(direction)
-    heel_bone_name = "{0}かかと".format(direction)
-
-    # 足FK末端までのリンク
-    fk_links = model.create_link_2_top_one(heel_bone_name, is_defined=False)
-    # 足IK末端までのリンク
-    ik_links = model.create_link_2_top_one(leg_ik_bone_name, is_defined=False)
-    # つま先IK末端までのリンク
-    toe_ik_links = model.create_link_2_top_one(toe_ik_bone_name, is_defined=False)
-    # つま先（足首の子ボーン）の名前
-    ankle_child_bone_name = model.bone_indexes[model.bones[toe_ik_bone_name].ik.target_index]
-    # つま先末端までのリンク
-    toe_fk_links = model.create_link_2_top_one(ankle_child_bone_name, is_defined=False)
-
-    fnos = motion.get_bone_fnos(leg_bone_name, knee_bone_name, ankle_bone_name)
-
-    ik_parent_name = ik_links.get(leg_ik_bone_name, offset=-1).name
-    
-    # 足IKの移植
-    # logger.info("【No.{0}】{1}足IK移植", f"{oidx:03}", direction)
-    fno = 0
-    for fidx, fno in enumerate(tqdm(fnos, desc=f"No.{oidx:03} ... ")):
-        if fno in flip_fnos or fno not in all_frame_joints:
-            # フリップはセンター計算もおかしくなるのでスキップ
-            continue
 
-        leg_fk_3ds_dic = calc_global_pos(model, fk_links, motion, fno)
-        _, leg_ik_matrixs = calc_global_pos(model, ik_links, motion, fno, return_matrix=True)
+    # フリップはセンター計算もおかしくなるのでスキップ
+    fnos = [fno for fno in motion.get_bone_fnos(leg_bone_name, knee_bone_name, ankle_bone_name) if fno not in flip_fnos and fno in all_frame_joints]
+    if len(fnos) == 0:
+        return
 
-        # 足首の角度がある状態での、つま先までのグローバル位置
-        leg_toe_fk_3ds_dic = calc_global_pos(model, toe_fk_links, motion, fno)
-
-        # IKの親から見た相対位置
-        leg_ik_parent_matrix = leg_ik_matrixs[ik_parent_name]
+    # 足ＩＫの移植
+    # 各フレームの足ＩＫは、そのフレームの足FKの姿勢だけで決まるので、全フレームまとめて計算する
+    positions, rotations = calc_leg_fk2ik_range(model, motion, fnos, direction, jobs=jobs)
 
+    leg_ik_bfs = []
+    for fidx, fno in enumerate(tqdm(fnos, desc=f"No.{oidx:03} ... ")):
         bf = motion.calc_bf(leg_ik_bone_name, fno)
-        # 足ＩＫの位置は、足ＩＫの親から見た足首のローカル位置（足首位置マイナス）
-        bf.position = leg_ik_parent_matrix.inverted() * (leg_fk_3ds_dic[ankle_bone_name] - (model.bones[ankle_bone_name].position - model.bones[ik_parent_name].position))
-        bf.rotation = MQuaternion()
-
-        # 一旦足ＩＫの位置が決まった時点で登録
-        motion.regist_bf(bf, leg_ik_bone_name, fno)
-        # 足ＩＫ回転なし状態でのつま先までのグローバル位置
-        leg_ik_3ds_dic, leg_ik_matrisxs = calc_global_pos(model, toe_ik_links, motion, fno, return_matrix=True)
-
-        # つま先のローカル位置
-        ankle_child_initial_local_pos = leg_ik_matrisxs[leg_ik_bone_name].inverted() * leg_ik_3ds_dic[toe_ik_bone_name]
-        ankle_child_local_pos = leg_ik_matrisxs[leg_ik_bone_name].inverted() * leg_toe_fk_3ds_dic[ankle_child_bone_name]
-
-        # 足ＩＫの回転は、足首から見たつま先の方向
-        bf.rotation = MQuaternion.rotationTo(ankle_child_initial_local_pos, ankle_child_local_pos)
-
-        toe_vec = leg_fk_3ds_dic[toe_bone_name]
-        heel_vec = leg_fk_3ds_dic[heel_bone_name]
-        foot_vec = (toe_vec - heel_vec).normalized()
-
-        # かかとからつま先の向きが大体水平なら接地
-        if 0.2 > abs(foot_vec.y()):
-            diff_y = max(0, min(toe_vec.y(), heel_vec.y()))
-            bf.position.setY(max(0, bf.position.y() - diff_y))
-        motion.regist_bf(bf, leg_ik_bone_name, fno)
-
-        # つま先が地面にめり込んでたら上げる
-        leg_ik_3ds_dic = calc_global_pos(model, toe_ik_links, motion, fno)
-        if leg_ik_3ds_dic[toe_ik_bone_name].y() < 0:
-            bf.position.setY(max(0, bf.position.y() - leg_ik_3ds_dic[toe_ik_bone_name].y()))
-        motion.regist_bf(bf, leg_ik_bone_name, fno)
+        bf.position = MVector3D(positions[fidx])
+        bf.rotation = MQuaternion(rotations[fidx])
+        leg_ik_bfs.append(bf)
+
+    motion.regist_bf_range(leg_ik_bfs, leg_ik_bone_name)
 
 def calc_direction_qq(bf: VmdBoneFrame, motion: VmdMotion, joints: dict, direction_from_name: str, direction_to_name: str, up_from_name: str, up_to_name: str):
     direction_from_vec = get_vec3(joints["joints"], direction_from_name)
@@ -16,6 +16,8 @@ from tqdm import tqdm
 
 from mmd.utils.MLogger import MLogger
 from mmd.utils.MServiceUtils import sort_by_numeric
+from mmd.utils.MVideoUtils import get_frame_pathes, read_frame
+from mmd.utils.MJointUtils import JointStore
 from mmd.mmd.VmdData import OneEuroFilter
 from lighttrack.visualizer.detection_visualizer import draw_bbox
 
@@ -53,12 +55,18 @@ def execute(args):
             shutil.rmtree(os.path.join(args.img_dir, "ordered"))
 
         ordered_dir_pathes = []
+        ordered_stores = []
         for oidx, _ in enumerate(order_list):
             ordered_dir_path = os.path.join(args.img_dir, "ordered", f"{oidx:03}")
             os.makedirs(ordered_dir_path, exist_ok=True)
             ordered_dir_pathes.append(ordered_dir_path)
+            # 人物別の関節情報
+            ordered_stores.append(JointStore(ordered_dir_path, export_json=args.export_json, overwrite=True))
 
-        process_img_pathes = sorted(glob.glob(os.path.join(args.img_dir, "frames", "**", "frame_*.png")), key=sort_by_numeric)
+        # 姿勢推定結果
+        joint_store = JointStore(os.path.join(args.img_dir, "frames"), json_pattern=os.path.join("*", "frame_*.json"))
+
+        process_img_pathes = get_frame_pathes(args.img_dir)
 
         # 順番指定後はDLを早くするため、mp4のままとする
         ordered_bbox_path = os.path.join(args.img_dir, "ordered_bbox.mp4")
@@ -69,7 +77,7 @@ def execute(args):
         avi_height = 0
         if len(process_img_pathes) > 0:
             process_img_path = process_img_pathes[0]
-            img = cv2.imread(process_img_path)
+            img = read_frame(process_img_path)
             # scale = min(1, 2000 / len(process_img_pathes))
             scale = 1
             avi_width = int(img.shape[1] * scale)
@@ -86,44 +94,41 @@ def execute(args):
                 os.remove(bbox_path)
 
             # 入力画像パス
-            out_frame = cv2.imread(process_img_path)
+            out_frame = read_frame(process_img_path)
             # 人数分読み込む
-            joint_json_pathes = sorted(glob.glob(os.path.join(args.img_dir, "frames", f"{iidx:012}", "frame_*.json")), key=sort_by_numeric)
+            joint_json_pathes = joint_store.glob(os.path.join(f"{iidx:012}", "frame_*.json"))
 
             for joint_json_path in joint_json_pathes:
-                with open(joint_json_path, 'r') as f:
-                    bbox_frame = json.load(f)
-                    track_id = bbox_frame['track_id']
-                    for oidx, order_idxs in enumerate(order_list):
-                        if str(track_id) in order_idxs:
-                            # 追跡IDXが順番指定ファイルにある場合、採用してファイルコピー
-                            ordered_dir_path = os.path.join(args.img_dir, "ordered", f"{oidx:03}")
-                            shutil.copy(joint_json_path, ordered_dir_path)
-
-                            bbox = [bbox_frame['bbox']['x'], bbox_frame['bbox']['y'], bbox_frame['bbox']['width'], bbox_frame['bbox']['height']]
-
-                            # bbox描画
-                            out_frame = draw_bbox(out_frame, bbox, 1, None, track_id=oidx)
-                        else:
-                            # 追跡IDXそのものがない場合、フレーム途中までの指定がないかチェック
-                            for order_idx_str in order_idxs:
-                                m = order_pattern.match(order_idx_str)
-                                if m:
-                                    # 正規表現グループを分解
-                                    order_idx, order_startf_str, order_endf_str = m.groups()
-                                    if str(track_id) == order_idx:
-                                        # INDEXが見つかった場合、フレームの開始と終了を確認する
-                                        order_startf = 0 if not order_startf_str else int(order_startf_str)
-                                        order_endf = sys.maxsize if not order_endf_str else int(order_endf_str)
-                                        if order_startf <= iidx <= order_endf:
-                                            # フレーム範囲内である場合、採用
-                                            ordered_dir_path = os.path.join(args.img_dir, "ordered", f"{oidx:03}")
-                                            shutil.copy(joint_json_path, ordered_dir_path)
-
-                                            bbox = [bbox_frame['bbox']['x'], bbox_frame['bbox']['y'], bbox_frame['bbox']['width'], bbox_frame['bbox']['height']]
-
-                                            # bbox描画
-                                            out_frame = draw_bbox(out_frame, bbox, 1, None, track_id=oidx)
+                bbox_frame = joint_store.get(joint_json_path)
+                track_id = bbox_frame['track_id']
+                for oidx, order_idxs in enumerate(order_list):
+                    if str(track_id) in order_idxs:
+                        # 追跡IDXが順番指定ファイルにある場合、採用して人物別に登録
+                        ordered_stores[oidx].set(os.path.basename(joint_json_path), bbox_frame)
+
+                        bbox = [bbox_frame['bbox']['x'], bbox_frame['bbox']['y'], bbox_frame['bbox']['width'], bbox_frame['bbox']['height']]
+
+                        # bbox描画
+                        out_frame = draw_bbox(out_frame, bbox, 1, None, track_id=oidx)
+                    else:
+                        # 追跡IDXそのものがない場合、フレーム途中までの指定がないかチェック
+                        for order_idx_str in order_idxs:
+                            m = order_pattern.match(order_idx_str)
+                            if m:
+                                # 正規表現グループを分解
+                                order_idx, order_startf_str, order_endf_str = m.groups()
+                                if str(track_id) == order_idx:
+                                    # INDEXが見つかった場合、フレームの開始と終了を確認する
+                                    order_startf = 0 if not order_startf_str else int(order_startf_str)
+                                    order_endf = sys.maxsize if not order_endf_str else int(order_endf_str)
+                                    if order_startf <= iidx <= order_endf:
+                                        # フレーム範囲内である場合、採用
+                                        ordered_stores[oidx].set(os.path.basename(joint_json_path), bbox_frame)
+
+                                        bbox = [bbox_frame['bbox']['x'], bbox_frame['bbox']['y'], bbox_frame['bbox']['width'], bbox_frame['bbox']['height']]
+
+                                        # bbox描画
+                                        out_frame = draw_bbox(out_frame, bbox, 1, None, track_id=oidx)
 
             # フレーム番号追記
             cv2.putText(out_frame, f'{iidx:05}F', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, fontScale=0.8, color=(182, 0, 182), thickness = 2, lineType = cv2.LINE_AA)
@@ -140,6 +145,10 @@ def execute(args):
         avi_out.release()
         cv2.destroyAllWindows()
 
+        # 人物別にまとめて保存
+        for ordered_store in ordered_stores:
+            ordered_store.save()
+
         logger.info('人物再追跡処理終了: {0}', args.img_dir, decoration=MLogger.DECORATION_BOX)
 
         return True
@@ -10,6 +10,8 @@ import numpy as np
 import shutil
 import re
 import pathlib
+import queue
+import threading
 
 from skimage import exposure, restoration
 from skimage.color import rgb2gray
@@ -17,6 +19,7 @@ from skimage import io, exposure, img_as_float, img_as_ubyte
 import warnings
 
 from mmd.utils.MLogger import MLogger
+from mmd.utils.MVideoUtils import VideoFrameSource, FrameManifest, resize_frame, RESIZE_IMG_PATH
 
 logger = MLogger(__name__)
 
@@ -62,9 +65,7 @@ def execute(args):
         os.makedirs(os.path.join(process_img_dir, "frames"), exist_ok=True)
 
         # リサイズpng出力先
-        resize_img_path = os.path.join(process_img_dir, "resize", "resize_{0:012}.png")
-        # 補間png出力先
-        process_img_path = os.path.join(process_img_dir, "frames", "{0:012}", "frame_{0:012}.png")
+        resize_img_path = os.path.join(process_img_dir, RESIZE_IMG_PATH)
 
         # 縮尺
         scale = width / W
@@ -72,49 +73,68 @@ def execute(args):
         # 縮尺後の高さ
         height = int(H * scale)
 
+        if not args.prepare_png:
+            # PNGは出力せず、後続処理で動画から直接読み込む
+            frame_source = VideoFrameSource(args.video_file, width)
+
+            for kidx in range(len(frame_source)):
+                # 30fps用にディレクトリ作成(推定結果の出力先)
+                os.makedirs(os.path.join(process_img_dir, "frames", f"{kidx:012}"), exist_ok=True)
+
+            # resizeは使わないので削除
+            shutil.rmtree(os.path.join(process_img_dir, "resize"))
+
+            # 30fpsのフレーム番号と動画のフレーム番号の対応表を保存
+            FrameManifest(process_img_dir, frame_source.source_fnos, frame_source=frame_source).save()
+
+            logger.info("【再チェック】\n　準備フォルダ: {0}, 横: {1}, 縦: {2}, フレーム数: {3}, fps: {4}", process_img_dir, width, height, round(frame_source.interpolations[-1]), 30)
+            logger.info("動画準備完了: {0}", process_img_dir, decoration=MLogger.DECORATION_BOX)
+
+            return True, process_img_dir
+
         try:
             # 入力ファイル
             cap = cv2.VideoCapture(args.video_file)
 
             logger.info("元動画読み込み開始", decoration=MLogger.DECORATION_BOX)
 
-            for n in tqdm(range(int(count))):
-                # 動画から1枚キャプチャして読み込む
-                flag, img = cap.read()  # Capture frame-by-frame
+            # デコード済みフレームの受け渡しキュー(メモリを一定に保つため上限あり)
+            prepare_workers = max(1, args.prepare_workers)
+            frame_queue = queue.Queue(maxsize=prepare_workers * 4)
+            worker_errors = []
 
-                # 動画が終わっていたら終了
-                if flag == False:
-                    break
-                
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
+            # 警告フィルタはプロセス全体で共有されるので、ワーカー開始前にメインスレッドで1回だけ設定する
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
 
-                    try:
-                        # 画像に再変換
-                        img = Image.fromarray(img)
+                # リサイズ・PNG出力はワーカーで並列に行う
+                workers = []
+                for _ in range(prepare_workers):
+                    worker = threading.Thread(target=resize_worker, args=(frame_queue, width, height, resize_img_path, worker_errors), daemon=True)
+                    worker.start()
+                    workers.append(worker)
 
-                        # 画像の縦横を指定サイズに変形
-                        img = img.resize((width, height), Image.ANTIALIAS)
-                        
-                        # # floatに変換
-                        # img = img_as_float(img)
+                # 読み込めたフレーム数
+                frame_cnt = 0
+                for n in tqdm(range(int(count))):
+                    # 動画から1枚キャプチャして読み込む
+                    flag, img = cap.read()  # Capture frame-by-frame
 
-                        # # コントラストを強調
-                        # img = exposure.equalize_hist(img)
+                    # 動画が終わっていたら終了
+                    if flag == False or len(worker_errors) > 0:
+                        break
 
-                        # # TV filter
-                        # img = restoration.denoise_tv_chambolle(img, weight=0.1)
+                    frame_queue.put((n, img))
+                    frame_cnt += 1
 
-                    except Exception as e:
-                        # エラーするようなら無視
-                        logger.error(e)
+                # ワーカー終了
+                for _ in workers:
+                    frame_queue.put(None)
+                for worker in workers:
+                    worker.join()
 
-                    # opencv用に変換
-                    out_frame = img_as_ubyte(img)
-                    # out_frame = np.array(img, dtype=np.uint8)
-
-                    # PNG出力
-                    cv2.imwrite(resize_img_path.format(n), out_frame)
+            if len(worker_errors) > 0:
+                raise worker_errors[0]
 
             # 補間 --------------------------
 
@@ -123,24 +143,27 @@ def execute(args):
             # 元のフレームを30fpsで計算し直した場合の1Fごとの該当フレーム数
             interpolations = np.arange(0, count + 1, fps / 30)
 
+            # 30fpsのフレーム番号ごとの参照元フレーム番号(画像は複製しない)
+            source_fnos = []
             for kidx, k in enumerate(tqdm(interpolations)):
-                # 30fps用にディレクトリ作成
+                # 30fps用にディレクトリ作成(推定結果の出力先)
                 os.makedirs(os.path.join(process_img_dir, "frames", f"{kidx:012}"), exist_ok=True)
 
-                # コピー対象の画像パス
-                target_path = resize_img_path.format(round(k))
+                # 参照対象のフレーム番号
+                source_fno = round(k)
+
+                if source_fno >= frame_cnt:
+                    # 最終フレームとかで対象フレームがない場合、ひとつ手前
+                    source_fno = round(k) - 1
 
-                if not os.path.exists(target_path):
-                    # 最終フレームとかで対象パスがない場合、ひとつ手前
-                    target_path = resize_img_path.format(round(k) - 1)
+                if source_fno >= frame_cnt:
+                    # それでもない場合、ひとつ手前のフレームと同じ
+                    source_fno = source_fnos[-1] if len(source_fnos) > 0 else 0
 
-                process_path = process_img_path.format(kidx)
-                if not os.path.exists(target_path):
-                    # 最終フレームとかで対象パスがない場合、ひとつ手前
-                    target_path = process_img_path.format(kidx - 1)
+                source_fnos.append(source_fno)
 
-                # 該当フレーム番号の画像をコピー
-                shutil.copy(target_path, process_path)
+            # 30fpsのフレーム番号とリサイズ画像の対応表を保存
+            FrameManifest(process_img_dir, source_fnos).save()
 
             # # フレーム補間用比率
             # fps_interpolation = fps / 30
@@ -189,9 +212,6 @@ def execute(args):
 
         cv2.destroyAllWindows()
 
-        # resizeは削除
-        shutil.rmtree(os.path.join(process_img_dir, "resize"))
-
         logger.info("動画準備完了: {0}", process_img_dir, decoration=MLogger.DECORATION_BOX)
 
         return True, process_img_dir
@@ -200,3 +220,20 @@ def execute(args):
         return False, None
 
 
+# キューから受け取ったフレームをリサイズしてPNG出力する
+def resize_worker(frame_queue: queue.Queue, width: int, height: int, resize_img_path: str, worker_errors: list):
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            break
+
+        if len(worker_errors) > 0:
+            # 他のワーカーで失敗している場合、残りは読み捨てる
+            continue
+
+        n, img = item
+        try:
+            # PNG出力
+            cv2.imwrite(resize_img_path.format(n), resize_frame(img, width, height))
+        except Exception as e:
+            worker_errors.append(e)
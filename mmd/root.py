@@ -17,7 +17,9 @@ from torch.nn.parallel.data_parallel import DataParallel
 import torch.backends.cudnn as cudnn
 
 from mmd.utils.MLogger import MLogger
-from mmd.utils.MServiceUtils import sort_by_numeric
+from mmd.utils.MServiceUtils import sort_by_numeric, execute_by_person
+from mmd.utils.MVideoUtils import exists_frame, read_frame
+from mmd.utils.MJointUtils import JointStore
 from mmd.tracking import xywh_to_x1y1x2y2_from_dict, enlarge_bbox, x1y1x2y2_to_xywh
 
 from root.model import get_pose_net
@@ -41,82 +43,105 @@ def execute(args):
             logger.error("指定された学習モデルが存在しません。: {0}", argv.model_path, decoration=MLogger.DECORATION_BOX)
             return False
 
-        cudnn.benchmark = True
+        # 全人物分の順番別フォルダ
+        ordered_person_dir_pathes = sorted(glob.glob(os.path.join(args.img_dir, "ordered", "*")), key=sort_by_numeric)
 
-        # snapshot load
-        model = get_pose_net(argv, False)
-        model = DataParallel(model).to('cuda')
-        ckpt = torch.load(argv.model_path)
-        model.load_state_dict(ckpt['network'])
-        model.eval()
-        focal = [1500, 1500] # x-axis, y-axis
+        # 人物ごとに(並列で)深度推定
+        execute_by_person(args.jobs, estimate_root_person, [(args, oidx, ordered_person_dir_path) for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes)])
 
-        # prepare input image
-        transform = transforms.Compose([transforms.ToTensor(), transforms.Normalize(mean=argv.pixel_mean, std=argv.pixel_std)])
+        logger.info('人物深度処理終了: {0}', args.img_dir, decoration=MLogger.DECORATION_BOX)
 
-        # 全人物分の順番別フォルダ
-        ordered_person_dir_pathes = sorted(glob.glob(os.path.join(args.img_dir, "ordered", "*")), key=sort_by_numeric)
+        return True
+    except Exception as e:
+        logger.critical("人物深度で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
+        return False
 
-        frame_pattern = re.compile(r'^(frame_(\d+)\.png)')
 
-        for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes):    
-            logger.info("【No.{0}】人物深度推定開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+# 人物ごとの深度推定
+def estimate_root_person(args, oidx: int, ordered_person_dir_path: str):
+    argv = get_parser().parse_args(args=[])
 
-            frame_json_pathes = sorted(glob.glob(os.path.join(ordered_person_dir_path, "frame_*.json")), key=sort_by_numeric)
+    model = load_model(argv)
+    focal = [1500, 1500] # x-axis, y-axis
 
-            for frame_json_path in tqdm(frame_json_pathes, desc=f"No.{oidx:03} ... "):                
-                m = frame_pattern.match(os.path.basename(frame_json_path))
-                if m:
-                    frame_image_name = str(m.groups()[0])
-                    fno_name = str(m.groups()[1])
-                    
-                    # 該当フレームの画像パス
-                    frame_image_path = os.path.join(args.img_dir, "frames", fno_name, frame_image_name)
+    # prepare input image
+    transform = transforms.Compose([transforms.ToTensor(), transforms.Normalize(mean=argv.pixel_mean, std=argv.pixel_std)])
 
-                    if os.path.exists(frame_image_path):
+    frame_pattern = re.compile(r'^(frame_(\d+)\.png)')
 
-                        frame_joints = {}
-                        with open(frame_json_path, 'r') as f:
-                            frame_joints = json.load(f)
-                        
-                        width = int(frame_joints['image']['width'])
-                        height = int(frame_joints['image']['height'])
+    logger.info("【No.{0}】人物深度推定開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
 
-                        original_img = cv2.imread(frame_image_path)
+    # 人物別の関節情報
+    joint_store = JointStore(ordered_person_dir_path, json_pattern="frame_*.json", export_json=args.export_json)
+    frame_json_pathes = joint_store.glob("frame_*.json")
 
-                        bx = float(frame_joints["bbox"]["x"])
-                        by = float(frame_joints["bbox"]["y"])
-                        bw = float(frame_joints["bbox"]["width"])
-                        bh = float(frame_joints["bbox"]["height"])
+    for frame_json_path in tqdm(frame_json_pathes, desc=f"No.{oidx:03} ... "):                
+        m = frame_pattern.match(os.path.basename(frame_json_path))
+        if m:
+            frame_image_name = str(m.groups()[0])
+            fno_name = str(m.groups()[1])
 
-                        # ROOT_NETで深度推定
-                        bbox = process_bbox([bx, by, bw, bh], width, height, argv)
-                        img, img2bb_trans = generate_patch_image(original_img, bbox, False, 0.0, argv)
-                        img = transform(img).to('cuda')[None,:,:,:]
-                        k_value = np.array([math.sqrt(argv.bbox_real[0] * argv.bbox_real[1] * focal[0] * focal[1] / (bbox[2] * bbox[3]))]).astype(np.float32)
-                        k_value = torch.FloatTensor([k_value]).to('cuda')[None,:]
+            # 該当フレームの画像パス
+            frame_image_path = os.path.join(args.img_dir, "frames", fno_name, frame_image_name)
 
-                        with torch.no_grad():
-                            root_3d = model(img, k_value) # x,y: pixel, z: root-relative depth (mm)
+            if exists_frame(frame_image_path):
 
-                        img = img[0].to('cpu').numpy()
-                        root_3d = root_3d[0].to('cpu').numpy()
-                        root_3d[0] = root_3d[0] / argv.output_shape[0] * bbox[2] + bbox[0]
-                        root_3d[1] = root_3d[1] / argv.output_shape[1] * bbox[3] + bbox[1]
+                frame_joints = joint_store.get(frame_json_path)
 
-                        frame_joints["root"] = {"x": float(root_3d[0]), "y": float(root_3d[1]), "z": float(root_3d[2]), \
-                                                "input": {"x": argv.input_shape[0], "y": argv.input_shape[1]}, "output": {"x": argv.output_shape[0], "y": argv.output_shape[1]}, \
-                                                "focal": {"x": focal[0], "y": focal[1]}}
+                width = int(frame_joints['image']['width'])
+                height = int(frame_joints['image']['height'])
 
-                        with open(frame_json_path, 'w') as f:
-                            json.dump(frame_joints, f, indent=4)
+                original_img = read_frame(frame_image_path)
 
-        logger.info('人物深度処理終了: {0}', args.img_dir, decoration=MLogger.DECORATION_BOX)
+                bx = float(frame_joints["bbox"]["x"])
+                by = float(frame_joints["bbox"]["y"])
+                bw = float(frame_joints["bbox"]["width"])
+                bh = float(frame_joints["bbox"]["height"])
 
-        return True
-    except Exception as e:
-        logger.critical("人物深度で予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
-        return False
+                # ROOT_NETで深度推定
+                bbox = process_bbox([bx, by, bw, bh], width, height, argv)
+                img, img2bb_trans = generate_patch_image(original_img, bbox, False, 0.0, argv)
+                img = transform(img).to('cuda')[None,:,:,:]
+                k_value = np.array([math.sqrt(argv.bbox_real[0] * argv.bbox_real[1] * focal[0] * focal[1] / (bbox[2] * bbox[3]))]).astype(np.float32)
+                k_value = torch.FloatTensor([k_value]).to('cuda')[None,:]
+
+                with torch.no_grad():
+                    root_3d = model(img, k_value) # x,y: pixel, z: root-relative depth (mm)
+
+                img = img[0].to('cpu').numpy()
+                root_3d = root_3d[0].to('cpu').numpy()
+                root_3d[0] = root_3d[0] / argv.output_shape[0] * bbox[2] + bbox[0]
+                root_3d[1] = root_3d[1] / argv.output_shape[1] * bbox[3] + bbox[1]
+
+                frame_joints["root"] = {"x": float(root_3d[0]), "y": float(root_3d[1]), "z": float(root_3d[2]), \
+                                        "input": {"x": argv.input_shape[0], "y": argv.input_shape[1]}, "output": {"x": argv.output_shape[0], "y": argv.output_shape[1]}, \
+                                        "focal": {"x": focal[0], "y": focal[1]}}
+
+                joint_store.set(frame_json_path, frame_joints)
+
+    # 人物別にまとめて保存
+    joint_store.save()
+
+    return True
+
+
+# 読み込み済みの学習モデル(プロセスごとに1回だけ読み込む)
+ROOT_MODELS = {}
+
+
+def load_model(argv):
+    if argv.model_path not in ROOT_MODELS:
+        cudnn.benchmark = True
+
+        # snapshot load
+        model = get_pose_net(argv, False)
+        model = DataParallel(model).to('cuda')
+        ckpt = torch.load(argv.model_path)
+        model.load_state_dict(ckpt['network'])
+        model.eval()
+        ROOT_MODELS[argv.model_path] = model
+
+    return ROOT_MODELS[argv.model_path]
 
 
 def get_parser():
@@ -14,8 +14,9 @@ import numpy as np
 from tqdm import tqdm
 
 from mmd.utils.MLogger import MLogger
-from mmd.utils.MServiceUtils import sort_by_numeric
-from mmd.mmd.VmdData import OneEuroFilter
+from mmd.utils.MServiceUtils import sort_by_numeric, execute_by_person
+from mmd.utils.MJointUtils import JointStore
+from mmd.mmd.VmdData import one_euro_filter
 from lighttrack.visualizer.detection_visualizer import draw_bbox
 
 
@@ -32,107 +33,8 @@ def execute(args):
         # 全人物分の順番別フォルダ
         ordered_person_dir_pathes = sorted(glob.glob(os.path.join(args.img_dir, "ordered", "*")), key=sort_by_numeric)
 
-        frame_pattern = re.compile(r'^frame_(\d+)\.')
-
-        for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes):    
-            logger.info("【No.{0}】関節スムージング開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
-
-            frame_json_pathes = sorted(glob.glob(os.path.join(ordered_person_dir_path, "frame_*.json")), key=sort_by_numeric)
-
-            all_joints = {}
-
-            for frame_json_path in tqdm(frame_json_pathes, desc=f"Read No.{oidx:03} ... "):
-                m = frame_pattern.match(os.path.basename(frame_json_path))
-                if m:
-                    # キーフレの場所を確定（間が空く場合もある）
-                    fno = int(m.groups()[0])
-
-                    frame_joints = {}
-                    with open(frame_json_path, 'r') as f:
-                        frame_joints = json.load(f)
-                    
-                    # ジョイントグローバル座標を保持
-                    for jname, joint in frame_joints["joints"].items():
-                        if (jname, 'x') not in all_joints:
-                            all_joints[(jname, 'x')] = {}
-
-                        if (jname, 'y') not in all_joints:
-                            all_joints[(jname, 'y')] = {}
-
-                        if (jname, 'z') not in all_joints:
-                            all_joints[(jname, 'z')] = {}
-                        
-                        all_joints[(jname, 'x')][fno] = joint["x"]
-                        all_joints[(jname, 'y')][fno] = joint["y"]
-                        all_joints[(jname, 'z')][fno] = joint["z"]
-                    
-                    if "faces" in frame_joints:
-                        # 表情グローバル座標を保持
-                        for fname, face in frame_joints["faces"].items():
-                            if (fname, 'fx') not in all_joints:
-                                all_joints[(fname, 'fx')] = {}
-
-                            if (fname, 'fy') not in all_joints:
-                                all_joints[(fname, 'fy')] = {}
-                            
-                            all_joints[(fname, 'fx')][fno] = face["x"]
-                            all_joints[(fname, 'fy')][fno] = face["y"]
-                    
-                    if "eyes" in frame_joints:
-                        for ename, eye in frame_joints["eyes"].items():
-                            if (ename, 'ex') not in all_joints:
-                                all_joints[(ename, 'ex')] = {}
-
-                            if (ename, 'ey') not in all_joints:
-                                all_joints[(ename, 'ey')] = {}
-                            
-                            all_joints[(ename, 'ex')][fno] = eye["x"]
-                            all_joints[(ename, 'ey')][fno] = eye["y"]
-
-            # スムージング
-            for (jname, axis), joints in tqdm(all_joints.items(), desc=f"Filter No.{oidx:03} ... "):
-                filter = OneEuroFilter(freq=30, mincutoff=1, beta=0.00000000001, dcutoff=1)
-                for fno, joint in joints.items():
-                    all_joints[(jname, axis)][fno] = filter(joint, fno)
-
-            # 出力先ソート済みフォルダ
-            smoothed_person_dir_path = os.path.join(args.img_dir, "smooth", f"{oidx:03}")
-
-            os.makedirs(smoothed_person_dir_path, exist_ok=True)
-
-            # 出力
-            for frame_json_path in tqdm(frame_json_pathes, desc=f"Save No.{oidx:03} ... "):
-                m = frame_pattern.match(os.path.basename(frame_json_path))
-                if m:
-                    # キーフレの場所を確定（間が空く場合もある）
-                    fno = int(m.groups()[0])
-
-                    frame_joints = {}
-                    with open(frame_json_path, 'r', encoding='utf-8') as f:
-                        frame_joints = json.load(f)
-                    
-                    # ジョイントグローバル座標を保存
-                    for jname, joint in frame_joints["joints"].items():
-                        frame_joints["joints"][jname]["x"] = all_joints[(jname, 'x')][fno]
-                        frame_joints["joints"][jname]["y"] = all_joints[(jname, 'y')][fno]
-                        frame_joints["joints"][jname]["z"] = all_joints[(jname, 'z')][fno]
-
-                    # 表情グローバル座標を保存
-                    if "faces" in frame_joints:
-                        for fname, face in frame_joints["faces"].items():
-                            frame_joints["faces"][fname]["x"] = all_joints[(fname, 'fx')][fno]
-                            frame_joints["faces"][fname]["y"] = all_joints[(fname, 'fy')][fno]
-
-                    # 視線グローバル座標を保存
-                    if "eyes" in frame_joints:
-                        for ename, eye in frame_joints["faces"].items():
-                            frame_joints["faces"][ename]["x"] = all_joints[(ename, 'fx')][fno]
-                            frame_joints["faces"][ename]["y"] = all_joints[(ename, 'fy')][fno]
-
-                    smooth_json_path = os.path.join(smoothed_person_dir_path, f"smooth_{fno:012}.json")
-                    
-                    with open(smooth_json_path, 'w', encoding='utf-8') as f:
-                        json.dump(frame_joints, f, indent=4)
+        # 人物ごとに(並列で)スムージング
+        execute_by_person(args.jobs, smooth_person, [(args, oidx, ordered_person_dir_path) for oidx, ordered_person_dir_path in enumerate(ordered_person_dir_pathes)])
 
         logger.info('関節スムージング処理終了: {0}', args.img_dir, decoration=MLogger.DECORATION_BOX)
 
@@ -140,3 +42,120 @@ def execute(args):
     except Exception as e:
         logger.critical("関節スムージングで予期せぬエラーが発生しました。", e, decoration=MLogger.DECORATION_BOX)
         return False
+
+
+# 人物ごとのスムージング
+def smooth_person(args, oidx: int, ordered_person_dir_path: str):
+    frame_pattern = re.compile(r'^frame_(\d+)\.')
+
+    logger.info("【No.{0}】関節スムージング開始", f"{oidx:03}", decoration=MLogger.DECORATION_LINE)
+
+    # 人物別の関節情報
+    joint_store = JointStore(ordered_person_dir_path, json_pattern="frame_*.json")
+    frame_json_pathes = joint_store.glob("frame_*.json")
+
+    all_joints = {}
+
+    for frame_json_path in tqdm(frame_json_pathes, desc=f"Read No.{oidx:03} ... "):
+        m = frame_pattern.match(os.path.basename(frame_json_path))
+        if m:
+            # キーフレの場所を確定（間が空く場合もある）
+            fno = int(m.groups()[0])
+
+            frame_joints = joint_store.get(frame_json_path)
+
+            # ジョイントグローバル座標を保持
+            for jname, joint in frame_joints["joints"].items():
+                if (jname, 'x') not in all_joints:
+                    all_joints[(jname, 'x')] = {}
+
+                if (jname, 'y') not in all_joints:
+                    all_joints[(jname, 'y')] = {}
+
+                if (jname, 'z') not in all_joints:
+                    all_joints[(jname, 'z')] = {}
+
+                all_joints[(jname, 'x')][fno] = joint["x"]
+                all_joints[(jname, 'y')][fno] = joint["y"]
+                all_joints[(jname, 'z')][fno] = joint["z"]
+
+            if "faces" in frame_joints:
+                # 表情グローバル座標を保持
+                for fname, face in frame_joints["faces"].items():
+                    if (fname, 'fx') not in all_joints:
+                        all_joints[(fname, 'fx')] = {}
+
+                    if (fname, 'fy') not in all_joints:
+                        all_joints[(fname, 'fy')] = {}
+
+                    all_joints[(fname, 'fx')][fno] = face["x"]
+                    all_joints[(fname, 'fy')][fno] = face["y"]
+
+            if "eyes" in frame_joints:
+                for ename, eye in frame_joints["eyes"].items():
+                    if (ename, 'ex') not in all_joints:
+                        all_joints[(ename, 'ex')] = {}
+
+                    if (ename, 'ey') not in all_joints:
+                        all_joints[(ename, 'ey')] = {}
+
+                    all_joints[(ename, 'ex')][fno] = eye["x"]
+                    all_joints[(ename, 'ey')][fno] = eye["y"]
+
+    # スムージング(全関節・全軸を (フレーム数, 関節軸数) の配列にまとめてフィルタにかける)
+    joint_keys = list(all_joints.keys())
+    joint_fnos = sorted(set(fno for joints in all_joints.values() for fno in joints.keys()))
+    joint_fidxs = {fno: fidx for fidx, fno in enumerate(joint_fnos)}
+
+    joint_values = np.full((len(joint_fnos), len(joint_keys)), np.nan, dtype=np.float64)
+    for jidx, joint_key in enumerate(joint_keys):
+        joints = all_joints[joint_key]
+        joint_values[[joint_fidxs[fno] for fno in joints.keys()], jidx] = list(joints.values())
+
+    smooth_values = one_euro_filter(joint_values, joint_fnos, freq=30, mincutoff=1, beta=0.00000000001, dcutoff=1).T.tolist()
+
+    for jidx, joint_key in enumerate(tqdm(joint_keys, desc=f"Filter No.{oidx:03} ... ")):
+        joints = all_joints[joint_key]
+        for fno in joints.keys():
+            joints[fno] = smooth_values[jidx][joint_fidxs[fno]]
+
+    # 出力先ソート済みフォルダ
+    smoothed_person_dir_path = os.path.join(args.img_dir, "smooth", f"{oidx:03}")
+
+    os.makedirs(smoothed_person_dir_path, exist_ok=True)
+
+    smooth_store = JointStore(smoothed_person_dir_path, export_json=args.export_json, overwrite=True)
+
+    # 出力
+    for frame_json_path in tqdm(frame_json_pathes, desc=f"Save No.{oidx:03} ... "):
+        m = frame_pattern.match(os.path.basename(frame_json_path))
+        if m:
+            # キーフレの場所を確定（間が空く場合もある）
+            fno = int(m.groups()[0])
+
+            frame_joints = joint_store.get(frame_json_path)
+
+            # ジョイントグローバル座標を保存
+            for jname, joint in frame_joints["joints"].items():
+                frame_joints["joints"][jname]["x"] = all_joints[(jname, 'x')][fno]
+                frame_joints["joints"][jname]["y"] = all_joints[(jname, 'y')][fno]
+                frame_joints["joints"][jname]["z"] = all_joints[(jname, 'z')][fno]
+
+            # 表情グローバル座標を保存
+            if "faces" in frame_joints:
+                for fname, face in frame_joints["faces"].items():
+                    frame_joints["faces"][fname]["x"] = all_joints[(fname, 'fx')][fno]
+                    frame_joints["faces"][fname]["y"] = all_joints[(fname, 'fy')][fno]
+
+            # 視線グローバル座標を保存
+            if "eyes" in frame_joints:
+                for ename, eye in frame_joints["faces"].items():
+                    frame_joints["faces"][ename]["x"] = all_joints[(ename, 'fx')][fno]
+                    frame_joints["faces"][ename]["y"] = all_joints[(ename, 'fy')][fno]
+
+            smooth_store.set(f"smooth_{fno:012}.json", frame_joints)
+
+    # 人物別にまとめて保存
+    smooth_store.save()
+
+    return True
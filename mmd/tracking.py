@@ -5,7 +5,6 @@ import glob
 import sys
 import json
 import pathlib
-import _pickle as cPickle
 
 # import vision essentials
 import cv2
@@ -14,7 +13,7 @@ import tensorflow as tf
 from tqdm import tqdm
 
 # import GCN utils
-from lighttrack.graph.visualize_pose_matching import graph_pair_to_data, keypoints_to_graph
+from lighttrack.graph.visualize_pose_matching import pose_to_data, keypoints_to_graph
 
 # 姿勢推定用
 from lighttrack.network_mobile_deconv import Network
@@ -25,12 +24,22 @@ from lighttrack.visualizer.detection_visualizer import draw_bbox
 from lighttrack.graph.visualize_pose_matching import Pose_Matcher
 from mmd.utils.MLogger import MLogger
 from mmd.utils.MServiceUtils import sort_by_numeric
+from mmd.utils.MVideoUtils import get_frame_pathes, read_frame
+from mmd.utils.MJointUtils import JointStore
 
 flag_flip = True
 os.environ["CUDA_VISIBLE_DEVICES"]="0"
 
 logger = MLogger(__name__)
 
+# 追跡に使う関節
+TRACKING_JOINT_NAMES = ["pelvis", "left_hip", "right_hip", "left_knee", "right_knee", "left_ankle", "right_ankle", "neck", "head", \
+                        "left_shoulder", "right_shoulder", "left_elbow", "right_elbow", "left_wrist", "right_wrist"]
+
+# 追跡用に一括で読み込む列(画像サイズ, bbox, 関節の2D位置)
+TRACKING_COLUMNS = ["image/width", "image/height", "bbox/x", "bbox/y", "bbox/width", "bbox/height"] \
+                    + [f"proj_joints/{joint_name}/{axis}" for joint_name in TRACKING_JOINT_NAMES for axis in ["x", "y"]]
+
 def execute(args):
     try:
         logger.info('人物追跡処理開始: {0}', args.img_dir, decoration=MLogger.DECORATION_BOX)
@@ -69,13 +78,32 @@ def execute(args):
         args.enlarge_scale = 0.2 # how much to enlarge the bbox before pose estimation
 
         process_bbox_path = os.path.join(args.img_dir, "bbox.mp4")
-        process_img_pathes = sorted(glob.glob(os.path.join(args.img_dir, "frames", "**", "frame_*.png")), key=sort_by_numeric)
+        process_img_pathes = get_frame_pathes(args.img_dir)
+
+        # 姿勢推定結果
+        joint_store = JointStore(os.path.join(args.img_dir, "frames"), json_pattern=os.path.join("*", "frame_*.json"), export_json=args.export_json)
 
         logger.info("人物追跡開始", decoration=MLogger.DECORATION_LINE)
 
-        # process the frames sequentially
-        all_bbox_frames = []
+        # 全フレームの人物を一括で読み込む
+        frame_keys = [joint_store.glob(os.path.join(f"{iidx:012}", "frame_*.json")) for iidx in range(len(process_img_pathes))]
+        all_keys = [key for keys in frame_keys for key in keys]
+        # 各フレームの人物の開始INDEX
+        frame_starts = np.cumsum([0] + [len(keys) for keys in frame_keys])
+
+        joint_values = joint_store.get_values(all_keys, TRACKING_COLUMNS, workers=args.prepare_workers)
+        image_sizes = joint_values[:, :2].astype(np.int64)
+        bbox_xywhs = joint_values[:, 2:6]
+        # 関節は使えるのだけピックアップ
+        all_keypoints = joint_values[:, 6:].reshape(-1, len(TRACKING_JOINT_NAMES), 2)
+
+        # 人物ID(全人物分)
+        track_ids = np.full(len(all_keys), -1, dtype=np.int64)
+        # 拡大bbox(全人物分)
+        bbox_dets = []
+
         prev_bbox_frames = []
+        prev_features = None
         width = 0
         height = 0
 
@@ -83,73 +111,64 @@ def execute(args):
         track_id = -1
         # 次の人物ID
         next_id = 0
-        # 動画のサイズ
-        width = 0
-        height = 0
         # 出現回数
         track_cnt_dict = {}
 
-        for iidx, process_img_path in enumerate(tqdm(process_img_pathes)):
-            # 人数分読み込む
-            bbox_frames = {}
-            now_bbox_frames = []
-            joint_json_pathes = sorted(glob.glob(os.path.join(args.img_dir, "frames", f"{iidx:012}", "frame_*.json")), key=sort_by_numeric)
-
-            if len(joint_json_pathes) == 0:
+        # process the frames sequentially
+        for iidx in tqdm(range(len(process_img_pathes))):
+            if len(frame_keys[iidx]) == 0:
                 # 人物が一件も見つからなかった場合
-                now_bbox_frames = []
-                all_bbox_frames.append([])
                 continue
-            
+
             # 一人以上人物が見つかった場合
-            for joint_json_path in joint_json_pathes:
-                with open(joint_json_path, 'r') as f:
-                    bbox_frames[joint_json_path] = json.load(f)
-                    # とりあえず初期値は追跡不能
-                    bbox_frames[joint_json_path]["track_id"] = -1
-                    width = bbox_frames[joint_json_path]['image']['width']
-                    height = bbox_frames[joint_json_path]['image']['height']
+            now_bbox_frames = []
+            for didx in range(frame_starts[iidx], frame_starts[iidx + 1]):
+                width, height = image_sizes[didx].tolist()
 
                 # enlarge bbox by 20% with same center position
-                bbox_x1y1x2y2 = xywh_to_x1y1x2y2_from_dict(bbox_frames[joint_json_path]['bbox'])
-                bbox_in_xywh = enlarge_bbox(bbox_x1y1x2y2, args.enlarge_scale, width, height)
+                x1, y1, w, h = bbox_xywhs[didx].tolist()
+                bbox_in_xywh = enlarge_bbox([x1, y1, x1 + w, y1 + h], args.enlarge_scale, width, height)
                 bbox_det = x1y1x2y2_to_xywh(bbox_in_xywh)
+                bbox_dets.append(bbox_det)
 
-                # 関節は使えるのだけピックアップ
-                keypoints = []
-                for joint_name in ["pelvis", "left_hip", "right_hip", "left_knee", "right_knee", "left_ankle", "right_ankle", "neck", "head", \
-                                    "left_shoulder", "right_shoulder", "left_elbow", "right_elbow", "left_wrist", "right_wrist"]:
-                    keypoints.append((bbox_frames[joint_json_path]['proj_joints'][joint_name]['x'], bbox_frames[joint_json_path]['proj_joints'][joint_name]['y']))
+                keypoints = [tuple(keypoint) for keypoint in all_keypoints[didx].tolist()]
+
+                # 今回分として保持
+                now_bbox_frames.append({'track_id': -1, 'bbox': bbox_det, 'keypoints': keypoints, 'width': width, 'height': height, 'didx': didx})
+
+            # 今回の姿勢の特徴量は一括で算出し、次フレームでも使い回す
+            now_features = pose_matcher.extract_features([pose_to_data(now_bbox_frame['keypoints']) for now_bbox_frame in now_bbox_frames])
+            for fidx, now_bbox_frame in enumerate(now_bbox_frames):
+                now_bbox_frame['feature_idx'] = fidx
+
+            if iidx > 0 and len(prev_bbox_frames) > 0:
+                # 今回の全人物×前回の全人物の姿勢類似度
+                pose_matching_scores = get_pose_matching_scores(now_bbox_frames, now_features, prev_bbox_frames, prev_features, pose_matcher)
+
+            for now_bbox_frame in now_bbox_frames:
+                bbox_det = now_bbox_frame['bbox']
 
                 if iidx == 0 or len(prev_bbox_frames) == 0:   # First frame, all ids are assigned automatically
                     track_id = next_id
                     next_id += 1
                 else:
                     # 姿勢もbboxも類似してるのを優先して追跡
-                    track_id, match_index = get_track_id_SGCN(args, bbox_det, keypoints, prev_bbox_frames, pose_matcher)
+                    track_id, match_index = get_track_id_SGCN(args, bbox_det, pose_matching_scores[now_bbox_frame['feature_idx']], prev_bbox_frames)
 
                     if track_id > -1:  # if candidate from prev frame matched, prevent it from matching another
                         del prev_bbox_frames[match_index]
-                        bbox_frames[joint_json_path]["track_id"] = track_id
+
+                now_bbox_frame['track_id'] = track_id
 
                 if track_id > -1:
-                    bbox_frames[joint_json_path]['track_id'] = track_id
+                    track_ids[now_bbox_frame['didx']] = track_id
                     if track_id not in track_cnt_dict:
                         # まだ出現なかったtrack_idの場合、場所用意
                         track_cnt_dict[track_id] = 0
                     # 出現回数カウント
                     track_cnt_dict[track_id] += 1
 
-                # JSON出力
-                with open(joint_json_path, "w") as f:
-                    json.dump(bbox_frames[joint_json_path], f, indent=4)
-
-                # 今回分として保持
-                now_bbox_frames.append({'track_id': track_id, 'bbox': bbox_det, 'keypoints': keypoints, 'width': width, 'height': height, 'json_path': joint_json_path})
-
-            for bidx, now_bbox_frame in enumerate(now_bbox_frames):
-                joint_json_path = now_bbox_frame['json_path']
-
+            for now_bbox_frame in now_bbox_frames:
                 if now_bbox_frame['track_id'] == -1:
                     # bboxベースの追跡再検討
                     track_id, match_index = get_track_id_SpatialConsistency(now_bbox_frame['bbox'], prev_bbox_frames)
@@ -164,38 +183,30 @@ def execute(args):
                         # 出現回数カウント
                         track_cnt_dict[track_id] += 1
 
-                        # JSON用データにも書き込み
-                        bbox_frames[joint_json_path]['track_id'] = track_id
-
                     # if still can not find a match from previous frame, then assign a new id
                     if track_id == -1 and not bbox_invalid(now_bbox_frame['bbox'], width, height):
-                        bbox_frames[joint_json_path]["track_id"] = next_id
                         now_bbox_frame["track_id"] = next_id
                         next_id += 1
-                    else:
-                        pass
 
-                    # JSON出力
-                    with open(joint_json_path, "w") as f:
-                        json.dump(bbox_frames[joint_json_path], f, indent=4)
+                    track_ids[now_bbox_frame['didx']] = now_bbox_frame['track_id']
 
-            # 前回分として保持しなおし
+            # 前回分として保持しなおし(人物IDは全人物分の配列で保持しているので、コピーは不要)
             prev_bbox_frames = now_bbox_frames
-            # 全データを保持（前回データはヒット分を削除したりするのでコピー保持）
-            all_bbox_frames.append(cPickle.loads(cPickle.dumps(now_bbox_frames, -1)))
+            prev_features = now_features
+
+        # 追跡結果を最後にまとめて書き込んで保存
+        for key, track_id in zip(all_keys, track_ids.tolist()):
+            frame_joints = joint_store.get(key)
+            frame_joints["track_id"] = track_id
+            joint_store.set(key, frame_joints)
+        joint_store.save()
 
         logger.info('追跡結果チェック開始', decoration=MLogger.DECORATION_LINE)
 
         # bboxのサイズの中央値を求める
-        all_w = []
-        all_h = []
-        for iidx, bbox_frames in enumerate(tqdm(all_bbox_frames)):
-            for bidx, bbox_frame in enumerate(bbox_frames):
-                x1, y1, w, h = bbox_frame['bbox']
-                all_w.append(w)
-                all_h.append(h)
-        median_w = np.median(all_w)
-        median_h = np.median(all_h)
+        bbox_dets = np.array(bbox_dets, dtype=np.float64).reshape(-1, 4)
+        median_w = np.median(bbox_dets[:, 2])
+        median_h = np.median(bbox_dets[:, 3])
 
         logger.info('追跡結果生成開始', decoration=MLogger.DECORATION_LINE)
 
@@ -203,19 +214,18 @@ def execute(args):
         out = cv2.VideoWriter(process_bbox_path, fourcc, 30.0, (width, height))
 
         for iidx, process_img_path in enumerate(tqdm(process_img_pathes)):
-            out_frame = cv2.imread(process_img_path)
-
-            if len(all_bbox_frames) >= iidx:
-                for bbox_frame in all_bbox_frames[iidx]:
-                    # track_idが管理出現回数とbboxサイズをクリアしている場合のみ画像出力
-                    track_id = bbox_frame['track_id']
-                    x1, y1, w, h = bbox_frame['bbox']
-                    if track_id > -1 and track_id in track_cnt_dict \
-                        and (track_cnt_dict[track_id] > 3 or (len(process_img_pathes) < 3 and track_cnt_dict[track_id] > 1)) \
-                        and median_w * 0.5 <= w and median_h * 0.5 <= h:
-
-                        # bbox描画
-                        out_frame = draw_bbox(out_frame, bbox_frame['bbox'], 1, None, track_id=track_id)
+            out_frame = read_frame(process_img_path)
+
+            for didx in range(frame_starts[iidx], frame_starts[iidx + 1]):
+                # track_idが管理出現回数とbboxサイズをクリアしている場合のみ画像出力
+                track_id = int(track_ids[didx])
+                x1, y1, w, h = bbox_dets[didx].tolist()
+                if track_id > -1 and track_id in track_cnt_dict \
+                    and (track_cnt_dict[track_id] > 3 or (len(process_img_pathes) < 3 and track_cnt_dict[track_id] > 1)) \
+                    and median_w * 0.5 <= w and median_h * 0.5 <= h:
+
+                    # bbox描画
+                    out_frame = draw_bbox(out_frame, [x1, y1, w, h], 1, None, track_id=track_id)
             
             # フレーム番号追記
             cv2.putText(out_frame, f'{iidx:05}F', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, fontScale=1.1, color=(182, 0, 182), thickness = 2, lineType = cv2.LINE_AA)
@@ -292,7 +302,7 @@ def bbox_invalid(bbox, img_width, img_height):
     return False
 
 
-def get_track_id_SGCN(args, bbox_cur_frame, keypoints_cur_frame, prev_bbox_frames, pose_matcher):
+def get_track_id_SGCN(args, bbox_cur_frame, pose_matching_scores, prev_bbox_frames):
     min_index = None
     min_matching_score = sys.maxsize
     # if track_id is still not assigned, the person is really missing or track is really lost
@@ -305,15 +315,9 @@ def get_track_id_SGCN(args, bbox_cur_frame, keypoints_cur_frame, prev_bbox_frame
     # 類似bbox内だけチェック
     for det_index in similar_bbox_idxs:
         prev_bbox_frame = prev_bbox_frames[det_index]
-        bbox_prev_frame = prev_bbox_frame["bbox"]
 
-        # check the pose matching score
-        keypoints_prev_frame = prev_bbox_frame["keypoints"]
-
-        img_width = prev_bbox_frame["width"]
-        img_height = prev_bbox_frame["height"]        
-
-        pose_matching_score = get_pose_matching_score(keypoints_cur_frame, keypoints_prev_frame, bbox_cur_frame, bbox_prev_frame, img_width, img_height, pose_matcher)
+        # check the pose matching score (前回フレーム全体での特徴量INDEXで参照)
+        pose_matching_score = pose_matching_scores[prev_bbox_frame["feature_idx"]]
 
         if pose_matching_score <= pose_matching_threshold and pose_matching_score <= min_matching_score:
             # match the target based on the pose matching score
@@ -327,22 +331,22 @@ def get_track_id_SGCN(args, bbox_cur_frame, keypoints_cur_frame, prev_bbox_frame
         return track_id, min_index
 
 
-def get_pose_matching_score(keypoints_A, keypoints_B, bbox_A, bbox_B, img_width, img_height, pose_matcher):
-    if keypoints_A == [] or keypoints_B == []:
-        logger.debug("graph not correctly generated!")
-        return sys.maxsize
-
-    if bbox_invalid(bbox_A, img_width, img_height) or bbox_invalid(bbox_B, img_width, img_height):
-        logger.debug("graph not correctly generated!")
-        return sys.maxsize
+# 今回の全人物×前回の全人物の姿勢類似度を一括で求める (行: 今回の特徴量INDEX, 列: 前回の特徴量INDEX)
+def get_pose_matching_scores(cur_bbox_frames, cur_features, prev_bbox_frames, prev_features, pose_matcher):
+    flag_matches, dists = pose_matcher.inference_batch(cur_features, prev_features)
 
-    sample_graph_pair = (keypoints_A, keypoints_B)
-    data_A, data_B = graph_pair_to_data(sample_graph_pair)
+    # 合致してる場合のみ距離を採用
+    scores = np.where(flag_matches, dists, sys.maxsize).astype(np.float64)
 
-    flag_match, dist = pose_matcher.inference(data_A, data_B)
+    for cur_bbox_frame in cur_bbox_frames:
+        for prev_bbox_frame in prev_bbox_frames:
+            if cur_bbox_frame["keypoints"] == [] or prev_bbox_frame["keypoints"] == [] \
+                    or bbox_invalid(cur_bbox_frame["bbox"], prev_bbox_frame["width"], prev_bbox_frame["height"]) \
+                    or bbox_invalid(prev_bbox_frame["bbox"], prev_bbox_frame["width"], prev_bbox_frame["height"]):
+                logger.debug("graph not correctly generated!")
+                scores[cur_bbox_frame["feature_idx"], prev_bbox_frame["feature_idx"]] = sys.maxsize
 
-    # 合致してる場合は結果を返す
-    return dist if flag_match else sys.maxsize
+    return scores
 
 
 # bbox単位で似ている場所にある前回フレームのbboxを抽出
@@ -4,11 +4,14 @@ from mmd.module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion
 from mmd.utils.MLogger import MLogger # noqa
 import numpy as np
 import bezier
+from functools import lru_cache
 
 logger = MLogger(__name__)
 
 # MMDでの補間曲線の最大値
 INTERPOLATION_MMD_MAX = 127
+# 補間曲線の評価結果を保持する件数
+EVALUATE_CACHE_SIZE = 65536
 # MMDの線形補間
 LINEAR_MMD_INTERPOLATION = [MVector2D(0, 0), MVector2D(20, 20), MVector2D(107, 107), MVector2D(127, 127)]
 
@@ -356,10 +359,17 @@ def intersect_by_x(curve, xs: np.ndarray):
 # https://shspage.hatenadiary.org/entry/20140625/1403702735
 # https://bezier.readthedocs.io/en/stable/python/reference/bezier.curve.html#bezier.curve.Curve.evaluate
 def evaluate(x1v: int, y1v: int, x2v: int, y2v: int, start: int, now: int, end: int):
-    if (now - start) == 0 or (end - start) == 0:
+    # 制御点は0～127の整数なので、開始からの相対フレームで結果を使い回す
+    return evaluate_relative(x1v, y1v, x2v, y2v, now - start, end - start)
+
+
+# 開始からの相対フレーム(now: 現在, end: 終了)で補間曲線を評価する
+@lru_cache(maxsize=EVALUATE_CACHE_SIZE)
+def evaluate_relative(x1v: int, y1v: int, x2v: int, y2v: int, now: int, end: int):
+    if now == 0 or end == 0:
         return 0, 0, 0
     
-    x = (now - start) / (end - start)
+    x = now / end
     x1 = x1v / INTERPOLATION_MMD_MAX
     x2 = x2v / INTERPOLATION_MMD_MAX
     y1 = y1v / INTERPOLATION_MMD_MAX
@@ -388,6 +398,66 @@ def evaluate(x1v: int, y1v: int, x2v: int, y2v: int, start: int, now: int, end:
     return x, y, t
 
 
+# 補間曲線をまとめて評価する(引数は配列可、evaluate と同じ二分法を配列で行う)
+def evaluate_array(x1v, y1v, x2v, y2v, start, now, end):
+    x1v, y1v, x2v, y2v, start, now, end = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in [x1v, y1v, x2v, y2v, start, now, end]])
+
+    # 評価できない(開始と同じ・区間がない)場合は0
+    valid = ((now - start) != 0) & ((end - start) != 0)
+
+    x = np.where(valid, (now - start) / np.where(valid, end - start, 1), 0)
+    x1 = x1v / INTERPOLATION_MMD_MAX
+    x2 = x2v / INTERPOLATION_MMD_MAX
+    y1 = y1v / INTERPOLATION_MMD_MAX
+    y2 = y2v / INTERPOLATION_MMD_MAX
+
+    t = np.full(x.shape, 0.5)
+    s = np.full(x.shape, 0.5)
+
+    # 二分法
+    for i in range(15):
+        ft = (3 * (s * s) * t * x1) + (3 * s * (t * t) * x2) + (t * t * t) - x
+        t = np.where(ft > 0, t - 1 / (4 << i), t + 1 / (4 << i))
+        s = 1 - t
+
+    y = (3 * (s * s) * t * y1) + (3 * s * (t * t) * y2) + (t * t * t)
+
+    return x, np.where(valid, y, 0), np.where(valid, t, 0)
+
+
+# 正規化した値(始点: 0, 終点: 1)に合うMMD補間曲線を、区間ごとにまとめて最小二乗で求める
+# xs, ys: (区間数, フレーム数) の経過割合と値, mask: 区間内の有効なフレーム
+# 戻り値: (区間数, 4) の制御点 [x1, y1, x2, y2] (0～127の整数)
+def fit_bezier_mmd_array(xs: np.ndarray, ys: np.ndarray, mask: np.ndarray):
+    # 制御点のXを1/3, 2/3に固定すると x(t) = t となり、y(t) が制御点のYの一次式になる
+    t = np.where(mask, xs, 0)
+    s = 1 - t
+    b1 = np.where(mask, 3 * (s * s) * t, 0)
+    b2 = np.where(mask, 3 * s * (t * t), 0)
+    r = np.where(mask, ys - (t * t * t), 0)
+
+    a11 = np.sum(b1 * b1, axis=-1)
+    a12 = np.sum(b1 * b2, axis=-1)
+    a22 = np.sum(b2 * b2, axis=-1)
+    c1 = np.sum(b1 * r, axis=-1)
+    c2 = np.sum(b2 * r, axis=-1)
+    det = a11 * a22 - a12 * a12
+
+    # 解けない(区間内に点がない)場合は線形補間
+    is_solved = np.abs(det) > 1e-12
+    safe_det = np.where(is_solved, det, 1)
+    y1 = np.where(is_solved, (c1 * a22 - c2 * a12) / safe_det, 1 / 3)
+    y2 = np.where(is_solved, (a11 * c2 - a12 * c1) / safe_det, 2 / 3)
+
+    bzs = np.empty(xs.shape[:-1] + (4,), dtype=np.int64)
+    bzs[..., 0] = round(INTERPOLATION_MMD_MAX / 3)
+    bzs[..., 1] = np.round(np.clip(y1, 0, 1) * INTERPOLATION_MMD_MAX)
+    bzs[..., 2] = round(INTERPOLATION_MMD_MAX * 2 / 3)
+    bzs[..., 3] = np.round(np.clip(y2, 0, 1) * INTERPOLATION_MMD_MAX)
+
+    return bzs
+
+
 # 指定されたtになるフレーム番号を取得する
 def evaluate_by_t(x1v: int, y1v: int, x2v: int, y2v: int, start: int, end: int, t: float):
     if (end - start) <= 1:
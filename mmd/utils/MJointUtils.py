@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import glob
+import json
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from mmd.utils.MLogger import MLogger
+from mmd.utils.MServiceUtils import sort_by_numeric
+
+logger = MLogger(__name__)
+
+# 関節情報ストアのファイル名
+JOINT_STORE_FILE_NAME = "joints.npz"
+
+# 列の型
+# f: 実数, i: 整数, b: 真偽値, s: 文字列, j: その他(JSON文字列), d: 空のdict
+NUMERIC_TYPES = ["f", "i", "b"]
+
+
+# フレームごとの推定結果(JSONと同じ構造のdict)を、列指向の配列にまとめて保存するストア
+# キーはストアのディレクトリからの相対パス(従来のJSONファイルのパス)
+class JointStore:
+
+    def __init__(self, store_dir: str, json_pattern="", export_json=False, overwrite=False):
+        self.store_dir = store_dir
+        self.store_path = os.path.join(store_dir, JOINT_STORE_FILE_NAME)
+        # 保存時にJSONも出力するか
+        self.export_json = export_json
+
+        # KEY: 相対パス, VALUE: フレーム情報
+        self.__frames = {}
+        # KEY: 相対ディレクトリ, VALUE: ファイル名リスト
+        self.__dirs = {}
+        # まだ変換していない列データの行番号
+        self.__rows = {}
+        self.__columns = None
+        # まだ読み込んでいないJSONファイルのパス
+        self.__json_pathes = {}
+
+        if overwrite:
+            pass
+        elif os.path.exists(self.store_path):
+            self.__read()
+        elif json_pattern:
+            # ストアがない場合、従来のJSONファイルから読み込む
+            for json_path in sorted(glob.glob(os.path.join(store_dir, json_pattern)), key=sort_by_numeric):
+                key = self.__regist_key(os.path.relpath(json_path, store_dir))
+                self.__json_pathes[key] = json_path
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __regist_key(self, key: str):
+        key = key.replace("\\", "/")
+        dir_name, file_name = os.path.split(key)
+        if dir_name not in self.__dirs:
+            self.__dirs[dir_name] = {}
+        self.__dirs[dir_name][file_name] = True
+        return key
+
+    # 全キーリスト
+    def keys(self):
+        return [f"{dir_name}/{file_name}" if dir_name else file_name for dir_name, file_names in self.__dirs.items() for file_name in file_names.keys()]
+
+    # glob.glob と同じ書式で、該当するキーを昇順で返す
+    def glob(self, pattern: str):
+        pattern = pattern.replace("\\", "/")
+        dir_pattern, file_pattern = os.path.split(pattern)
+
+        if glob.has_magic(dir_pattern):
+            keys = fnmatch.filter(self.keys(), pattern)
+        elif dir_pattern in self.__dirs:
+            keys = [f"{dir_pattern}/{file_name}" if dir_pattern else file_name for file_name in fnmatch.filter(self.__dirs[dir_pattern].keys(), file_pattern)]
+        else:
+            keys = []
+
+        return sorted(keys, key=sort_by_numeric)
+
+    def exists(self, key: str):
+        key = key.replace("\\", "/")
+        dir_name, file_name = os.path.split(key)
+        return dir_name in self.__dirs and file_name in self.__dirs[dir_name]
+
+    # 該当キーのフレーム情報を返す(更新した場合は set で登録する)
+    def get(self, key: str):
+        key = key.replace("\\", "/")
+
+        if key in self.__frames:
+            return self.__frames[key]
+
+        if key in self.__rows:
+            self.__frames[key] = self.__read_row(self.__rows.pop(key))
+            return self.__frames[key]
+
+        if key in self.__json_pathes:
+            with open(self.__json_pathes.pop(key), 'r', encoding='utf-8') as f:
+                self.__frames[key] = json.load(f)
+            return self.__frames[key]
+
+        return None
+
+    # 指定キー・指定列(dictの階層パス)の数値をまとめて (キー数, 列数) の配列で返す(値がない場合はnan)
+    # 列データから読み込んだ分はdictに変換せずに取り出す
+    def get_values(self, keys: list, columns: list, workers=4):
+        keys = [key.replace("\\", "/") for key in keys]
+        paths = [tuple(column.split("/")) for column in columns]
+        values = np.full((len(keys), len(paths)), np.nan, dtype=np.float64)
+
+        # 未読込のJSONは並列でまとめて読み込む
+        self.__load_jsons([key for key in keys if key in self.__json_pathes], workers)
+
+        row_kidxs = [kidx for kidx, key in enumerate(keys) if key in self.__rows]
+        if len(row_kidxs) > 0:
+            store_paths, _, _, store_values, store_mask, _ = self.__columns
+            store_col_idxs = {path: cidx for cidx, path in enumerate(store_paths)}
+            ridxs = np.array([self.__rows[keys[kidx]] for kidx in row_kidxs], dtype=np.int64)
+            for pidx, path in enumerate(paths):
+                if path in store_col_idxs:
+                    cidx = store_col_idxs[path]
+                    values[row_kidxs, pidx] = np.where(store_mask[ridxs, cidx], store_values[ridxs, cidx], np.nan)
+
+        for kidx, key in enumerate(keys):
+            if key in self.__rows or key not in self.__frames:
+                continue
+            for pidx, path in enumerate(paths):
+                target = self.__frames[key]
+                for name in path:
+                    target = target.get(name) if isinstance(target, dict) else None
+                if target is not None and not isinstance(target, (dict, str, list)):
+                    values[kidx, pidx] = float(target)
+
+        return values
+
+    def __load_jsons(self, keys: list, workers: int):
+        def load_json(json_path: str):
+            with open(json_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        if len(keys) == 0:
+            return
+
+        json_pathes = [self.__json_pathes.pop(key) for key in keys]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for key, frame_joints in zip(keys, executor.map(load_json, json_pathes)):
+                self.__frames[key] = frame_joints
+
+    def set(self, key: str, frame_joints: dict):
+        key = self.__regist_key(key)
+        self.__rows.pop(key, None)
+        self.__json_pathes.pop(key, None)
+        self.__frames[key] = frame_joints
+
+    # 列指向で保存する
+    def save(self):
+        keys = self.keys()
+
+        # 列(dictの階層パス)ごとに値を集める
+        column_types = {}
+        row_values = []
+        for key in keys:
+            values = {}
+            flatten_joints(self.get(key), (), values)
+            for path, (value_type, _) in values.items():
+                if path not in column_types:
+                    column_types[path] = set()
+                column_types[path].add(value_type)
+            row_values.append(values)
+
+        paths = list(column_types.keys())
+        types = [decide_column_type(column_types[path]) for path in paths]
+        text_cidxs = [cidx for cidx, column_type in enumerate(types) if column_type not in NUMERIC_TYPES]
+        text_cols = {cidx: tidx for tidx, cidx in enumerate(text_cidxs)}
+
+        col_idxs = {path: cidx for cidx, path in enumerate(paths)}
+
+        # numpyへの要素代入は遅いので、行単位でリストを作ってからまとめて配列にする
+        values = []
+        mask = []
+        texts = []
+        for row in row_values:
+            row_value = [0.0] * len(paths)
+            row_mask = [False] * len(paths)
+            row_text = [""] * len(text_cidxs)
+            for path, (_, value) in row.items():
+                cidx = col_idxs[path]
+                row_mask[cidx] = True
+                if cidx in text_cols:
+                    row_text[text_cols[cidx]] = value if types[cidx] == "s" else json.dumps(value)
+                elif types[cidx] != "d":
+                    row_value[cidx] = value
+            values.append(row_value)
+            mask.append(row_mask)
+            texts.append(row_text)
+
+        values = np.array(values, dtype=np.float64).reshape(len(keys), len(paths))
+        mask = np.array(mask, dtype=np.bool_).reshape(len(keys), len(paths))
+        texts = np.array(texts, dtype=np.str_).reshape(len(keys), len(text_cidxs))
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(self.store_path, 'wb') as f:
+            np.savez(f, keys=np.array(keys, dtype=np.str_), columns=np.array(["/".join(path) for path in paths], dtype=np.str_), \
+                     types=np.array(types, dtype=np.str_), values=values, mask=mask, texts=texts)
+
+        if self.export_json:
+            self.export()
+
+    # JSONファイルとして出力する
+    def export(self, json_dir=None):
+        json_dir = json_dir or self.store_dir
+        for key in self.keys():
+            json_path = os.path.join(json_dir, key)
+            os.makedirs(os.path.dirname(json_path), exist_ok=True)
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(self.get(key), f, indent=4)
+
+    def __read(self):
+        with np.load(self.store_path, allow_pickle=False) as data:
+            keys = data["keys"].tolist()
+            paths = [tuple(column.split("/")) for column in data["columns"].tolist()]
+            types = data["types"].tolist()
+            # 各列の文字列列内でのINDEX
+            text_idxs = (np.cumsum([column_type not in NUMERIC_TYPES for column_type in types]) - 1).tolist()
+            self.__columns = (paths, types, text_idxs, data["values"], data["mask"], data["texts"])
+
+        for ridx, key in enumerate(keys):
+            key = self.__regist_key(key)
+            self.__rows[key] = ridx
+
+    def __read_row(self, ridx: int):
+        paths, types, text_idxs, values, mask, texts = self.__columns
+
+        # numpyの要素アクセスは遅いので、行単位でリストにしてから変換する
+        row_values = values[ridx].tolist()
+        row_texts = texts[ridx].tolist()
+
+        frame_joints = {}
+        for cidx in np.flatnonzero(mask[ridx]).tolist():
+            column_type = types[cidx]
+            if column_type == "f":
+                value = row_values[cidx]
+            elif column_type == "i":
+                value = int(row_values[cidx])
+            elif column_type == "b":
+                value = bool(row_values[cidx])
+            elif column_type == "d":
+                value = {}
+            else:
+                text = row_texts[text_idxs[cidx]]
+                value = text if column_type == "s" else json.loads(text)
+
+            path = paths[cidx]
+            target = frame_joints
+            for name in path[:-1]:
+                if name not in target:
+                    target[name] = {}
+                target = target[name]
+            target[path[-1]] = value
+
+        return frame_joints
+
+
+# dictの階層を (パス): (型, 値) に平坦化する
+def flatten_joints(frame_joints: dict, path: tuple, values: dict):
+    for name, value in frame_joints.items():
+        now_path = path + (name if type(name) is str else str(name),)
+        # ほとんどが実数なので、型の一致で先に判定する
+        value_type = type(value)
+        if value_type is float:
+            values[now_path] = ("f", value)
+        elif value_type is dict:
+            if len(value) == 0:
+                values[now_path] = ("d", {})
+            else:
+                flatten_joints(value, now_path, values)
+        elif value_type is int:
+            values[now_path] = ("i", value)
+        elif isinstance(value, (bool, np.bool_)):
+            values[now_path] = ("b", bool(value))
+        elif isinstance(value, np.integer):
+            values[now_path] = ("i", int(value))
+        elif isinstance(value, np.floating):
+            values[now_path] = ("f", float(value))
+        elif isinstance(value, str):
+            values[now_path] = ("s", value)
+        elif isinstance(value, dict):
+            flatten_joints(value, now_path, values)
+        else:
+            values[now_path] = ("j", value.tolist() if isinstance(value, np.ndarray) else value)
+
+
+# 列に含まれる値の型から、列の型を決める
+def decide_column_type(value_types: set):
+    if len(value_types) == 1:
+        return list(value_types)[0]
+    if value_types <= set(NUMERIC_TYPES):
+        # 数値が混在している場合は実数
+        return "f"
+    return "j"
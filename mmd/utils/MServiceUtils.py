@@ -4,6 +4,9 @@ import numpy as np # noqa
 import math # noqa
 import numpy as np
 import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from math import sin, cos, acos, atan2, asin, pi, sqrt
 
 from mmd.module.MParams import BoneLinks # noqa
@@ -210,76 +213,365 @@ def calc_front_global_pos(model: PmxModel, links: BoneLinks, motion: VmdMotion,
 
 # グローバル位置算出
 def calc_global_pos(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, limit_links=None, return_matrix=False, is_local_x=False):
-    # pfun = profile(c_calc_relative_position)
-    # cdef list trans_vs = pfun(model, links, motion, fno, limit_links)
-    trans_vs = calc_relative_position(model, links, motion, fno, limit_links)
-    add_qs = calc_relative_rotation(model, links, motion, fno, limit_links)
-
-    # 行列
-    matrixs = [MMatrix4x4() for i in range(links.size())]
+    # 1フレーム分だけまとめて計算する
+    global_3ds, total_mats = calc_global_pos_range(model, links, motion, [fno], limit_links, is_local_x)
 
-    for n, (lname, v, q) in enumerate(zip(links.all().keys(), trans_vs, add_qs)):
-        # 行列を生成
-        mm = MMatrix4x4()
-        # 初期化
-        mm.setToIdentity()
-        # 移動
-        mm.translate(v)
-        # 回転
-        mm.rotate(q)
-        # 設定
-        matrixs[n] = mm
-
-    total_mats = {}
     global_3ds_dic = {}
-    mm = MMatrix4x4()
+    total_mats_dic = {}
+    for n, lname in enumerate(links.all().keys()):
+        global_3ds_dic[lname] = MVector3D(global_3ds[0, n])
+        if return_matrix:
+            total_mats_dic[lname] = MMatrix4x4(total_mats[0, n])
 
-    for n, (lname, v) in enumerate(zip(links.all().keys(), trans_vs)):
-        if n == 0:
-            mm = MMatrix4x4()
-            mm.setToIdentity()
-
-        for m in range(n):
-            # 最後のひとつ手前までループ
-            if m == 0:
-                # 0番目の位置を初期値とする
-                mm = matrixs[0].copy()
+    if not return_matrix:
+        return global_3ds_dic
+
+    return global_3ds_dic, total_mats_dic
+
+
+# 複数フレーム分のグローバル位置算出
+# 戻り値: グローバル位置 (フレーム数, リンク数, 3), 行列 (フレーム数, リンク数, 4, 4)
+# jobs: 2以上の場合、フレームを分割して別プロセスで相対位置・相対回転を求める
+def calc_global_pos_range(model: PmxModel, links: BoneLinks, motion: VmdMotion, fnos: list, limit_links=None, is_local_x=False, jobs=1):
+    local_x_mats = calc_local_x_matrixs(model, links) if is_local_x else None
+
+    if motion.pose_cache is not None and not limit_links:
+        # キャッシュがある場合、キャッシュにないリンクだけ計算する
+        return calc_global_matrixs_cached(model, links, motion, fnos, local_x_mats, jobs)
+
+    trans_vs, add_qs = calc_relative_arrays_range(model, links, motion, fnos, limit_links, jobs)
+
+    return calc_global_matrixs(trans_vs, add_qs, local_x_mats)
+
+
+# キャッシュを使ってグローバル位置と行列を求める
+# リンクの先頭からキャッシュにある分はそのまま使い、残りのリンクだけ相対位置・相対回転を求めて、結果をキャッシュに登録する
+def calc_global_matrixs_cached(model: PmxModel, links: BoneLinks, motion: VmdMotion, fnos: list, local_x_mats=None, jobs=1):
+    link_names = tuple(links.all().keys())
+    global_3ds = np.zeros((len(fnos), len(link_names), 3), dtype=np.float64)
+    total_mats = np.zeros((len(fnos), len(link_names), 4, 4), dtype=np.float64)
+
+    # フレームごとに、先頭から何リンク目までキャッシュにあるか
+    start_idxs = np.zeros(len(fnos), dtype=np.int64)
+    for fidx, fno in enumerate(fnos):
+        for n in range(len(link_names)):
+            cache = motion.get_pose_cache(fno, link_names[:(n + 1)])
+            if cache is None:
+                break
+            global_3ds[fidx, n], total_mats[fidx, n] = cache
+            start_idxs[fidx] = n + 1
+
+    # リンクごとに、値が依存しているボーン(自身より親のボーンと付与親)
+    dep_bone_names = []
+    for lname in link_names:
+        dep_bone_names.append((dep_bone_names[-1] if dep_bone_names else []) + [lname] + get_effect_bone_names(model, lname))
+
+    for start_idx in sorted(set(start_idxs.tolist())):
+        if start_idx >= len(link_names):
+            continue
+
+        fidxs = np.flatnonzero(start_idxs == start_idx)
+        target_fnos = [fnos[fidx] for fidx in fidxs]
+        trans_vs, add_qs = calc_relative_arrays_range(model, links, motion, target_fnos, jobs=jobs, start_idx=start_idx)
+
+        matrixs = quaternion_to_matrixs(add_qs)
+        matrixs[..., :3, 3] = trans_vs
+
+        for n in range(start_idx, len(link_names)):
+            # 自分より前の行列結果の累積(0番目は単位行列)
+            if n == 0:
+                prev_mats = np.tile(np.eye(4, dtype=np.float64), (len(fidxs), 1, 1))
             else:
-                # 自分より前の行列結果を掛け算する
-                mm *= matrixs[m]
-        
-        # 自分は、位置だけ掛ける
-        global_3ds_dic[lname] = mm * v
+                prev_mats = total_mats[fidxs, n - 1]
+
+            # 自分は、位置だけ掛ける
+            global_3ds[fidxs, n] = np.einsum('fij,fj->fi', prev_mats[..., :3, :3], trans_vs[:, n - start_idx]) + prev_mats[..., :3, 3]
+            total_mats[fidxs, n] = prev_mats @ matrixs[:, n - start_idx]
 
-        # 最後の行列をかけ算する
-        total_mats[lname] = mm * matrixs[n]
+            for fidx, fno in zip(fidxs.tolist(), target_fnos):
+                motion.set_pose_cache(fno, link_names[:(n + 1)], dep_bone_names[n], global_3ds[fidx, n].copy(), total_mats[fidx, n].copy())
 
+    if local_x_mats is not None:
         # ローカル軸の向きを調整する
-        if n > 0 and is_local_x:
-            # ボーン自身にローカル軸が設定されているか
-            local_x_matrix = MMatrix4x4()
-            local_x_matrix.setToIdentity()
+        total_mats[:, 1:] = total_mats[:, 1:] @ local_x_mats[1:]
 
-            local_axis_qq = MQuaternion()
+    return global_3ds, total_mats
 
-            if model.bones[lname].local_x_vector == MVector3D():
-                # ローカル軸が設定されていない場合、計算
 
-                # 自身から親を引いた軸の向き
-                local_axis = model.bones[lname].position - links.get(lname, offset=-1).position
-                local_axis_qq = MQuaternion.fromDirection(local_axis.normalized(), MVector3D(0, 0, 1))
-            else:
-                # ローカル軸が設定されている場合、その値を採用
-                local_axis_qq = MQuaternion.fromDirection(model.bones[lname].local_x_vector.normalized(), MVector3D(0, 0, 1))
-            
-            local_x_matrix.rotate(local_axis_qq)
+# 付与親を辿ったボーン名リスト
+def get_effect_bone_names(model: PmxModel, bone_name: str):
+    bone_names = []
+    if bone_name not in model.bones:
+        return bone_names
 
-            total_mats[lname] *= local_x_matrix
+    bone = model.bones[bone_name]
+    cnt = 0
+    while bone.getExternalRotationFlag() and bone.effect_index in model.bone_indexes and cnt < 100:
+        bone = model.bones[model.bone_indexes[bone.effect_index]]
+        bone_names.append(bone.name)
+        cnt += 1
 
-    if not return_matrix:
-        return global_3ds_dic
+    return bone_names
+
+
+# 複数フレーム分の相対位置と相対回転(フレーム数が多い場合はプロセスを分ける)
+# start_idx: このINDEX以降のリンクだけ求める
+def calc_relative_arrays_range(model: PmxModel, links: BoneLinks, motion: VmdMotion, fnos: list, limit_links=None, jobs=1, start_idx=0):
+    if jobs > 1 and len(fnos) >= jobs * FRAME_CHUNK_MIN_SIZE:
+        return calc_relative_arrays_parallel(model, links, motion, fnos, limit_links, jobs, start_idx)
+
+    return calc_relative_arrays(model, links, motion, fnos, limit_links, start_idx)
+
+
+# 複数フレーム分の相対位置 (フレーム数, リンク数, 3) と相対回転(w, x, y, z) (フレーム数, リンク数, 4)
+def calc_relative_arrays(model: PmxModel, links: BoneLinks, motion: VmdMotion, fnos: list, limit_links=None, start_idx=0):
+    trans_vs = np.zeros((len(fnos), links.size() - start_idx, 3), dtype=np.float64)
+    add_qs = np.zeros((len(fnos), links.size() - start_idx, 4), dtype=np.float64)
+
+    for fidx, fno in enumerate(fnos):
+        for n, (v, q) in enumerate(zip(calc_relative_position(model, links, motion, fno, limit_links, start_idx), \
+                                       calc_relative_rotation(model, links, motion, fno, limit_links, start_idx))):
+            trans_vs[fidx, n] = v.data()
+            add_qs[fidx, n] = q.data().components
+
+    return trans_vs, add_qs
+
+
+# フレーム分割時の1プロセスあたりの最小フレーム数(これより少ない場合はプロセスを分けない)
+FRAME_CHUNK_MIN_SIZE = 100
+
+# フレーム並列用のプロセスプール(frame_executor で開いている間だけ、プロセス数ごとに使い回す)
+FRAME_EXECUTORS = {}
+
+
+# フレーム並列用のプロセスプールを開き、with を抜けたら閉じる
+# 既に同じプロセス数のプールが開いている場合はそれを使う
+@contextmanager
+def frame_executor(jobs: int):
+    if jobs <= 1 or jobs in FRAME_EXECUTORS:
+        yield
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"), \
+                             initializer=initialize_process, initargs=(MLogger.langs, MLogger.mode, MLogger.total_level, MLogger.default_out_path)) as executor:
+        FRAME_EXECUTORS[jobs] = executor
+        try:
+            yield
+        finally:
+            del FRAME_EXECUTORS[jobs]
+
+
+def calc_relative_arrays_parallel(model: PmxModel, links: BoneLinks, motion: VmdMotion, fnos: list, limit_links=None, jobs=1, start_idx=0):
+    if jobs not in FRAME_EXECUTORS:
+        # プールが開かれていない場合、この呼び出しの間だけ開く
+        with frame_executor(jobs):
+            return calc_relative_arrays_parallel(model, links, motion, fnos, limit_links, jobs, start_idx)
+
+    # リンクと付与親のボーンだけを持つモーションを渡す
+    bone_names = []
+    for link_bone_name in links.all().keys():
+        if not limit_links or (limit_links and limit_links.get(link_bone_name)):
+            bone_names.append(link_bone_name)
+
+        bone_names.extend(get_effect_bone_names(model, link_bone_name))
+
+    link_motion = VmdMotion()
+    for bone_name in dict.fromkeys(bone_names):
+        if bone_name in motion.bones:
+            link_motion.bones[bone_name] = motion.bones[bone_name]
+        else:
+            # 元のモーションにないボーンは、渡す側のモーションにだけ空のキーを作る
+            link_motion.calc_bf(bone_name, fnos[0], is_key=False, is_read=False, is_reset_interpolation=False)
 
-    return global_3ds_dic, total_mats
+    chunk_fnos = [chunk.tolist() for chunk in np.array_split(np.array(fnos, dtype=np.int64), jobs)]
+    futures = [FRAME_EXECUTORS[jobs].submit(calc_relative_arrays, model, links, link_motion, now_fnos, limit_links, start_idx) for now_fnos in chunk_fnos]
+    results = [future.result() for future in futures]
+
+    return np.concatenate([trans_vs for trans_vs, _ in results]), np.concatenate([add_qs for _, add_qs in results])
+
+
+# 相対位置・相対回転(w, x, y, z)の配列から、リンク全体のグローバル位置と行列を求める
+def calc_global_matrixs(trans_vs: np.ndarray, add_qs: np.ndarray, local_x_mats=None):
+    # 各リンクの行列(移動 * 回転)
+    matrixs = quaternion_to_matrixs(add_qs)
+    matrixs[..., :3, 3] = trans_vs
+
+    # 自分より前の行列結果の累積(0番目は単位行列)
+    prev_mats = np.zeros(matrixs.shape, dtype=np.float64)
+    prev_mats[:, 0] = np.eye(4, dtype=np.float64)
+    if matrixs.shape[1] > 1:
+        prev_mats[:, 1] = matrixs[:, 0]
+    for n in range(2, matrixs.shape[1]):
+        prev_mats[:, n] = prev_mats[:, n - 1] @ matrixs[:, n - 1]
+
+    # 自分は、位置だけ掛ける
+    global_3ds = np.einsum('fnij,fnj->fni', prev_mats[..., :3, :3], trans_vs) + prev_mats[..., :3, 3]
+
+    # 最後の行列をかけ算する
+    total_mats = prev_mats @ matrixs
+
+    if local_x_mats is not None:
+        # ローカル軸の向きを調整する
+        total_mats[:, 1:] = total_mats[:, 1:] @ local_x_mats[1:]
+
+    return global_3ds, total_mats
+
+
+# 足FKの姿勢から、全フレーム分の足ＩＫの位置と回転を求める(FK→IK変換)
+# 足ＩＫの位置は足首のグローバル位置、回転は足首から見たつま先の向きで決まるので、IKの反復計算(calc_IK)はせず、
+# 足ＩＫ以外のリンクの値を一度だけ取得して、足ＩＫの分だけ差し替えながら配列でまとめて求める
+# 戻り値: 足ＩＫの位置 (フレーム数, 3), 足ＩＫの回転(w, x, y, z) (フレーム数, 4)
+def calc_leg_fk2ik_range(model: PmxModel, motion: VmdMotion, fnos: list, direction: str, jobs=1):
+    leg_ik_bone_name = "{0}足ＩＫ".format(direction)
+    toe_ik_bone_name = "{0}つま先ＩＫ".format(direction)
+    ankle_bone_name = "{0}足首".format(direction)
+    toe_bone_name = "{0}つま先".format(direction)
+    heel_bone_name = "{0}かかと".format(direction)
+
+    # 足FK末端までのリンク
+    fk_links = model.create_link_2_top_one(heel_bone_name, is_defined=False)
+    # つま先IK末端までのリンク(足ＩＫとその親を含む)
+    toe_ik_links = model.create_link_2_top_one(toe_ik_bone_name, is_defined=False)
+    # つま先（足首の子ボーン）の名前
+    ankle_child_bone_name = model.bone_indexes[model.bones[toe_ik_bone_name].ik.target_index]
+    # つま先末端までのリンク
+    toe_fk_links = model.create_link_2_top_one(ankle_child_bone_name, is_defined=False)
+
+    # リンク内のINDEX
+    fk_link_idxs = {lname: n for n, lname in enumerate(fk_links.all().keys())}
+    toe_ik_link_idxs = {lname: n for n, lname in enumerate(toe_ik_links.all().keys())}
+    toe_fk_link_idxs = {lname: n for n, lname in enumerate(toe_fk_links.all().keys())}
+    ik_idx = toe_ik_link_idxs[leg_ik_bone_name]
+    toe_ik_idx = toe_ik_link_idxs[toe_ik_bone_name]
+    ik_parent_bone = toe_ik_links.get(leg_ik_bone_name, offset=-1)
+
+    # FKのグローバル位置は足ＩＫの影響を受けない
+    leg_fk_3ds, _ = calc_global_pos_range(model, fk_links, motion, fnos, jobs=jobs)
+    # 足首の角度がある状態での、つま先までのグローバル位置
+    leg_toe_fk_3ds, _ = calc_global_pos_range(model, toe_fk_links, motion, fnos, jobs=jobs)
+
+    # 足ＩＫ以外の相対位置・回転
+    trans_vs, add_qs = calc_relative_arrays_range(model, toe_ik_links, motion, fnos, jobs=jobs)
+    _, total_mats = calc_global_matrixs(trans_vs, add_qs)
+
+    # 足ＩＫの位置は、足ＩＫの親から見た足首のローカル位置（足首位置マイナス）
+    ik_parent_inverted_mats = np.linalg.inv(total_mats[:, ik_idx - 1])
+    positions = transform_vectors(ik_parent_inverted_mats, leg_fk_3ds[:, fk_link_idxs[ankle_bone_name]] \
+                                  - (model.bones[ankle_bone_name].position - ik_parent_bone.position).data())
+
+    # 足ＩＫ回転なし状態でのつま先までのグローバル位置
+    ik_relative_pos = (model.bones[leg_ik_bone_name].position - ik_parent_bone.position).data()
+    trans_vs[:, ik_idx] = ik_relative_pos + positions
+    add_qs[:, ik_idx] = [1, 0, 0, 0]
+    leg_ik_3ds, leg_ik_mats = calc_global_matrixs(trans_vs, add_qs)
+
+    # 足ＩＫの回転は、足首から見たつま先の方向
+    leg_ik_inverted_mats = np.linalg.inv(leg_ik_mats[:, ik_idx])
+    ankle_child_initial_local_poses = transform_vectors(leg_ik_inverted_mats, leg_ik_3ds[:, toe_ik_idx])
+    ankle_child_local_poses = transform_vectors(leg_ik_inverted_mats, leg_toe_fk_3ds[:, toe_fk_link_idxs[ankle_child_bone_name]])
+    rotations = rotation_to_array(ankle_child_initial_local_poses, ankle_child_local_poses)
+
+    # かかとからつま先の向きが大体水平なら接地
+    toe_vecs = leg_fk_3ds[:, fk_link_idxs[toe_bone_name]]
+    heel_vecs = leg_fk_3ds[:, fk_link_idxs[heel_bone_name]]
+    foot_vecs = normalize_vectors(toe_vecs - heel_vecs)
+    diff_ys = np.maximum(0, np.minimum(toe_vecs[:, 1], heel_vecs[:, 1]))
+    positions[:, 1] = np.where(np.abs(foot_vecs[:, 1]) < 0.2, np.maximum(0, positions[:, 1] - diff_ys), positions[:, 1])
+
+    # つま先が地面にめり込んでたら上げる
+    trans_vs[:, ik_idx] = ik_relative_pos + positions
+    add_qs[:, ik_idx] = rotations
+    leg_ik_3ds, _ = calc_global_matrixs(trans_vs, add_qs)
+    toe_ik_ys = leg_ik_3ds[:, toe_ik_idx, 1]
+    positions[:, 1] = np.where(toe_ik_ys < 0, np.maximum(0, positions[:, 1] - toe_ik_ys), positions[:, 1])
+
+    return positions, rotations
+
+
+# 行列の配列 (..., 4, 4) で位置の配列 (..., 3) を変換する
+def transform_vectors(mats: np.ndarray, vs: np.ndarray):
+    return np.einsum('...ij,...j->...i', mats[..., :3, :3], vs) + mats[..., :3, 3]
+
+
+# 位置の配列を正規化する(長さ0はそのまま)
+def normalize_vectors(vs: np.ndarray):
+    lengths = np.linalg.norm(vs, axis=-1, keepdims=True)
+    return vs / np.where(lengths == 0, 1, lengths)
+
+
+# fromvs から tovs への回転(w, x, y, z)の配列 (MQuaternion.rotationTo と同じ)
+def rotation_to_array(fromvs: np.ndarray, tovs: np.ndarray):
+    v0s = normalize_vectors(fromvs)
+    v1s = normalize_vectors(tovs)
+    ds = np.sum(v0s * v1s, axis=-1) + 1.0
+
+    qs = np.zeros(ds.shape + (4,), dtype=np.float64)
+
+    # 逆向きの場合、回転軸はどれでもよいので180度回転
+    is_inverse = np.abs(ds) < 0.0000001
+    axises = np.cross([1.0, 0.0, 0.0], v0s)
+    axises = np.where((np.sum(axises * axises, axis=-1, keepdims=True) < 0.0000001), np.cross([0.0, 1.0, 0.0], v0s), axises)
+    inverse_qs = np.concatenate([np.zeros(ds.shape + (1,)), normalize_vectors(axises)], axis=-1)
+
+    ds = np.sqrt(2.0 * np.where(is_inverse, 1, ds))
+    qs[..., 0] = ds * 0.5
+    qs[..., 1:] = np.cross(v0s, v1s) / ds[..., np.newaxis]
+
+    qs = np.where(is_inverse[..., np.newaxis], inverse_qs, qs)
+    return qs / np.linalg.norm(qs, axis=-1, keepdims=True)
+
+
+# 回転(w, x, y, z)の配列を回転行列の配列に変換する(MQuaternion.toMatrix4x4 と同じ)
+def quaternion_to_matrixs(qs: np.ndarray):
+    w = qs[..., 0]
+    x = qs[..., 1]
+    y = qs[..., 2]
+    z = qs[..., 3]
+
+    m = np.zeros(qs.shape[:-1] + (4, 4), dtype=np.float64)
+
+    m[..., 0, 0] = w * w + x * x - y * y - z * z
+    m[..., 0, 1] = 2.0 * x * y - 2.0 * w * z
+    m[..., 0, 2] = 2.0 * x * z + 2.0 * w * y
+
+    m[..., 1, 0] = 2.0 * x * y + 2.0 * w * z
+    m[..., 1, 1] = w * w - x * x + y * y - z * z
+    m[..., 1, 2] = 2.0 * y * z - 2.0 * w * x
+
+    m[..., 2, 0] = 2.0 * x * z - 2.0 * w * y
+    m[..., 2, 1] = 2.0 * y * z + 2.0 * w * x
+    m[..., 2, 2] = w * w - x * x - y * y + z * z
+
+    m[..., 3, 3] = w * w + x * x + y * y + z * z
+
+    m /= m[..., 3:, 3:]
+    m[..., 3, 3] = 1.0
+
+    return m
+
+
+# リンクごとのローカル軸の向きの行列 (リンク数, 4, 4)
+def calc_local_x_matrixs(model: PmxModel, links: BoneLinks):
+    local_x_mats = np.tile(np.eye(4, dtype=np.float64), (links.size(), 1, 1))
+
+    for n, lname in enumerate(links.all().keys()):
+        if n == 0:
+            continue
+
+        # ボーン自身にローカル軸が設定されているか
+        if model.bones[lname].local_x_vector == MVector3D():
+            # ローカル軸が設定されていない場合、計算
+
+            # 自身から親を引いた軸の向き
+            local_axis = model.bones[lname].position - links.get(lname, offset=-1).position
+            local_axis_qq = MQuaternion.fromDirection(local_axis.normalized(), MVector3D(0, 0, 1))
+        else:
+            # ローカル軸が設定されている場合、その値を採用
+            local_axis_qq = MQuaternion.fromDirection(model.bones[lname].local_x_vector.normalized(), MVector3D(0, 0, 1))
+
+        local_x_mats[n] = local_axis_qq.toMatrix4x4().data()
+
+    return local_x_mats
 
 
 # 指定された方向に向いた場合の位置情報を返す
@@ -306,10 +598,13 @@ def calc_global_pos_by_direction(direction_qq: MQuaternion, target_pos_3ds_dic:
 
 
 # 各ボーンの相対位置情報
-def calc_relative_position(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, limit_links=None):
+def calc_relative_position(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, limit_links=None, start_idx=0):
     trans_vs = []
 
     for link_idx, link_bone_name in enumerate(links.all()):
+        if link_idx < start_idx:
+            continue
+
         link_bone = links.get(link_bone_name)
 
         if not limit_links or (limit_links and limit_links.get(link_bone_name)):
@@ -332,10 +627,13 @@ def calc_relative_position(model: PmxModel, links: BoneLinks, motion: VmdMotion,
 
 
 # 各ボーンの相対回転情報
-def calc_relative_rotation(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, limit_links=None):
+def calc_relative_rotation(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, limit_links=None, start_idx=0):
     add_qs = []
 
     for link_idx, link_bone_name in enumerate(links.all()):
+        if link_idx < start_idx:
+            continue
+
         link_bone = links.get(link_bone_name)
 
         if not limit_links or (limit_links and limit_links.get(link_bone_name)):
@@ -471,3 +769,22 @@ def sort_by_numeric(value):
     return parts
 
 
+
+
+# 人物ごとの処理を実行する
+# jobs が2以上の場合、人物ごとに別プロセスで並列実行する(結果は人物の順番のまま返す)
+# func: モジュール直下の関数, person_args: 人物ごとの引数タプルのリスト
+def execute_by_person(jobs: int, func, person_args: list):
+    if jobs <= 1 or len(person_args) <= 1:
+        return [func(*person_arg) for person_arg in person_args]
+
+    # CUDAを使う処理もあるので、forkではなくspawnでプロセスを作る
+    with ProcessPoolExecutor(max_workers=min(jobs, len(person_args)), mp_context=multiprocessing.get_context("spawn"), \
+                             initializer=initialize_process, initargs=(MLogger.langs, MLogger.mode, MLogger.total_level, MLogger.default_out_path)) as executor:
+        futures = [executor.submit(func, *person_arg) for person_arg in person_args]
+        return [future.result() for future in futures]
+
+
+# 別プロセスのロガーを親プロセスと同じ設定にする
+def initialize_process(langs: list, mode: int, level: int, out_path: str):
+    MLogger.initialize(langs=langs, mode=mode, level=level, out_path=out_path)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import re
+import glob
+import json
+import warnings
+
+import cv2
+import numpy as np
+from PIL import Image
+from skimage import img_as_ubyte
+
+from mmd.utils.MLogger import MLogger
+from mmd.utils.MServiceUtils import sort_by_numeric
+
+logger = MLogger(__name__)
+
+# フレーム対応表ファイル名
+FRAME_MANIFEST_FILE_NAME = "frames.json"
+
+# リサイズ済み画像の出力先(処理用ディレクトリからの相対パス)
+RESIZE_IMG_PATH = os.path.join("resize", "resize_{0:012}.png")
+
+# 前方スキップでシークする閾値(これ以上離れていたらシークする)
+SEEK_THRESHOLD = 90
+
+
+# 動画から30fpsで再サンプリングしたフレームを逐次読み込むフレームソース
+class VideoFrameSource:
+
+    def __init__(self, video_file: str, width: int):
+        self.video_file = video_file
+        self.width = width
+
+        video = cv2.VideoCapture(video_file)
+        # 元動画の幅
+        self.W = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+        # 元動画の高さ
+        self.H = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # 総フレーム数
+        self.count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        # fps
+        self.fps = video.get(cv2.CAP_PROP_FPS)
+        video.release()
+
+        # 縮尺
+        self.scale = width / self.W
+        # 縮尺後の高さ
+        self.height = int(self.H * self.scale)
+
+        # 元のフレームを30fpsで計算し直した場合の1Fごとの該当フレーム数
+        self.interpolations = np.arange(0, self.count + 1, self.fps / 30)
+        # 30fpsのフレーム番号から元動画のフレーム番号への対応
+        self.source_fnos = np.minimum(np.round(self.interpolations).astype(np.int64), max(0, self.count - 1))
+
+        self.__cap = None
+        # 最後に読み込んだ元動画のフレーム番号と画像
+        self.__cap_fno = -1
+        self.__frame_fno = -1
+        self.__frame = None
+
+    def __len__(self):
+        return len(self.source_fnos)
+
+    # DataLoaderのworkerに渡す時、VideoCaptureは持ち越さない
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_VideoFrameSource__cap"] = None
+        state["_VideoFrameSource__cap_fno"] = -1
+        state["_VideoFrameSource__frame_fno"] = -1
+        state["_VideoFrameSource__frame"] = None
+        return state
+
+    # 先頭から順番に (30fpsのフレーム番号, 画像(BGR)) を返す
+    def __iter__(self):
+        for fno in range(len(self)):
+            yield fno, self.read(fno)
+
+    # 30fpsのフレーム番号に該当する画像(BGR)を返す
+    def read(self, fno: int):
+        return self.read_source(int(self.source_fnos[fno]))
+
+    # 元動画のフレーム番号に該当する画像(BGR)を返す
+    def read_source(self, source_fno: int):
+        if source_fno == self.__frame_fno and self.__frame is not None:
+            # 同じ元フレームは読み直さない
+            return self.__frame
+
+        if self.__cap is None or source_fno <= self.__cap_fno or source_fno - self.__cap_fno > SEEK_THRESHOLD:
+            # 初回・巻き戻し・大きく飛ぶ場合はシーク
+            if self.__cap is None:
+                self.__cap = cv2.VideoCapture(self.video_file)
+            self.__cap.set(cv2.CAP_PROP_POS_FRAMES, source_fno)
+            self.__cap_fno = source_fno - 1
+
+        # 該当フレームの手前まではデコードせずに読み飛ばす
+        while self.__cap_fno < source_fno - 1:
+            if not self.__cap.grab():
+                break
+            self.__cap_fno += 1
+
+        flag, img = self.__cap.read()
+        if flag:
+            self.__cap_fno += 1
+            self.__frame = self.resize(img)
+            self.__frame_fno = source_fno
+        elif self.__frame is None:
+            # 最終フレームとかで読めない場合、ひとつ手前
+            self.__cap.set(cv2.CAP_PROP_POS_FRAMES, max(0, source_fno - 1))
+            flag, img = self.__cap.read()
+            self.__cap_fno = max(0, source_fno - 1)
+            self.__frame = self.resize(img) if flag else np.zeros((self.height, self.width, 3), dtype=np.uint8)
+            self.__frame_fno = source_fno
+
+        return self.__frame
+
+    # 画像の縦横を指定サイズに変形
+    def resize(self, img):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return resize_frame(img, self.width, self.height)
+
+    def release(self):
+        if self.__cap is not None:
+            self.__cap.release()
+        self.__cap = None
+        self.__cap_fno = -1
+
+
+# 30fpsのフレーム番号から元フレームへの対応表
+# 重複フレームは画像を複製せず、同じ元フレームを参照する
+class FrameManifest:
+
+    def __init__(self, process_img_dir: str, source_fnos, resize_img_path=RESIZE_IMG_PATH, frame_source=None):
+        self.process_img_dir = process_img_dir
+        self.source_fnos = np.asarray(source_fnos, dtype=np.int64)
+        # 元フレーム番号ごとの30fpsのフレーム番号リスト
+        self.source_fno_dic = {}
+        for fno, source_fno in enumerate(self.source_fnos.tolist()):
+            self.source_fno_dic.setdefault(source_fno, []).append(fno)
+        # PNG出力済みの場合、元フレームの画像パス(処理用ディレクトリからの相対パス)
+        self.resize_img_path = resize_img_path
+        # PNG未出力の場合、動画から読み込む
+        self.frame_source = frame_source
+
+        # 最後に読み込んだ元フレームの番号と画像
+        self.__frame_fno = -1
+        self.__frame = None
+
+    def __len__(self):
+        return len(self.source_fnos)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_FrameManifest__frame_fno"] = -1
+        state["_FrameManifest__frame"] = None
+        return state
+
+    # 30fpsのフレーム番号に該当する元フレーム番号
+    def source_fno(self, fno: int):
+        return int(self.source_fnos[fno])
+
+    # 元フレームごとに最初に参照する30fpsのフレーム番号リスト(重複フレームを除く)
+    def unique_fnos(self):
+        _, fnos = np.unique(self.source_fnos, return_index=True)
+        return sorted(fnos.tolist())
+
+    # 指定フレームと同じ元フレームを参照する30fpsのフレーム番号リスト(指定フレーム含む)
+    def same_source_fnos(self, fno: int):
+        return list(self.source_fno_dic[int(self.source_fnos[fno])])
+
+    # 30fpsのフレーム番号に該当する画像(BGR)を返す
+    def read(self, fno: int):
+        source_fno = self.source_fno(fno)
+
+        if self.frame_source is not None:
+            return self.frame_source.read_source(source_fno)
+
+        if source_fno != self.__frame_fno or self.__frame is None:
+            # 同じ元フレームは読み直さない
+            self.__frame = cv2.imread(os.path.join(self.process_img_dir, self.resize_img_path.format(source_fno)))
+            self.__frame_fno = source_fno
+
+        return self.__frame
+
+    # expose.utils.img_utils.read_img と同じ形式で画像を返す
+    def read_img(self, img_fn: str, dtype=np.float32):
+        idx_dir = os.path.basename(os.path.dirname(img_fn))
+        img = cv2.cvtColor(self.read(int(idx_dir)), cv2.COLOR_BGR2RGB)
+        if dtype == np.float32:
+            img = img.astype(dtype) / 255.0
+        return img, idx_dir
+
+    # 30fpsのフレーム番号に該当する画像パス(仮想パス)
+    def frame_path(self, fno: int):
+        return os.path.join(self.process_img_dir, "frames", f"{fno:012}", f"frame_{fno:012}.png")
+
+    def frame_pathes(self):
+        return [self.frame_path(fno) for fno in range(len(self))]
+
+    # 対応表を処理用ディレクトリに保存
+    def save(self):
+        manifest = {"source_fnos": self.source_fnos.tolist()}
+        if self.frame_source is not None:
+            manifest["video"] = {"video_file": os.path.abspath(self.frame_source.video_file), "width": self.frame_source.width, \
+                                 "height": self.frame_source.height, "fps": self.frame_source.fps, "count": self.frame_source.count}
+        else:
+            manifest["resize_img_path"] = self.resize_img_path
+
+        with open(os.path.join(self.process_img_dir, FRAME_MANIFEST_FILE_NAME), 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    # 処理用ディレクトリに保存された対応表から読み込む
+    @classmethod
+    def load(cls, process_img_dir: str):
+        manifest_path = os.path.join(process_img_dir, FRAME_MANIFEST_FILE_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        if "video" in manifest:
+            video_info = manifest["video"]
+            if not os.path.exists(video_info["video_file"]):
+                logger.warning("元動画が見つかりません。: {0}", video_info["video_file"])
+                return None
+
+            frame_source = VideoFrameSource(video_info["video_file"], int(video_info["width"]))
+            return cls(process_img_dir, manifest["source_fnos"], frame_source=frame_source)
+
+        return cls(process_img_dir, manifest["source_fnos"], resize_img_path=manifest["resize_img_path"])
+
+
+# 画像の縦横を指定サイズに変形し、opencv用に変換する
+# warnings.catch_warnings はスレッドセーフではないので、警告の抑制は呼び出し元(メインスレッド)で行う
+def resize_frame(img, width: int, height: int):
+    try:
+        # 画像に再変換
+        img = Image.fromarray(img)
+
+        # 画像の縦横を指定サイズに変形
+        img = img.resize((width, height), Image.ANTIALIAS)
+    except Exception as e:
+        # エラーするようなら無視
+        logger.error(e)
+
+    # opencv用に変換
+    return img_as_ubyte(img)
+
+
+# 処理用ディレクトリのフレーム画像パスリスト
+def get_frame_pathes(process_img_dir: str):
+    process_img_pathes = sorted(glob.glob(os.path.join(process_img_dir, "frames", "**", "frame_*.png")), key=sort_by_numeric)
+    if len(process_img_pathes) > 0:
+        return process_img_pathes
+
+    # PNGが複製されていない場合、対応表から読み込む仮想パス
+    frame_source = get_frame_source(process_img_dir)
+    if frame_source:
+        return frame_source.frame_pathes()
+
+    return []
+
+
+__frame_sources = {}
+
+
+# 処理用ディレクトリのフレーム対応表(フレームごとのPNGがない場合のみ)
+def get_frame_source(process_img_dir: str):
+    process_img_dir = os.path.abspath(process_img_dir)
+    if process_img_dir not in __frame_sources:
+        __frame_sources[process_img_dir] = FrameManifest.load(process_img_dir)
+    return __frame_sources[process_img_dir]
+
+
+frame_path_pattern = re.compile(r'^(.*)[\\/]frames[\\/](\d+)[\\/]frame_\d+\.png$')
+
+
+# フレーム画像(BGR)を読み込む。PNGがない場合は対応表から読み込む
+def read_frame(img_path: str):
+    if os.path.exists(img_path):
+        return cv2.imread(img_path)
+
+    m = frame_path_pattern.match(img_path)
+    if m:
+        frame_source = get_frame_source(m.groups()[0])
+        if frame_source:
+            return frame_source.read(int(m.groups()[1]))
+
+    return None
+
+
+# フレーム画像が読み込めるか
+def exists_frame(img_path: str):
+    if os.path.exists(img_path):
+        return True
+
+    m = frame_path_pattern.match(img_path)
+    return m is not None and get_frame_source(m.groups()[0]) is not None